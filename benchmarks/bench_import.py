@@ -0,0 +1,88 @@
+"""Import time benchmark
+
+Run from the repository root:
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --max-ms 150
+
+Imports yamlsettings in fresh interpreters with ``python -X importtime``,
+and reports the best cumulative import time of yamlsettings and of its
+slowest modules. --max-ms exits with status 1 when the import is slower, so
+CI can catch modules that start doing work at import time again (e.g.
+extension discovery).
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+def parse(output):
+    """Parse -X importtime output
+
+    :returns: dict of module name to (self, cumulative) microseconds
+
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            # The header line
+            continue
+        times[fields[2].strip()] = (own, cumulative)
+    return times
+
+
+def measure(module='yamlsettings', repeat=5):
+    """Import module in repeat fresh interpreters
+
+    :returns: the best (self, cumulative) microseconds of every module
+
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    best = {}
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import {0}'.format(module)],
+            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, env=env,
+            universal_newlines=True, check=True,
+        )
+        for name, times in parse(result.stderr).items():
+            if name not in best or times[1] < best[name][1]:
+                best[name] = times
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--module', default='yamlsettings')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10,
+                        help='slowest modules of the package to show')
+    parser.add_argument('--max-ms', type=float,
+                        help='fail when the import takes longer')
+    args = parser.parse_args(argv)
+
+    best = measure(args.module, args.repeat)
+    total = best[args.module][1] / 1e3
+    package = [(times[0], name) for name, times in best.items()
+               if name.split('.')[0] == args.module]
+    for own, name in sorted(package, reverse=True)[:args.top]:
+        print('{0:<40} {1:>9.3f} ms self'.format(name, own / 1e3))
+    print('{0:<40} {1:>9.3f} ms cumulative'.format(args.module, total))
+    if args.max_ms is not None and total > args.max_ms:
+        print('slower than {0} ms'.format(args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
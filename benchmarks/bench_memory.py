@@ -0,0 +1,100 @@
+"""YAMLDict memory benchmark
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory
+
+Compares tracemalloc peaks of a tree of small maps built from YAMLDict
+against the same tree built from an OrderedDict subclass, which is how
+YAMLDict used to be stored.
+
+Loaded documents report the memory they keep: eager, lazy with nothing
+read yet (the pending nodes), and lazy with all keys but one read.
+
+"""
+from __future__ import print_function
+
+import collections
+import gc
+import tracemalloc
+
+from yamlsettings import yamldict
+
+
+class OrderedYAMLDict(collections.OrderedDict):
+    """Previous OrderedDict based representation"""
+
+
+def build(mapping_type, count, keys=3):
+    """Mapping of count small maps, each with keys scalar values"""
+    root = mapping_type()
+    for i in range(count):
+        node = mapping_type()
+        for k in range(keys):
+            node['key_{0}'.format(k)] = k
+        root['route_{0}'.format(i)] = node
+    return root
+
+
+def peak(func, *args):
+    """Peak bytes allocated while func runs, the result is kept alive"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak_bytes
+
+
+def kept(func, *args):
+    """Bytes still allocated by the result of func"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        gc.collect()
+        kept_bytes, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return kept_bytes
+
+
+def lazy_load(source):
+    return yamldict.load(source, lazy=True)
+
+
+def lazy_read(source):
+    """Lazy load with every key but the first one read"""
+    data = lazy_load(source)
+    for key in list(data.keys())[1:]:
+        data[key].values()
+    return data
+
+
+def report(name, count, peak_bytes):
+    print('{0:<28} {1:>8} {2:>10.1f} MiB {3:>8.0f} B/map'.format(
+        name, count, peak_bytes / 1048576.0, peak_bytes / float(count)))
+
+
+def main():
+    print('{0:<28} {1:>8} {2:>14} {3:>10}'.format(
+        'benchmark', 'maps', 'peak', 'per map'))
+    for count in (10000, 100000, 300000):
+        report('OrderedDict tree', count,
+               peak(build, OrderedYAMLDict, count))
+        report('YAMLDict tree', count,
+               peak(build, yamldict.YAMLDict, count))
+
+    source = yamldict.dump(build(yamldict.YAMLDict, 100000))
+    report('YAMLDict load', 100000, peak(yamldict.load, source))
+    report('YAMLDict load, kept', 100000, kept(yamldict.load, source))
+    report('lazy load, kept', 100000, kept(lazy_load, source))
+    report('lazy all but one, kept', 100000, kept(lazy_read, source))
+
+
+if __name__ == '__main__':
+    main()
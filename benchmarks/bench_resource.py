@@ -0,0 +1,116 @@
+"""Package resource reading benchmark
+
+Run from the repository root:
+
+    python -m benchmarks.bench_resource
+    python -m benchmarks.bench_resource --size-mb 10
+
+Loads a large settings.yaml resource from a package installed as a
+directory and from a zipped one, reading it whole with pkgutil.get_data
+(how PackageExtension used to) and through PackageExtension, which maps or
+streams it. Reports the best time and the tracemalloc peak of each. The
+resource is a real settings tree padded with comments up to the size, so
+the time goes to reading the resource rather than building the tree.
+
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import pkgutil
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from yamlsettings import yamldict
+from yamlsettings.extensions.package import PackageExtension
+from yamlsettings.extensions.registry import ExtensionRegistry
+
+from benchmarks import generators
+
+PACKAGE = 'yamlsettings_bench_resource'
+ZIPPED = 'yamlsettings_bench_resource_zip'
+
+
+def write_resource(path, size):
+    """Write a settings resource of about size bytes"""
+    line = '# ' + 'padding ' * 9 + '\n'
+    with open(path, 'w') as stream:
+        stream.write(generators.dump(generators.wide(1000)))
+        written = stream.tell()
+        stream.write(line * max((size - written) // len(line), 0))
+
+
+def install(directory, size):
+    """Install both packages under directory, on sys.path"""
+    package = os.path.join(directory, PACKAGE)
+    os.mkdir(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    resource = os.path.join(package, 'settings.yaml')
+    write_resource(resource, size)
+
+    archive = os.path.join(directory, 'packages.zip')
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zipped:
+        zipped.writestr(ZIPPED + '/__init__.py', '')
+        zipped.write(resource, ZIPPED + '/settings.yaml')
+    sys.path[:0] = [directory, archive]
+
+
+def peak(func):
+    """Peak bytes allocated while func runs"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak_bytes
+
+
+def best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size-mb', type=float, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    registry = ExtensionRegistry([PackageExtension])
+    directory = tempfile.mkdtemp()
+    try:
+        install(directory, int(args.size_mb * 1024 * 1024))
+        print('{0:<28} {1:>10} {2:>14}'.format('benchmark', 'time', 'peak'))
+        for label, package in (('directory', PACKAGE), ('zip', ZIPPED)):
+            cases = [
+                ('get_data', lambda: yamldict.load(
+                    pkgutil.get_data(package, 'settings.yaml'))),
+                ('PackageExtension', lambda: registry.load(
+                    'pkg://{0}?persist=false&env=false'.format(package))),
+            ]
+            for name, func in cases:
+                print('{0:<28} {1:>8.3f} s {2:>10.1f} MiB'.format(
+                    '{0} {1}'.format(label, name), best(func, args.repeat),
+                    peak(func) / 1048576.0))
+    finally:
+        for path in (directory, os.path.join(directory, 'packages.zip')):
+            if path in sys.path:
+                sys.path.remove(path)
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""YAMLDict construction, clone, rebase, diff, traverse, layered view,
+attribute and key path access benchmarks
+
+Run from the repository root:
+
+    python -m benchmarks.bench_yamldict
+
+Tree times are reported per node, so linear scaling shows up as a flat
+column. Attribute access is reported per lookup.
+
+"""
+from __future__ import print_function
+
+import timeit
+
+from yamlsettings.yamldict import (
+    SKIP,
+    LayeredYAMLDict,
+    YAMLDict,
+    compile_path,
+    diff,
+)
+
+
+def deep_tree(depth):
+    """Plain dict nested depth levels deep"""
+    tree = {'leaf': 0}
+    for i in range(depth):
+        tree = {'node': tree, 'value': i}
+    return tree
+
+
+def deep_yamldict(depth):
+    """YAMLDict built bottom-up, one level at a time"""
+    tree = YAMLDict({'leaf': 0})
+    for i in range(depth):
+        tree = YAMLDict({'node': tree, 'value': i})
+    return tree
+
+
+def wide_tree(width):
+    """Plain dict with width small maps"""
+    return {'key_{0}'.format(i): {'value': i} for i in range(width)}
+
+
+def best_of(func, repeat=5):
+    """Best wall time of func in seconds"""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, size, nodes, seconds):
+    print('{0:<24} {1:>8} {2:>12.3f} ms {3:>10.3f} us/node'.format(
+        name, size, seconds * 1e3, seconds * 1e6 / nodes))
+
+
+def run_shape(label, sizes, make_tree, count_nodes):
+    for size in sizes:
+        tree = make_tree(size)
+        nodes = count_nodes(size)
+        yaml_dict = YAMLDict(tree)
+        report(label + ' construct', size, nodes,
+               best_of(lambda: YAMLDict(tree)))
+        report(label + ' clone', size, nodes,
+               best_of(yaml_dict.clone))
+        report(label + ' rebase', size, nodes,
+               best_of(lambda: YAMLDict(tree).rebase(yaml_dict)))
+        if label == 'deep':
+            report(label + ' bottom-up', size, nodes,
+                   best_of(lambda: deep_yamldict(size)))
+
+
+def run_access(number=200000):
+    cfg = YAMLDict({'db': {'host': 'localhost', 'port': 5432}})
+    layered = LayeredYAMLDict([cfg, {'db': {'port': 5433}}])
+    lookups = [
+        ('key attribute', lambda: cfg.db),
+        ('nested attribute', lambda: cfg.db.host),
+        ('method attribute', lambda: cfg.items),
+        ('subscript', lambda: cfg['db']['host']),
+        ('layered attribute', lambda: layered.db.host),
+        ('missing attribute', lambda: getattr(cfg, 'missing', None)),
+    ]
+    services = YAMLDict({'services': {'billing': {
+        'endpoints': [{'timeout': i} for i in range(5)]}}})
+    path = 'services.billing.endpoints[3].timeout'
+    compiled = compile_path(path)
+    lookups += [
+        ('chained attribute path',
+         lambda: services.services.billing.endpoints[3].timeout),
+        ('get_path', lambda: services.get_path(path)),
+        ('compiled path', lambda: compiled.get(services)),
+    ]
+    for name, func in lookups:
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        print('{0:<24} {1:>12.1f} ns/lookup'.format(
+            name, seconds * 1e9 / number))
+
+
+def sections_tree(size, keys=10):
+    """Plain dict of size keys, in sections of keys keys"""
+    return {'section_{0}'.format(i): {'key_{0}'.format(j): j
+                                      for j in range(keys)}
+            for i in range(size // keys)}
+
+
+def run_diff(sizes=(10000, 100000)):
+    """Diff of two separately built trees with sections of 10 keys"""
+    for size in sizes:
+        sections = size // 10
+        old = YAMLDict(sections_tree(size))
+        new = old.clone()
+        report('diff unchanged', size, size, best_of(lambda: diff(old, new)))
+        new['section_0']['key_0'] = 'changed'
+        new['section_{0}'.format(sections - 1)]['extra'] = 1
+        report('diff 2 changes', size, size, best_of(lambda: diff(old, new)))
+        report('diff identical', size, size, best_of(lambda: diff(old, old)))
+
+
+def run_traverse(sizes=(50000, 500000)):
+    """traverse() and walk() over sections of 8 keys and a 2 item list"""
+    for size in sizes:
+        tree = YAMLDict({
+            'section_{0}'.format(i): dict(
+                {'key_{0}'.format(j): j for j in range(8)},
+                items=[{'name': i}, i])
+            for i in range(size // 13)})
+        nodes = sum(1 for _ in tree.walk())
+
+        def _noop(path, node):
+            return None
+
+        def _skip(path, node):
+            return SKIP if len(path) == 1 else None
+
+        report('traverse', size, nodes,
+               best_of(lambda: tree.traverse(_noop), repeat=3))
+        report('traverse tuple paths', size, nodes,
+               best_of(lambda: tree.traverse(_noop, tuple_paths=True),
+                       repeat=3))
+        report('traverse skip', size, nodes,
+               best_of(lambda: tree.traverse(_skip), repeat=3))
+        report('walk', size, nodes,
+               best_of(lambda: sum(1 for _ in tree.walk()), repeat=3))
+
+
+def run_layered(sizes=(10000, 100000)):
+    """Adding a runtime layer: merging every layer again, or pushing it on
+    a LayeredYAMLDict, then reading an overridden key"""
+    for size in sizes:
+        defaults = YAMLDict(sections_tree(size))
+        overrides = YAMLDict(sections_tree(size // 100))
+        runtime = YAMLDict({'section_0': {'key_0': 'runtime'}})
+
+        def merge():
+            merged = YAMLDict()
+            for layer in (defaults, overrides, runtime):
+                merged.update(layer)
+            return merged.section_0.key_0
+
+        def push():
+            view = LayeredYAMLDict([defaults, overrides])
+            view.push_layer(runtime)
+            return view.section_0.key_0
+
+        report('layers merge', size, size, best_of(merge))
+        report('layers push', size, size, best_of(push))
+
+
+def main():
+    print('{0:<24} {1:>8} {2:>15} {3:>18}'.format(
+        'benchmark', 'size', 'time', 'per node'))
+    run_shape('deep', (50, 100, 200, 400), deep_tree, lambda n: n + 1)
+    run_shape('wide', (25000, 50000, 100000), wide_tree, lambda n: n + 1)
+    run_diff()
+    run_traverse()
+    run_layered()
+    print()
+    run_access()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Synthetic settings for the benchmarks
+
+Each generator takes an approximate number of nodes (maps, lists and
+scalars) and returns plain python data, or YAML text for the shapes that
+only exist in YAML (anchors, multiple documents). The output only depends
+on the arguments, so runs can be compared.
+
+"""
+from __future__ import print_function
+
+from yamlsettings import yamldict
+
+
+def wide(size, keys=10):
+    """Flat sections of keys scalars each"""
+    return {'section_{0}'.format(i): {'key_{0}'.format(j): j
+                                      for j in range(keys)}
+            for i in range(max(size // (keys + 1), 1))}
+
+
+def deep(size, width=3):
+    """Chain of maps nested size // (width + 1) levels deep"""
+    tree = {'leaf': 0}
+    for i in range(max(size // (width + 1), 1)):
+        level = {'value_{0}'.format(j): i for j in range(width - 1)}
+        level['node'] = tree
+        tree = level
+    return tree
+
+
+def list_heavy(size, items=8):
+    """Sections holding lists of small maps and scalars"""
+    return {'service_{0}'.format(i): {
+        'hosts': ['host-{0}-{1}.example.com'.format(i, j)
+                  for j in range(items)],
+        'endpoints': [{'path': '/v{0}'.format(j), 'timeout': j}
+                      for j in range(items)],
+    } for i in range(max(size // (items * 4 + 4), 1))}
+
+
+def anchor_heavy(size, keys=8):
+    """YAML text of sections built from a few anchored bases with merge
+    keys and aliases"""
+    lines = ['bases:']
+    for b in range(4):
+        lines.append('  base_{0}: &base_{0}'.format(b))
+        lines.extend('    key_{0}: {1}'.format(k, b) for k in range(keys))
+    for i in range(max(size // (keys + 3), 1)):
+        lines.append('section_{0}:'.format(i))
+        lines.append('  <<: *base_{0}'.format(i % 4))
+        lines.append('  own: {0}'.format(i))
+        lines.append('  shared: *base_{0}'.format((i + 1) % 4))
+    return '\n'.join(lines) + '\n'
+
+
+def multi_document(size, documents=10):
+    """YAML text of documents wide trees"""
+    return dump_all([wide(size // documents) for _ in range(documents)])
+
+
+def overrides(tree, every=10):
+    """A tree overriding one key in every every-th section of tree"""
+    return {k: {next(iter(v)): 'override'}
+            for i, (k, v) in enumerate(tree.items())
+            if i % every == 0 and isinstance(v, dict) and v}
+
+
+def environ(tree, prefix='BENCH', every=10):
+    """Environment variables overriding one key in every every-th section
+    of tree, with a prefix"""
+    return {'{0}_{1}_{2}'.format(prefix, k, next(iter(v))).upper(): '1'
+            for i, (k, v) in enumerate(tree.items())
+            if i % every == 0 and isinstance(v, dict) and v}
+
+
+def dump(tree):
+    return yamldict.dump(yamldict.YAMLDict(tree), default_flow_style=False)
+
+
+def dump_all(trees):
+    return yamldict.dump_all([yamldict.YAMLDict(t) for t in trees],
+                             default_flow_style=False)
+
+
+SHAPES = {
+    'wide': wide,
+    'deep': deep,
+    'list_heavy': list_heavy,
+}
@@ -0,0 +1,169 @@
+"""Run the benchmark suite, save and compare the results
+
+Run from the repository root:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --json results.json
+    python -m benchmarks.run --compare baseline.json --threshold 1.25
+    python -m benchmarks.run parse. clone.wide
+
+Positional arguments select the benchmarks whose name starts with one of
+them. Results are saved as JSON:
+
+    {"format": 1, "machine": {...},
+     "results": {"parse.wide[10000]": {"name": "parse.wide", "size": 10000,
+                 "number": 2, "repeat": 5, "min": 0.051, "median": 0.052}}}
+
+with times in seconds per call. --compare exits with status 1 when a
+benchmark is slower than in the baseline by more than the threshold ratio,
+so CI can keep a baseline from the main branch and compare against it.
+
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+import yamlsettings
+from yamlsettings import yamldict
+
+from benchmarks.suite import BENCHMARKS
+
+FORMAT = 1
+
+
+def select(prefixes=None):
+    """Registered benchmarks whose name starts with one of prefixes"""
+    return [bench for bench in BENCHMARKS.values()
+            if not prefixes or bench.name.startswith(tuple(prefixes))]
+
+
+def measure(bench, repeat=5, number=None, min_time=0.2, size=None):
+    """Time bench, number calls per repeat (by default as many as take
+    min_time seconds)"""
+    with bench.setup(size) as func:
+        timer = timeit.Timer(func)
+        if number is None:
+            number, _ = timer.autorange()
+            number = max(1, int(number * min_time / 0.2))
+        times = [t / number for t in timer.repeat(repeat, number)]
+    return {
+        'name': bench.name,
+        'size': size or bench.size,
+        'number': number,
+        'repeat': repeat,
+        'min': min(times),
+        'median': statistics.median(times),
+    }
+
+
+def machine():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'libyaml': yamldict.HAS_LIBYAML,
+        'yamlsettings': yamlsettings.__version__,
+    }
+
+
+def run(benchmarks, repeat=5, number=None, min_time=0.2, size=None,
+        out=sys.stdout):
+    """Measure benchmarks, returns the results document"""
+    results = {}
+    if size is not None:
+        # Every size of a benchmark gives the same one
+        benchmarks = list({bench.name: bench for bench in benchmarks}
+                          .values())
+    for bench in benchmarks:
+        result = measure(bench, repeat=repeat, number=number,
+                         min_time=min_time, size=size)
+        key = '{0}[{1}]'.format(result['name'], result['size'])
+        results[key] = result
+        if out is not None:
+            print('{0:<40} {1:>12.3f} ms {2:>10.3f} us/node'.format(
+                key, result['min'] * 1e3,
+                result['min'] * 1e6 / result['size']), file=out)
+    return {'format': FORMAT, 'machine': machine(), 'results': results}
+
+
+def compare(document, baseline, threshold=1.25, out=sys.stdout):
+    """Compare the best times with baseline, returns the ids of the
+    benchmarks slower than threshold times the baseline"""
+    if baseline.get('format') != FORMAT:
+        raise ValueError('unsupported results format: {0}'.format(
+            baseline.get('format')))
+    regressions = []
+    current = document['results']
+    if out is not None:
+        print('{0:<40} {1:>12} {2:>12} {3:>7}'.format(
+            'benchmark', 'baseline', 'current', 'ratio'), file=out)
+    for key, result in sorted(current.items()):
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        ratio = result['min'] / base['min']
+        flag = ''
+        if ratio > threshold:
+            flag = 'slower'
+            regressions.append(key)
+        elif ratio < 1 / threshold:
+            flag = 'faster'
+        if out is not None:
+            print('{0:<40} {1:>9.3f} ms {2:>9.3f} ms {3:>7.2f} {4}'.format(
+                key, base['min'] * 1e3, result['min'] * 1e3, ratio, flag),
+                file=out)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('prefixes', nargs='*',
+                        help='only run benchmarks starting with these')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='compare with the results in this file')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio failing --compare '
+                             '(default: 1.25)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int,
+                        help='calls per repeat (default: automatic)')
+    parser.add_argument('--size', type=int,
+                        help='run every benchmark at this size')
+    parser.add_argument('--list', action='store_true',
+                        help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    benchmarks = select(args.prefixes)
+    if args.list:
+        for bench in benchmarks:
+            print(bench.id)
+        return 0
+
+    document = run(benchmarks, repeat=args.repeat, number=args.number,
+                   size=args.size)
+    if args.json:
+        directory = os.path.dirname(args.json)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.json, 'w') as stream:
+            json.dump(document, stream, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = json.load(stream)
+        print()
+        if compare(document, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
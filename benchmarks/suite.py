@@ -0,0 +1,218 @@
+"""Benchmark cases run by benchmarks.run
+
+A case is a generator function taking a size: it prepares its data, yields
+the function to time, then cleans up. Cases are registered with the
+benchmark decorator under a dotted name, once per shape when given shapes.
+
+"""
+from __future__ import print_function
+
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+
+import yamlsettings
+from yamlsettings import yamldict
+from yamlsettings.extensions.local import LocalExtension
+from yamlsettings.extensions.package import PackageExtension
+from yamlsettings.extensions.registry import ExtensionRegistry
+
+from benchmarks import generators
+
+BENCHMARKS = {}
+
+TREE_SHAPES = ('wide', 'deep', 'list_heavy')
+# The representer and pure-Python parser recurse per level
+DEEP_SIZES = (400, 1600)
+SIZES = (10000, 100000)
+
+
+class Benchmark(object):
+    """A registered case at one size"""
+
+    def __init__(self, name, size, case, args):
+        self.name = name
+        self.size = size
+        self.case = case
+        self.args = args
+
+    @property
+    def id(self):
+        return '{0}[{1}]'.format(self.name, self.size)
+
+    def setup(self, size=None):
+        """Context manager preparing the case, gives the function to time
+        """
+        return contextlib.contextmanager(self.case)(
+            *self.args + (size or self.size,))
+
+
+def benchmark(name, sizes=SIZES, shapes=None):
+    """Register a case as name, or name.shape for each shape (the case then
+    takes the shape as its first argument)."""
+    def _register(case):
+        for shape in shapes or (None,):
+            full_name = name if shape is None else '{0}.{1}'.format(name,
+                                                                    shape)
+            args = () if shape is None else (shape,)
+            for size in (DEEP_SIZES if shape == 'deep' else sizes):
+                bench = Benchmark(full_name, size, case, args)
+                BENCHMARKS[bench.id] = bench
+        return case
+    return _register
+
+
+def _settings(shape, size):
+    return yamldict.YAMLDict(generators.SHAPES[shape](size))
+
+
+@benchmark('parse', shapes=TREE_SHAPES)
+def parse(shape, size):
+    text = generators.dump(generators.SHAPES[shape](size))
+    yield lambda: yamldict.load(text)
+
+
+@benchmark('parse.lazy', shapes=('wide',))
+def parse_lazy(shape, size):
+    text = generators.dump(generators.SHAPES[shape](size))
+    yield lambda: yamldict.load(text, lazy=True)
+
+
+@benchmark('parse.anchor_heavy')
+def parse_anchors(size):
+    text = generators.anchor_heavy(size)
+    yield lambda: yamldict.load(text)
+
+
+@benchmark('parse.multi_document')
+def parse_documents(size):
+    text = generators.multi_document(size)
+    yield lambda: list(yamldict.load_all(text))
+
+
+@benchmark('construct', shapes=TREE_SHAPES)
+def construct(shape, size):
+    tree = generators.SHAPES[shape](size)
+    yield lambda: yamldict.YAMLDict(tree)
+
+
+@benchmark('update', shapes=('wide', 'list_heavy'))
+def update(shape, size):
+    settings = _settings(shape, size)
+    override = yamldict.YAMLDict(generators.overrides(settings))
+    yield lambda: settings.update(override)
+
+
+@benchmark('clone', shapes=TREE_SHAPES)
+def clone(shape, size):
+    settings = _settings(shape, size)
+    yield settings.clone
+
+
+@benchmark('rebase', shapes=('wide', 'list_heavy'))
+def rebase(shape, size):
+    settings = _settings(shape, size)
+    override = generators.overrides(settings)
+    yield lambda: yamldict.YAMLDict(override).rebase(settings)
+
+
+@benchmark('traverse', shapes=TREE_SHAPES)
+def traverse(shape, size):
+    settings = _settings(shape, size)
+    yield lambda: settings.traverse(lambda path, node: None)
+
+
+@benchmark('env', shapes=('wide', 'list_heavy'))
+def env(shape, size):
+    settings = _settings(shape, size)
+    environ = generators.environ(settings)
+    saved = dict(os.environ)
+    os.environ.update(environ)
+    try:
+        yield lambda: yamlsettings.update_from_env(settings, 'BENCH')
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+@benchmark('dump', shapes=TREE_SHAPES)
+def dump(shape, size):
+    settings = _settings(shape, size)
+    yield lambda: yamldict.dump(settings)
+
+
+@contextlib.contextmanager
+def _directory():
+    path = tempfile.mkdtemp(prefix='yamlsettings-bench-')
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+@benchmark('registry.local', sizes=(1000, 10000))
+def registry_local(size):
+    with _directory() as path:
+        target = os.path.join(path, 'settings.yml')
+        with open(target, 'w') as stream:
+            stream.write(generators.dump(generators.wide(size)))
+        registry = ExtensionRegistry([LocalExtension])
+        # The first target is missing, like a user override
+        targets = [os.path.join(path, 'missing.yml'), target]
+        yield lambda: registry.load(targets)
+
+
+@benchmark('registry.local.cached', sizes=(1000, 10000))
+def registry_local_cached(size):
+    with _directory() as path:
+        target = os.path.join(path, 'settings.yml')
+        with open(target, 'w') as stream:
+            stream.write(generators.dump(generators.wide(size)))
+        registry = ExtensionRegistry([LocalExtension])
+        saved, LocalExtension.cache = (LocalExtension.cache,
+                                       type(LocalExtension.cache)())
+        try:
+            registry.load(target, cache=True)
+            yield lambda: registry.load(target, cache=True)
+        finally:
+            LocalExtension.cache = saved
+
+
+@benchmark('registry.package.persisted', sizes=(1000, 10000))
+def registry_package(size):
+    with _directory() as path:
+        package = os.path.join(path, 'yamlsettings_bench_package')
+        os.mkdir(package)
+        open(os.path.join(package, '__init__.py'), 'w').close()
+        with open(os.path.join(package, 'settings.yaml'), 'w') as stream:
+            stream.write(generators.dump(generators.wide(size)))
+        registry = ExtensionRegistry([PackageExtension])
+        sys.path.insert(0, path)
+        saved, PackageExtension.persistence = (
+            PackageExtension.persistence,
+            type(PackageExtension.persistence)())
+        try:
+            registry.load('pkg://yamlsettings_bench_package')
+            yield lambda: registry.load('pkg://yamlsettings_bench_package')
+        finally:
+            PackageExtension.persistence = saved
+            sys.path.remove(path)
+            sys.modules.pop('yamlsettings_bench_package', None)
+
+
+@benchmark('registry.discover', sizes=(1,))
+def registry_discover(size):
+    def _discover():
+        ExtensionRegistry([])._discover()
+    yield _discover
+
+
+@benchmark('registry.discover.cached', sizes=(1,))
+def registry_discover_cached(size):
+    with _directory() as path:
+        def _discover():
+            ExtensionRegistry([], cache_dir=path)._discover()
+        _discover()
+        yield _discover
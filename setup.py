@@ -1,9 +1,14 @@
+import re
+
 try:
     from setuptools import setup
 except ImportError:
     from distutils.core import setup
 
 readme = open('README.rst').read()
+# The version is only kept in yamlsettings/__init__.py
+version = re.search(r"^__version__ = '([^']+)'",
+                    open('yamlsettings/__init__.py').read(), re.M).group(1)
 
 requirements = {
     "package": [
@@ -19,13 +24,17 @@ requirements = {
     "setup": [
         "pytest-runner",
     ],
+    # SettingsWatcher notices changes with inotify instead of polling
+    "watch": [
+        "inotify_simple; sys_platform == 'linux'",
+    ],
 }
 
 requirements.update(all=sorted(set().union(*requirements.values())))
 
 setup(
     name='yamlsettings',
-    version='2.1.2',
+    version=version,
     description='Yaml Settings Configuration Module',
     long_description=readme,
     author='Kyle James Walker',
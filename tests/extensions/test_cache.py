@@ -0,0 +1,186 @@
+"""Test cache helpers
+
+"""
+import io
+import os
+import sys
+import types
+
+import pytest
+import yaml
+import yamlsettings
+
+from yamlsettings import yamldict
+from yamlsettings.extensions.cache import CompiledCache, LRUCache
+from yamlsettings.extensions.local import LocalExtension
+from yamlsettings.extensions.registry import ExtensionRegistry
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # b was the least recently used
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 0,
+                             'entries': 2, 'bytes': 0}
+
+
+def test_lru_maxbytes():
+    cache = LRUCache(maxsize=None, maxbytes=10)
+    cache.set('a', 1, size=4)
+    cache.set('b', 2, size=4)
+    cache.set('c', 3, size=4)
+    assert 'a' not in cache
+    assert cache.bytes == 8
+
+    # Too large to ever fit
+    cache.set('d', 4, size=11)
+    assert 'd' not in cache
+    assert len(cache) == 2
+
+    # Replacing a key releases its old size
+    cache.set('b', 5, size=1)
+    assert cache.bytes == 5
+
+
+def test_lru_invalidate():
+    cache = LRUCache()
+    cache.set('a', 1, size=3)
+    cache.invalidate('a')
+    cache.invalidate('missing')
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+    assert cache.stats() == {'hits': 0, 'misses': 2,
+                             'entries': 0, 'bytes': 0}
+
+    cache.set('b', 2)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.misses == 0
+
+
+def test_compiled_cache(tmp_path):
+    cache = CompiledCache(str(tmp_path / 'cache'))
+    load = cache.wrap(yamldict.load)
+    assert cache.wrap(yamldict.load) is load
+
+    first = load('a: {b: 1}\n')
+    assert first == {'a': {'b': 1}}
+    assert isinstance(first.a, yamldict.YAMLDict)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert len(os.listdir(str(tmp_path / 'cache'))) == 1
+
+    second = load(io.StringIO(u'a: {b: 1}\n'))
+    assert second == first
+    assert second is not first
+    assert isinstance(second.a, yamldict.YAMLDict)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Source changes miss
+    assert load(b'a: {b: 2}\n').a.b == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.clear()
+    assert os.listdir(str(tmp_path / 'cache')) == []
+
+
+def test_compiled_cache_load_all(tmp_path):
+    cache = CompiledCache(str(tmp_path))
+    load_all = cache.wrap(yamldict.load_all)
+    for _ in range(2):
+        docs = load_all('---\na: 1\n---\na: 2\n')
+        assert isinstance(docs, types.GeneratorType)
+        assert [doc.a for doc in docs] == [1, 2]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Same source, different load method
+    with pytest.raises(yaml.composer.ComposerError):
+        cache.wrap(yamldict.load)('---\na: 1\n---\na: 2\n')
+
+
+def test_compiled_cache_invalid_entries(tmp_path, monkeypatch):
+    cache = CompiledCache(str(tmp_path))
+    load = cache.wrap(yamldict.load)
+    load('a: 1\n')
+    entry, = os.listdir(str(tmp_path))
+    (tmp_path / entry).write_bytes(b'corrupt')
+
+    assert load('a: 1\n').a == 1
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert load('a: 1\n').a == 1
+    assert cache.hits == 1
+
+    # Upgrades never read older entries
+    monkeypatch.setattr(yamlsettings, '__version__', '0.0.0')
+    assert load('a: 1\n').a == 1
+    assert cache.misses == 3
+
+
+def test_compiled_cache_unpicklable(tmp_path):
+    cache = CompiledCache(str(tmp_path))
+    cfg = cache.wrap(yamldict.load)('mod: !!python/module:sys\n')
+    assert cfg.mod is sys
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_registry_compiled_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.yml').write_text(u'a: 1\n')
+    registry = ExtensionRegistry([LocalExtension],
+                                 cache_dir=str(tmp_path / 'cache'))
+    assert registry.load('a.yml').a == 1
+    assert registry.load_all('a.yml')[0].a == 1
+    assert registry.load('a.yml').a == 1
+    assert registry.compiled_cache.hits == 1
+    assert registry.compiled_cache.misses == 2
+
+    assert ExtensionRegistry([]).compiled_cache is None
+
+
+def test_compiled_cache_prune(tmp_path):
+    cache = CompiledCache(str(tmp_path), max_entries=2, max_age=3600)
+    load = cache.wrap(yamldict.load)
+    for value in range(3):
+        load('a: {0}\n'.format(value))
+        # Distinct mtimes, the oldest entry is the first one
+        for name in os.listdir(str(tmp_path)):
+            path = str(tmp_path / name)
+            os.utime(path, (os.stat(path).st_mtime - 1,) * 2)
+    assert len(os.listdir(str(tmp_path))) == 2
+    assert load('a: 2\n').a == 2
+    assert load('a: 1\n').a == 1
+    assert cache.hits == 2
+
+    # Entries unused for max_age are removed on the next write
+    for name in os.listdir(str(tmp_path)):
+        os.utime(str(tmp_path / name), (0, 0))
+    load('a: 3\n')
+    assert len(os.listdir(str(tmp_path))) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'geteuid'), reason='POSIX permissions')
+def test_compiled_cache_untrusted(tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    os.chmod(str(shared), 0o777)
+    cache = CompiledCache(str(shared))
+    with pytest.warns(RuntimeWarning):
+        assert cache.wrap(yamldict.load)('a: 1\n').a == 1
+    assert cache.wrap(yamldict.load)('a: 1\n').a == 1
+    assert os.listdir(str(shared)) == []
+    assert cache.misses == 2
+
+    # Entries writable by others are never unpickled
+    cache = CompiledCache(str(tmp_path / 'private'))
+    load = cache.wrap(yamldict.load)
+    load('a: 1\n')
+    entry, = os.listdir(str(tmp_path / 'private'))
+    assert os.stat(str(tmp_path / 'private')).st_mode & 0o777 == 0o700
+    os.chmod(str(tmp_path / 'private' / entry), 0o666)
+    assert load('a: 1\n').a == 1
+    assert cache.hits == 0
@@ -0,0 +1,87 @@
+"""Test local file loading default extension
+
+"""
+import os
+
+import pytest
+import yaml
+import yamlsettings
+
+from yamlsettings.extensions.cache import LRUCache
+from yamlsettings.extensions.local import LocalExtension
+from yamlsettings.extensions.registry import ExtensionRegistry
+
+
+@pytest.fixture
+def local_registry(monkeypatch, tmp_path):
+    """Clean registry with only a fresh local extension"""
+    reg_fixture = ExtensionRegistry([
+        LocalExtension
+    ])
+    monkeypatch.setattr(LocalExtension, 'cache', LRUCache(maxsize=4))
+    monkeypatch.setattr(yamlsettings, 'load', reg_fixture.load)
+    monkeypatch.setattr(yamlsettings, 'load_all', reg_fixture.load_all)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def write(path, content, mtime_ns=None):
+    path.write_text(content)
+    if mtime_ns is not None:
+        os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_no_cache_by_default(local_registry):
+    write(local_registry / 'a.yml', 'val: one\n')
+    assert yamlsettings.load('a.yml').val == 'one'
+    assert yamlsettings.load('a.yml').val == 'one'
+    assert len(LocalExtension.cache) == 0
+
+
+def test_cache_hit(local_registry):
+    write(local_registry / 'a.yml', 'val: one\n')
+    cfg = yamlsettings.load('a.yml?cache=true')
+    assert cfg.val == 'one'
+    assert LocalExtension.cache.stats()['misses'] == 1
+
+    # Changes to a copy don't leak into the cache
+    cfg.val = 'changed'
+    cfg = yamlsettings.load('a.yml?cache=true')
+    assert cfg.val == 'one'
+    assert LocalExtension.cache.stats()['hits'] == 1
+
+
+def test_cache_kwarg(local_registry):
+    write(local_registry / 'a.yml', 'val: one\n')
+    yamlsettings.load('a.yml', cache=True)
+    yamlsettings.load('a.yml', cache=True)
+    assert LocalExtension.cache.hits == 1
+
+
+def test_cache_invalidated_on_change(local_registry):
+    target = local_registry / 'a.yml'
+    write(target, 'val: one\n', mtime_ns=1000000000)
+    assert yamlsettings.load('a.yml?cache=true').val == 'one'
+
+    write(target, 'val: two\n', mtime_ns=2000000000)
+    assert yamlsettings.load('a.yml?cache=true').val == 'two'
+    assert LocalExtension.cache.hits == 0
+    assert LocalExtension.cache.misses == 2
+
+
+def test_cache_load_all(local_registry):
+    write(local_registry / 'a.yml', '---\nval: one\n---\nval: two\n')
+    first = yamlsettings.load_all('a.yml?cache=true')
+    second = yamlsettings.load_all('a.yml?cache=true')
+    assert [c.val for c in second] == ['one', 'two']
+    assert first[0] is not second[0]
+    assert LocalExtension.cache.hits == 1
+
+    # Load and load all are cached separately
+    with pytest.raises(yaml.composer.ComposerError):
+        yamlsettings.load('a.yml?cache=true')
+
+
+def test_cache_missing_file(local_registry):
+    with pytest.raises(IOError):
+        yamlsettings.load('missing.yml?cache=true')
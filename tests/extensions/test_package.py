@@ -1,10 +1,17 @@
 """Test package loading default extension
 
 """
+import mmap
+import pkgutil
+import sys
+import zipfile
+
 import pytest
 import yaml
 import yamlsettings
 
+from yamlsettings.extensions import package
+from yamlsettings.extensions.cache import LRUCache
 from yamlsettings.extensions.package import PackageExtension
 from yamlsettings.extensions.registry import ExtensionRegistry
 
@@ -15,8 +22,8 @@ def package_data(monkeypatch, mocker):
     reg_fixture = ExtensionRegistry([
         PackageExtension
     ])
-    # Remove persistance support
-    monkeypatch.setattr(PackageExtension, '_persistence', {})
+    # Fresh persistence
+    monkeypatch.setattr(PackageExtension, 'persistence', LRUCache())
     # Hook load functions to root of yamlsettings
     monkeypatch.setattr(yamlsettings, 'load', reg_fixture.load)
     monkeypatch.setattr(yamlsettings, 'load_all', reg_fixture.load_all)
@@ -105,3 +112,105 @@ def test_no_cache(package_data):
     package_data.return_value = b'val: two\n'
     cfg = yamlsettings.load('pkg://example?persist=false')
     assert cfg.val == 'two'
+
+
+def test_persistence_copies(package_data):
+    """Every load gets its own copy of the persisted yamldict"""
+    package_data.return_value = b'a: {b: 1}\n'
+    cfg = yamlsettings.load('pkg://example')
+    cfg.a.b = 2
+    cfg.c = 3
+    assert yamlsettings.load('pkg://example') == {'a': {'b': 1}}
+    assert package_data.call_count == 1
+    assert PackageExtension.persistence.stats()['hits'] == 1
+
+    package_data.return_value = b'---\nfoo: first\n---\nfoo: second'
+    cfg = yamlsettings.load_all('pkg://example')
+    cfg[0].foo = 'changed'
+    assert yamlsettings.load_all('pkg://example')[0].foo == 'first'
+
+
+def test_persistence_keys(package_data):
+    """Env overlays are part of the persisted result"""
+    package_data.return_value = b'val: needed\n'
+    assert yamlsettings.load('pkg://example?prefix=ENV').val == 'mocked'
+    assert yamlsettings.load('pkg://example?env=false').val == 'needed'
+    assert yamlsettings.load('pkg://example').val == 'needed'
+    assert package_data.call_count == 3
+
+
+def test_invalidate(package_data):
+    """Invalidated resources are loaded again"""
+    package_data.return_value = b'val: one\n'
+    yamlsettings.load('pkg://example')
+    yamlsettings.load('pkg://example?resource=other.yaml')
+    yamlsettings.load('pkg://other')
+
+    package_data.return_value = b'val: two\n'
+    assert PackageExtension.invalidate('example', 'other.yaml') == 1
+    assert yamlsettings.load('pkg://example').val == 'one'
+    assert yamlsettings.load(
+        'pkg://example?resource=other.yaml').val == 'two'
+    assert PackageExtension.invalidate('other') == 1
+    assert yamlsettings.load('pkg://other').val == 'two'
+    assert PackageExtension.invalidate() == 3
+    assert len(PackageExtension.persistence) == 0
+
+
+def test_persistence_bounds(package_data, monkeypatch):
+    """The least recently used resources are dropped"""
+    monkeypatch.setattr(PackageExtension, 'persistence', LRUCache(maxsize=2))
+    package_data.return_value = b'val: one\n'
+    for name in ('a', 'b', 'a', 'c', 'a'):
+        yamlsettings.load('pkg://{0}'.format(name))
+    assert package_data.call_count == 3
+    assert len(PackageExtension.persistence) == 2
+
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch):
+    """Installed packages, one as a directory and one zipped"""
+    package = tmp_path / 'ys_resource_package'
+    (package / 'conf').mkdir(parents=True)
+    (package / '__init__.py').write_text('')
+    (package / 'settings.yaml').write_text('where: directory\n')
+    (package / 'empty.yaml').write_text('')
+    (package / 'conf' / 'all.yaml').write_text('---\na: 1\n---\na: 2\n')
+    archive = tmp_path / 'packages.zip'
+    with zipfile.ZipFile(str(archive), 'w') as zipped:
+        zipped.writestr('ys_zipped_package/__init__.py', '')
+        zipped.writestr('ys_zipped_package/settings.yaml', 'where: zip\n')
+    monkeypatch.syspath_prepend(str(archive))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(PackageExtension, 'persistence', LRUCache())
+    yield
+    for name in ('ys_resource_package', 'ys_zipped_package'):
+        sys.modules.pop(name, None)
+
+
+def test_resource_files(resources, mocker):
+    """Resources are read through importlib.resources"""
+    get_data = mocker.spy(pkgutil, 'get_data')
+    registry = ExtensionRegistry([PackageExtension])
+
+    assert registry.load('pkg://ys_resource_package').where == 'directory'
+    assert registry.load('pkg://ys_zipped_package').where == 'zip'
+    assert registry.load(
+        'pkg://ys_resource_package?resource=empty.yaml') is None
+    docs = registry.load_all(
+        'pkg://ys_resource_package?resource=conf/all.yaml')
+    assert [doc.a for doc in docs] == [1, 2]
+    assert get_data.call_count == 0
+    assert PackageExtension.persistence.stats()['bytes'] == 46
+    with package._open_resource('ys_resource_package',
+                                'settings.yaml') as stream:
+        assert isinstance(stream, mmap.mmap)
+
+    with pytest.raises(IOError):
+        registry.load('pkg://ys_resource_package?resource=missing.yaml')
+    with pytest.raises(IOError):
+        registry.load('pkg://ys_zipped_package?resource=missing.yaml')
+    assert registry.load([
+        'pkg://ys_resource_package?resource=missing.yaml',
+        'pkg://ys_zipped_package',
+    ]).where == 'zip'
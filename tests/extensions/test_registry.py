@@ -1,7 +1,14 @@
 """Test registry"""
+import asyncio
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pytest
 import yamlsettings
 from yamlsettings.extensions.base import YamlSettingsExtension
+from yamlsettings.extensions.local import LocalExtension
 from yamlsettings.extensions.registry import ExtensionRegistry
 from mock import Mock
 
@@ -16,6 +23,38 @@ class MockExtension(YamlSettingsExtension):
         return load_method("mock: test")
 
 
+class SlowExtension(YamlSettingsExtension):
+    """Returns the yaml in the path after a delay, missing when empty"""
+    protocols = ['slow']
+    delay = 0.2
+    threads = set()
+
+    @classmethod
+    def load_target(cls, scheme, path, fragment, username,
+                    password, hostname, port, query,
+                    load_method, **kwargs):
+        cls.threads.add(threading.current_thread().name)
+        time.sleep(cls.delay)
+        if not hostname:
+            raise IOError(path)
+        return load_method(hostname.replace('=', ': ') + path.replace(
+            '/', '\n'))
+
+
+class AsyncExtension(YamlSettingsExtension):
+    """Native coroutine loading, never runs load_target"""
+    protocols = ['async']
+
+    @classmethod
+    async def aload_target(cls, scheme, path, fragment, username,
+                           password, hostname, port, query,
+                           load_method, **kwargs):
+        await asyncio.sleep(0.01)
+        if not hostname:
+            raise IOError(path)
+        return load_method(hostname.replace('=', ': '))
+
+
 class MockExtension2(YamlSettingsExtension):
     protocols = ['mock2']
 
@@ -45,6 +84,7 @@ def base_registry(monkeypatch, mocker):
     clean_reg = ExtensionRegistry([])
     monkeypatch.setattr(yamlsettings, 'load', clean_reg.load)
     monkeypatch.setattr(yamlsettings, 'load_all', clean_reg.load_all)
+    monkeypatch.setattr(yamlsettings, 'load_merged', clean_reg.load_merged)
 
 
 def test_mock_exists(base_registry):
@@ -56,7 +96,358 @@ def test_mock_exists(base_registry):
     assert cfg.mock == 'test'
 
 
+def test_lazy_discovery(mocker):
+    """Entry points are only scanned once a protocol isn't found"""
+    mock_call = Mock()
+    mock_call.load.return_value = MockExtension
+    get_entry_points = mocker.patch.object(
+        ExtensionRegistry,
+        '_get_entry_points',
+        return_value=[mock_call]
+    )
+    registry = ExtensionRegistry([MockExtension2])
+    assert registry.load('mock2://please').mock == 'test'
+    assert get_entry_points.call_count == 0
+
+    assert registry.load('mock://please').mock == 'test'
+    with pytest.raises(yamlsettings.RegistryError):
+        registry.load('package://example')
+    assert get_entry_points.call_count == 1
+
+
+def test_discovery_keeps_protocols(mocker):
+    """Installed extensions don't replace the registered protocols"""
+    class Plugin(MockExtension):
+        protocols = ['mock2', 'mock']
+
+    mock_call = Mock()
+    mock_call.load.return_value = Plugin
+    mocker.patch.object(
+        ExtensionRegistry,
+        '_get_entry_points',
+        return_value=[mock_call]
+    )
+    registry = ExtensionRegistry([MockExtension2])
+    assert registry.get_extension('mock2') is MockExtension2
+    assert isinstance(registry.get_extension('mock'), Plugin)
+    assert registry.get_extension('mock2') is MockExtension2
+
+
+def test_discovery_cache(tmp_path, mocker):
+    """Discovered entry points are saved for the installed distributions"""
+    from importlib.metadata import EntryPoint
+    point = EntryPoint('mock', 'tests.extensions.test_registry:MockExtension',
+                       'yamlsettings10')
+    get_entry_points = mocker.patch.object(
+        ExtensionRegistry,
+        '_get_entry_points',
+        return_value=[point]
+    )
+    for _ in range(2):
+        registry = ExtensionRegistry([], cache_dir=str(tmp_path))
+        assert registry.load('mock://please').mock == 'test'
+    assert get_entry_points.call_count == 1
+
+    # Installing a distribution changes a directory on sys.path
+    mocker.patch('sys.path', [str(tmp_path)])
+    (tmp_path / 'new.dist-info').mkdir()
+    registry = ExtensionRegistry([], cache_dir=str(tmp_path))
+    assert registry.load('mock://please').mock == 'test'
+    assert get_entry_points.call_count == 2
+
+
 def test_mock_ext(base_registry):
     """Test package extension is not installed"""
     with pytest.raises(yamlsettings.RegistryError):
         yamlsettings.load('package://example')
+
+
+@pytest.fixture
+def slow_registry():
+    SlowExtension.threads = set()
+    return ExtensionRegistry([SlowExtension])
+
+
+def test_load_merged(slow_registry):
+    start = time.time()
+    cfg = slow_registry.load_merged([
+        'slow://a=1/b: {c: 1, d: 1}/e: 1',
+        'slow://a=2/b: {c: 2}',
+        'slow://',
+        ['slow://', 'slow://f=3'],
+    ])
+    # The targets load at the same time
+    assert time.time() - start < SlowExtension.delay * 3
+    assert len(SlowExtension.threads) == 4
+    assert cfg == {'a': 2, 'b': {'c': 2, 'd': 1}, 'e': 1, 'f': 3}
+    assert isinstance(cfg.b, yamlsettings.yamldict.YAMLDict)
+
+
+def test_load_merged_fields(slow_registry):
+    cfg = slow_registry.load_merged(
+        ['slow://a=1/b: {c: 1, d: 1}', 'slow://a=2/b: {d: 2}'],
+        fields=['b.d'], dotted=True,
+    )
+    assert cfg == {'b': {'d': 2}}
+
+
+def test_load_merged_missing(slow_registry):
+    with pytest.raises(IOError):
+        slow_registry.load_merged(['slow://a=1', 'slow://'], required=True)
+    with pytest.raises(IOError):
+        slow_registry.load_merged(['slow://', 'slow://'])
+    assert slow_registry.load_merged('slow://a=1') == {'a': 1}
+
+
+def test_load_merged_executor(slow_registry, monkeypatch):
+    monkeypatch.setattr(SlowExtension, 'delay', 0)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        cfg = slow_registry.load_merged(['slow://a=1', 'slow://b=2'],
+                                        executor=executor)
+        # Still usable, it isn't shut down by load_merged
+        executor.submit(lambda: None).result()
+    assert cfg == {'a': 1, 'b': 2}
+    assert len(SlowExtension.threads) == 1
+
+
+def test_load_merged_process_pool(tmp_path):
+    (tmp_path / 'a.yml').write_text(u'a: 1\nb: {c: 1}\n')
+    (tmp_path / 'b.yml').write_text(u'b: {d: 2}\n')
+    registry = ExtensionRegistry([LocalExtension], negative_ttl=5)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        cfg = registry.load_merged(
+            [str(tmp_path / 'a.yml'), str(tmp_path / 'missing.yml'),
+             str(tmp_path / 'b.yml')],
+            executor=executor)
+    assert cfg == {'a': 1, 'b': {'c': 1, 'd': 2}}
+    assert isinstance(cfg.b, yamlsettings.yamldict.YAMLDict)
+
+
+def test_pickle(tmp_path):
+    (tmp_path / 'a.yml').write_text(u'a: 1\n')
+    registry = ExtensionRegistry([LocalExtension], negative_ttl=5,
+                                 cache_dir=str(tmp_path / 'cache'))
+    registry.add_hook(lambda event: None)
+    targets = [str(tmp_path / 'missing.yml'), str(tmp_path / 'a.yml')]
+    assert registry.load(targets) == {'a': 1}
+
+    copied = pickle.loads(pickle.dumps(registry))
+    # Caches start empty, hooks stay with the original
+    assert len(copied.target_cache) == 0
+    assert len(copied.negative_cache) == 0
+    assert copied.negative_cache.ttl == 5
+    assert copied._hooks == ()
+    assert copied.load(targets) == {'a': 1}
+    assert copied.compiled_cache.hits == 1
+
+
+@pytest.fixture
+def async_registry():
+    SlowExtension.threads = set()
+    return ExtensionRegistry([SlowExtension, AsyncExtension, LocalExtension])
+
+
+def test_aload(async_registry):
+    async def load_and_tick():
+        ticks = 0
+        task = asyncio.ensure_future(async_registry.aload('slow://a=1'))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks, task.result()
+
+    ticks, cfg = asyncio.run(load_and_tick())
+    # The event loop kept running while the target loaded
+    assert ticks > 5
+    assert cfg == {'a': 1}
+    assert 'MainThread' not in SlowExtension.threads
+
+    cfg = asyncio.run(async_registry.aload(['async://', 'async://b=2']))
+    assert cfg == {'b': 2}
+
+
+def test_aload_all(async_registry, tmp_path):
+    path = tmp_path / 'settings.yml'
+    path.write_text('a: 1\n---\nb: 2\n')
+    docs = asyncio.run(async_registry.aload_all(str(path)))
+    assert docs == [{'a': 1}, {'b': 2}]
+
+
+def test_aload_timeout(async_registry):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(async_registry.aload('slow://a=1', timeout=0.01))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(async_registry.aload_merged(['async://a=1', 'slow://b=2'],
+                                                timeout=0.05))
+
+
+def test_aload_merged(async_registry):
+    start = time.time()
+    cfg = asyncio.run(async_registry.aload_merged([
+        'slow://a=1/b: {c: 1, d: 1}',
+        'async://a=2',
+        'slow://b=3',
+        'slow://',
+    ]))
+    assert time.time() - start < SlowExtension.delay * 2
+    assert cfg == {'a': 2, 'b': 3}
+
+    with pytest.raises(IOError):
+        asyncio.run(async_registry.aload_merged(['async://a=1', 'async://'],
+                                                required=True))
+    with pytest.raises(yamlsettings.RegistryError):
+        asyncio.run(async_registry.aload_merged(['async://a=1', 'mock://']))
+
+
+class QueryExtension(YamlSettingsExtension):
+    """Mutates its query like the bundled extensions"""
+    protocols = ['query']
+    default_query = {'names': ['a']}
+    queries = []
+
+    @classmethod
+    def load_target(cls, scheme, path, fragment, username,
+                    password, hostname, port, query,
+                    load_method, **kwargs):
+        cls.queries.append((query['n'], list(query['names'])))
+        query['names'].append('b')
+        query.update(kwargs)
+        return load_method('names: {0}'.format(query.pop('names')))
+
+
+def test_target_cache(mocker):
+    registry = ExtensionRegistry([QueryExtension])
+    conform = mocker.spy(QueryExtension, 'conform_query')
+    QueryExtension.queries = []
+    for _ in range(3):
+        assert registry.load('query://x?n=1', extra=1).names == ['a', 'b']
+    assert conform.call_count == 1
+    assert QueryExtension.queries == [(1, ['a'])] * 3
+    assert registry.target_cache.stats()['hits'] == 2
+
+    registry.load('query://x?n=2')
+    assert conform.call_count == 2
+    registry.default_protocol = 'query'
+    registry.load('query://x?n=2')
+    assert conform.call_count == 3
+
+    # Protocols can be taken over by a new extension
+    registry.add(MockExtension)
+    assert len(registry.target_cache) == 0
+
+
+class CountingExtension(YamlSettingsExtension):
+    """Missing unless the hostname is in available"""
+    protocols = ['count']
+    available = set()
+    opened = []
+
+    @classmethod
+    def load_target(cls, scheme, path, fragment, username,
+                    password, hostname, port, query,
+                    load_method, **kwargs):
+        cls.opened.append(hostname)
+        if hostname not in cls.available:
+            raise IOError(hostname)
+        return load_method('name: {0}'.format(hostname))
+
+
+def test_negative_cache_ttl(monkeypatch):
+    registry = ExtensionRegistry([CountingExtension], negative_ttl=10)
+    CountingExtension.available = {'defaults'}
+    CountingExtension.opened = []
+    uris = ['count://local', 'count://defaults']
+    for _ in range(3):
+        assert registry.load(uris).name == 'defaults'
+    assert CountingExtension.opened == ['local', 'defaults', 'defaults',
+                                        'defaults']
+    assert registry.negative_cache.stats()['hits'] == 2
+    with pytest.raises(IOError):
+        asyncio.run(registry.aload('count://local'))
+    assert CountingExtension.opened[-1] == 'defaults'
+
+    # Remembered until the ttl runs out
+    CountingExtension.available.add('local')
+    clock = time.monotonic() + 11
+    monkeypatch.setattr(time, 'monotonic', lambda: clock)
+    assert registry.load(uris).name == 'local'
+
+    # Disabled by default
+    registry = ExtensionRegistry([CountingExtension])
+    assert registry.negative_cache is None
+
+
+def test_negative_cache_local(tmp_path, mocker):
+    registry = ExtensionRegistry([LocalExtension], negative_ttl=0)
+    load_target = mocker.spy(LocalExtension, 'load_target')
+    local = tmp_path / 'local.yml'
+    defaults = tmp_path / 'defaults.yml'
+    defaults.write_text('name: defaults')
+    uris = [str(local), str(defaults)]
+    for _ in range(3):
+        assert registry.load(uris).name == 'defaults'
+    # The token is trusted once a second attempt found it unchanged
+    assert load_target.call_count == 5
+
+    # Creating the file changes the directory mtime
+    local.write_text('name: local')
+    assert registry.load(uris).name == 'local'
+
+    # Without a token nothing is remembered
+    with pytest.raises(IOError):
+        registry.load(str(tmp_path / 'missing' / 'settings.yml'))
+    assert len(registry.negative_cache) == 0
+
+
+def test_negative_cache_local_ttl(tmp_path, monkeypatch, mocker):
+    registry = ExtensionRegistry([LocalExtension], negative_ttl=10)
+    local = tmp_path / 'local.yml'
+    defaults = tmp_path / 'defaults.yml'
+    defaults.write_text('name: defaults')
+    uris = [str(local), str(defaults)]
+    assert registry.load(uris).name == 'defaults'
+
+    # Trusted without a check during the ttl, then while the directory is
+    # unchanged
+    target_token = mocker.spy(LocalExtension, 'target_token')
+    clock = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: clock)
+
+    def _checked():
+        return [call for call in target_token.call_args_list
+                if str(local) in call.args]
+
+    assert registry.load(uris).name == 'defaults'
+    assert _checked() == []
+    clock += 11
+    assert registry.load(uris).name == 'defaults'
+    assert len(_checked()) == 1
+    clock += 11
+    assert registry.load(uris).name == 'defaults'
+    assert len(_checked()) == 2
+    # Found targets never take a token
+    assert len(target_token.call_args_list) == 2
+
+    local.write_text('name: local')
+    assert registry.load(uris).name == 'defaults'
+    clock += 11
+    assert registry.load(uris).name == 'local'
+
+
+def test_negative_cache_race(tmp_path, mocker):
+    registry = ExtensionRegistry([LocalExtension], negative_ttl=0)
+    local = tmp_path / 'local.yml'
+    defaults = tmp_path / 'defaults.yml'
+    defaults.write_text('name: defaults')
+    uris = [str(local), str(defaults)]
+    target_token = LocalExtension.target_token
+
+    def _created_meanwhile(*args):
+        # Appears after the failed open, before the token is taken
+        local.write_text('name: local')
+        return target_token(*args)
+
+    mocker.patch.object(LocalExtension, 'target_token',
+                        side_effect=_created_meanwhile)
+    assert registry.load(uris).name == 'defaults'
+    assert registry.load(uris).name == 'local'
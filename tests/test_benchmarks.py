@@ -0,0 +1,70 @@
+"""Benchmark suite smoke tests, the cases run once at a tiny size
+
+"""
+import io
+import json
+import os
+
+from benchmarks import bench_import, bench_resource, generators, run
+
+from yamlsettings import yamldict
+
+
+def test_generators():
+    for generator in generators.SHAPES.values():
+        tree = generator(100)
+        assert yamldict.load(generators.dump(tree)) == tree
+    anchors = yamldict.load(generators.anchor_heavy(100))
+    assert anchors.section_1.key_0 == 1
+    assert anchors.section_1.shared is anchors.bases.base_2
+    assert len(list(yamldict.load_all(generators.multi_document(100)))) == 10
+
+
+def test_suite_runs(tmp_path):
+    environ = dict(os.environ)
+    out = io.StringIO()
+    document = run.run(run.select(), repeat=1, number=1, size=20, out=out)
+    assert os.environ == environ
+    names = set(bench.name for bench in run.select())
+    assert set(r['name'] for r in document['results'].values()) == names
+    assert 'registry.package.persisted[20]' in document['results']
+
+    results = tmp_path / 'results.json'
+    assert run.main(['clone.', '--size', '20', '--repeat', '1', '--number',
+                     '1', '--json', str(results)]) == 0
+    saved = json.loads(results.read_text())
+    assert saved['format'] == run.FORMAT
+    assert sorted(saved['results']) == ['clone.deep[20]',
+                                        'clone.list_heavy[20]',
+                                        'clone.wide[20]']
+
+
+def test_compare():
+    def _document(**times):
+        return {'format': run.FORMAT, 'results': {
+            key: {'min': value} for key, value in times.items()}}
+
+    baseline = _document(a=1.0, b=1.0, c=1.0)
+    current = _document(a=1.1, b=2.0, c=0.5, new=1.0)
+    out = io.StringIO()
+    assert run.compare(current, baseline, threshold=1.25, out=out) == ['b']
+    assert 'faster' in out.getvalue()
+    assert run.compare(current, baseline, threshold=2.5, out=None) == []
+
+
+def test_import_time():
+    output = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |     yaml.error\n'
+        'import time:       500 |      12000 | yamlsettings\n'
+    )
+    assert bench_import.parse(output) == {
+        'yaml.error': (120, 120),
+        'yamlsettings': (500, 12000),
+    }
+    assert bench_import.main(['--repeat', '1', '--max-ms', '1e6']) == 0
+
+
+def test_resource_reading(capsys):
+    assert bench_resource.main(['--size-mb', '0.1', '--repeat', '1']) == 0
+    assert 'zip PackageExtension' in capsys.readouterr().out
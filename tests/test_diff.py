@@ -0,0 +1,168 @@
+"""Structural diff and patch of YAMLDict trees
+
+"""
+import copy
+
+import pytest
+
+from yamlsettings import yamldict
+from yamlsettings.yamldict import YAMLDict
+
+from . import mock_files
+
+OLD = {
+    'config': {'greet': 'Hello', 'leave': 'Goodbye', 'meaning': 42},
+    'list': [1, {'a': 1}],
+    'gone': {'x': 1},
+    'same': {'deep': {'deeper': [1, 2]}},
+}
+NEW = {
+    'config': {'greet': 'Hi', 'meaning': 42, 'secret': None},
+    'list': [1, {'a': 2}],
+    'same': {'deep': {'deeper': [1, 2]}},
+    'added': {'y': 2},
+}
+
+
+def test_diff():
+    assert yamldict.diff(YAMLDict(OLD), YAMLDict(NEW)) == [
+        ('remove', ('gone',), None),
+        ('remove', ('config', 'leave'), None),
+        ('replace', ('config', 'greet'), 'Hi'),
+        ('add', ('config', 'secret'), None, 2),
+        ('replace', ('list',), [1, {'a': 2}]),
+        ('add', ('added',), {'y': 2}, 3),
+    ]
+
+
+def test_diff_same():
+    tree = YAMLDict(OLD)
+    assert yamldict.diff(tree, tree) == []
+    assert yamldict.diff(tree, tree.clone()) == []
+    assert yamldict.diff(1, 1) == []
+    assert yamldict.diff(1, 2) == [('replace', (), 2)]
+    assert yamldict.diff({}, [1]) == [('replace', (), [1])]
+
+
+def test_diff_clones():
+    old = YAMLDict(OLD)
+    new = old.clone()
+    new.config.greet = 'Hi'
+    ops = yamldict.diff(old, new)
+    assert ops == [('replace', ('config', 'greet'), 'Hi')]
+    # Values shared by clones are copied into the ops
+    new = old.clone(shared=True).clone()
+    old.same.deep.deeper = [3]
+    ops = yamldict.diff(old, new)
+    assert ops == [('replace', ('same', 'deep', 'deeper'), [1, 2])]
+    ops[0][2].append(3)
+    assert new.same.deep.deeper == [1, 2]
+
+
+def test_diff_skips_equal_subtrees():
+    class Watched(YAMLDict):
+        __slots__ = ()
+        visited = []
+
+        def items(self):
+            self.visited.append(self)
+            return super(Watched, self).items()
+
+    same = Watched({'b': 1})
+    old = Watched({'a': same, 'c': Watched({'d': 1})})
+    new = Watched({'a': same, 'c': Watched({'d': 2})})
+    Watched.visited = []
+    assert yamldict.diff(old, new) == [('replace', ('c', 'd'), 2)]
+    assert same not in Watched.visited
+
+
+def test_diff_types():
+    old = yamldict.load('debug: 0\nport: 1\nl: [1]\nm: {a: 1}\n')
+    new = yamldict.load('debug: false\nport: 1.0\nl: [true]\nm: {a: 1}\n')
+    assert yamldict.diff(old, new) == [
+        ('replace', ('debug',), False),
+        ('replace', ('port',), 1.0),
+        ('replace', ('l',), [True]),
+    ]
+    assert yamldict.diff(1, True) == [('replace', (), True)]
+    assert yamldict.diff({'a': (1,)}, {'a': [1]}) == [
+        ('replace', ('a',), [1])]
+    old.apply_patch(yamldict.diff(old, new))
+    assert type(old.debug) is bool and type(old.port) is float
+
+
+@pytest.mark.parametrize("old,new", [
+    (OLD, NEW),
+    (NEW, OLD),
+    ({}, NEW),
+    (OLD, {}),
+    ({'a': {'b': 1}}, {'a': 1}),
+    ({'a': 1}, {'a': {'b': 1}}),
+])
+def test_apply_patch(old, new):
+    tree = YAMLDict(copy.deepcopy(old))
+    tree.apply_patch(yamldict.diff(tree, YAMLDict(new)))
+    assert tree == new
+    assert yamldict.diff(tree, YAMLDict(new)) == []
+    assert list(tree) == list(new)
+
+
+def test_apply_patch_order():
+    old = YAMLDict({'z': 0, 'a': {'x': 1, 'z': 3}, 'c': 3, 'gone': 4})
+    new = YAMLDict({'first': 0, 'a': {'x': 1, 'y': 2, 'z': 3}, 'b': 2,
+                    'c': 3, 'last': 5})
+    old.apply_patch(yamldict.diff(old, new))
+    assert old == new
+    assert list(old) == list(new)
+    assert list(old.a) == list(new.a)
+    assert isinstance(old.first, int) and isinstance(old.a, YAMLDict)
+
+    # Keys kept from old aren't moved
+    moved = YAMLDict({'a': 1, 'b': 2, 'e': 5})
+    moved.apply_patch(yamldict.diff(moved, YAMLDict({'b': 2, 'f': 6,
+                                                     'a': 1})))
+    assert list(moved) == ['a', 'f', 'b']
+
+    # Without an index added keys go last
+    old.apply_patch([('add', ('a', 'w'), 0)])
+    assert list(old.a) == ['x', 'y', 'z', 'w']
+
+
+def test_apply_patch_copies():
+    tree = YAMLDict(OLD)
+    new = YAMLDict(NEW)
+    tree.apply_patch(yamldict.diff(tree, new))
+    assert tree.added == new.added
+    assert tree.added is not new.added
+    assert isinstance(tree.added, YAMLDict)
+
+
+def test_apply_patch_root_and_errors():
+    tree = YAMLDict(OLD)
+    tree.apply_patch([('replace', (), {'a': {'b': 1}})])
+    assert tree == {'a': {'b': 1}}
+    assert isinstance(tree.a, YAMLDict)
+
+    tree.apply_patch([('add', ('a', 'c'), 2), ('remove', ('a', 'b'), None)])
+    assert tree == {'a': {'c': 2}}
+    tree.apply_patch([('add', ('a', 'b'), 1, 0)])
+    assert list(tree.a) == ['b', 'c']
+
+    with pytest.raises(KeyError):
+        tree.apply_patch([('remove', ('missing', 'b'), None)])
+    with pytest.raises(ValueError):
+        tree.apply_patch([('move', ('a',), None)])
+
+
+def test_diff_loaded():
+    old = yamldict.load(mock_files['defaults.yml'])
+    new = yamldict.load(mock_files['defaults.yml'])
+    new.update(yamldict.load(mock_files['settings.yml']))
+    ops = yamldict.diff(old, new)
+    assert ops == [
+        ('replace', ('config', 'secret'), 'I have many secrets'),
+        ('add', ('config_excited',), {'greet': 'Whazzzzup!'}, 1),
+        ('add', ('config_cool',), {'greet': 'Sup...'}, 2),
+    ]
+    old.apply_patch(ops)
+    assert old == new
@@ -0,0 +1,127 @@
+"""Field selection while loading, load(..., fields=...)
+
+"""
+import pytest
+import yaml
+
+import yamlsettings
+from yamlsettings import yamldict
+from yamlsettings.extensions.local import LocalExtension
+
+from . import mock_files
+
+loaders = [yamldict.YAMLDictLoader]
+if yamldict.HAS_LIBYAML:
+    loaders.append(yamldict.YAMLDictCLoader)
+
+FIELD_CASES = [
+    ('defaults.yml', ['config']),
+    ('settings.yml', ['config', 'config_cool']),
+    ('settings.yml', ['missing']),
+    ('single_fancy.yml', ['test']),
+    ('single_fancy.yml', ['test.var_list', 'test.dict_var_mix.b']),
+    ('stupid.yml', ['test.config_db']),
+    ('merge.yml', ['merged']),
+    ('merge.yml', ['merged.config', 'base.whoami']),
+]
+
+NESTED = (
+    'first:\n'
+    '  keep: 1\n'
+    '  drop: 2\n'
+    'second:\n'
+    '  drop: &shared\n'
+    '    name: shared\n'
+    '  keep: *shared\n'
+    'third: !!python/name:does.not.exist\n'
+    'fourth: *undefined_alias\n'
+    'a.b: literal\n'
+    'a:\n'
+    '  b: nested\n'
+    '  c: sibling\n'
+)
+
+
+@pytest.mark.parametrize("loader", loaders)
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("name,fields", FIELD_CASES)
+def test_limit_parity(name, fields, lazy, loader):
+    expected = yamldict.load(mock_files[name], Loader=loader)
+    expected.limit(fields, dotted=True)
+    data = yamldict.load(mock_files[name], Loader=loader, lazy=lazy,
+                         fields=fields, dotted=True)
+    assert yamldict.dump(data) == yamldict.dump(expected)
+
+
+@pytest.mark.parametrize("loader", loaders)
+def test_unrequested_keys_skipped(loader):
+    # The undefined alias and unknown name would fail if composed or
+    # constructed.
+    data = yamldict.load(NESTED, Loader=loader,
+                         fields=['first.keep', 'second.keep'], dotted=True)
+    assert data == {'first': {'keep': 1}, 'second': {'keep': {'name':
+                                                              'shared'}}}
+    with pytest.raises(yaml.composer.ComposerError):
+        yamldict.load(NESTED, Loader=loader, fields=['fourth'])
+
+
+@pytest.mark.parametrize("loader", loaders)
+def test_dotted_fields(loader):
+    data = yamldict.load(NESTED, Loader=loader, fields=['a.b'], dotted=True)
+    assert data == {'a.b': 'literal', 'a': {'b': 'nested'}}
+    data = yamldict.load(NESTED, Loader=loader, fields=['a', 'a.b'],
+                         dotted=True)
+    assert data == {'a.b': 'literal', 'a': {'b': 'nested', 'c': 'sibling'}}
+
+    # Dotted fields are plain keys unless asked for
+    data = yamldict.load(NESTED, Loader=loader, fields=['a.b'])
+    assert data == {'a.b': 'literal'}
+    data = yamldict.load(NESTED, Loader=loader, fields='a.b')
+    assert data == {'a.b': 'literal'}
+
+
+def test_limit_dotted():
+    data = yamldict.YAMLDict({'a': {'b': 1, 'c': 2}, 'a.b': 3, 'd': 4,
+                              'e': [{'f': 5}]})
+    data.limit(['a.c', 'e.f'], dotted=True)
+    assert data == {'a': {'c': 2}, 'e': [{'f': 5}]}
+    data.limit('a')
+    assert data == {'a': {'c': 2}}
+
+    data = yamldict.YAMLDict({'a': {'b': 1}, 'a.b': 2})
+    data.limit('a.b')
+    assert data == {'a.b': 2}
+
+
+def test_load_all_fields():
+    docs = list(yamldict.load_all(mock_files['fancy.yml'],
+                                  fields=['test.test2', 'test_3'],
+                                  dotted=True))
+    assert docs == [{'test': {'test2': {'message': 'hello there'}}},
+                    {}, {'test_3': {'test': {'name': 'Hello'}}}]
+
+
+def test_single_document_error():
+    with pytest.raises(yaml.composer.ComposerError):
+        yamldict.load(mock_files['fancy.yml'], fields=['test'])
+    assert yamldict.load('', fields=['test']) is None
+
+
+def test_registry_fields(tmp_path, monkeypatch):
+    monkeypatch.setattr(LocalExtension, 'cache', type(LocalExtension.cache)())
+    path = tmp_path / 'settings.yml'
+    path.write_text(NESTED)
+    target = '{0}?cache=true'.format(path)
+
+    for _ in range(2):
+        data = yamlsettings.load(target, fields=['first.keep'], dotted=True)
+        assert data == {'first': {'keep': 1}}
+    data = yamlsettings.load(target, fields=['a'])
+    assert data == {'a': {'b': 'nested', 'c': 'sibling'}}
+    # The same fields reuse the same cached parse
+    assert LocalExtension.cache.stats()['hits'] == 1
+    assert LocalExtension.cache.stats()['entries'] == 2
+
+    # A single field isn't split into characters
+    data = yamlsettings.load(target, fields='a.b')
+    assert data == {'a.b': 'literal'}
@@ -0,0 +1,188 @@
+"""Test helper functions
+
+"""
+import mock
+import pytest
+import yaml
+
+from yamlsettings import helpers, yamldict
+
+from . import mock_files
+
+
+def traverse_update_from_env(yaml_dict, prefix=None):
+    """Reference implementation walking the whole tree with traverse"""
+    prefix = prefix or ""
+
+    def _set_env_var(path, node):
+        env_path = "{0}{1}{2}".format(
+            prefix.upper(),
+            '_' if prefix else '',
+            '_'.join([str(key).replace('-', '_').upper() for key in path])
+        )
+        env_val = helpers.os.environ.get(env_path, None)
+        if env_val is not None:
+            env_dict = yamldict.load('val: {0}'.format(env_val))
+            return env_dict.val
+        else:
+            return None
+
+    yaml_dict.traverse(_set_env_var)
+
+
+ENV_CASES = [
+    ('single_fancy.yml', None, {
+        'TEST_GREETING_INTRODUCE': 'hello',
+        'TEST_DICT_VAR_MIX_B': 'Goodbye Variable',
+    }),
+    # Aliased nodes and list indexes
+    ('single_fancy.yml', None, {
+        'TEST_ID1_NAME': 'changed',
+        'TEST_VAR_LIST_[1]_NAME': 'list',
+        'TEST_VAR_LIST_[01]_NAME': 'not an index',
+        'TEST_VAR_LIST_[7]': 'out of range',
+        'TEST_DICT_WITH_LIST_SET_[2]': '[4, 5]',
+    }),
+    # An overridden node hides overrides below it
+    ('single_fancy.yml', None, {
+        'TEST_GREETING': '{a: 1}',
+        'TEST_GREETING_PART': 'hidden',
+        'TEST_DICT_VAR_MIX_A': '~',
+        'TEST_DICT_VAR_MIX': 'null',
+    }),
+    ('single_fancy.yml', 'test', {
+        'TEST_ID2_NAME': 'prefixed',
+        'TEST_TEST_ID2_NAME': 'unused',
+    }),
+    # Overriding the root stops everything
+    ('single_fancy.yml', 'test', {
+        'TEST_': 'root',
+        'TEST_ID2_NAME': 'prefixed',
+    }),
+    ('single_fancy.yml', 'test', {
+        'TEST_': '',
+        'TEST_ID2_NAME': 'prefixed',
+    }),
+    # Ambiguous names update every matching path
+    ('stupid.yml', None, {'TEST_CONFIG_DB': 'OurSQL'}),
+    ('stupid.yml', None, {'TEST_CONFIG': 'replaced',
+                          'TEST_CONFIG_DB': 'OurSQL'}),
+    ('merge.yml', None, {'MERGED_CONFIG_DB': 'merged', 'BASE_WHOAMI': '1'}),
+    ('defaults.yml', 'config', {'CONFIG_MEANING': '42.42',
+                                'CONFIG_LEAVE': 'yes',
+                                'config_greet': 'lower case'}),
+]
+
+
+@pytest.mark.parametrize("name,prefix,environ", ENV_CASES)
+def test_update_from_env_parity(name, prefix, environ):
+    expected = yamldict.load(mock_files[name])
+    actual = yamldict.load(mock_files[name])
+    with mock.patch.dict('os.environ', environ):
+        traverse_update_from_env(expected, prefix)
+        helpers.update_from_env(actual, prefix)
+    assert yamldict.dump(actual) == yamldict.dump(expected)
+
+
+def test_update_from_env_dash_and_types():
+    test_dict = yamldict.YAMLDict({
+        'a-b': {'c-d': 1, 1: 'int key'},
+        'a_b_c_d': 2,
+        'e': [{'f': 1}],
+    })
+    environ = {'A_B_C_D': '3', 'A_B_1': 'two', 'E_[0]_F': 'true'}
+    with mock.patch.dict('os.environ', environ):
+        helpers.update_from_env(test_dict)
+    assert test_dict == {
+        'a-b': {'c-d': 3, 1: 'two'},
+        'a_b_c_d': 3,
+        'e': [{'f': True}],
+    }
+
+
+class CountingDict(yamldict.YAMLDict):
+    __slots__ = ()
+    reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return super(CountingDict, self).__getitem__(key)
+
+
+def test_update_from_env_visits_matches_only():
+    test_dict = CountingDict({
+        'section_{0}'.format(i): CountingDict({'key': i, 'other': i})
+        for i in range(100)
+    })
+    environ = {'SECTION_5_KEY': '50', 'SECTION_500_KEY': '1', 'OTHER': '1'}
+    with mock.patch.dict('os.environ', environ, clear=True):
+        helpers.update_from_env(test_dict)
+    # Only the path to the matching variable was read
+    assert CountingDict.reads == ['section_5']
+    assert test_dict['section_5']['key'] == 50
+
+
+SCALAR_VALUES = [
+    # ints
+    '0', '42', '-17', '+3', '010', '0o17', '0x1F', '0b101', '1_000',
+    '12:30', '190:20:30',
+    # floats
+    '1.5', '-.5', '+12.5', '.inf', '-.Inf', '.NaN', '1.0e+3', '1e3',
+    '6.8523015e+5', '1_000.5',
+    # bools
+    'true', 'True', 'TRUE', 'false', 'yes', 'No', 'on', 'OFF', 'y', 'n',
+    # nulls
+    '~', 'null', 'Null', 'NULL', '',
+    # timestamps
+    '2001-12-14', '2001-12-14t21:59:43.10-05:00',
+    '2001-12-14 21:59:43.10 -5', '2002-12-14 21:59:43.10',
+    # strings
+    'hello', 'Howdy there', 'a:b', 'http://example.com/a?b=c&d=e',
+    'new-baz', u'caf\xe9', 'a #comment', ' padded ', "'quoted'", '"dq"',
+    'It\'s', 'a,b', 'f(x)', '$HOME', 'user@host', '100%', 'a - b', '-',
+    '-x', '.', '=', '<<', '?', ':', 'a:', 'x*y', '1.2.3', 'key=value',
+    # collections and tags
+    '[1, 2]', '[a, {b: c}]', '{a: 1}', '[]', '!!str 1', '!!float 1',
+    '&anchor value', '|', '>', '@', '`', '%',
+    '!!python/object/apply:tests.get_secret []',
+]
+
+
+def _same(result, expected):
+    if isinstance(expected, float) and expected != expected:
+        return isinstance(result, float) and result != result
+    return type(result) is type(expected) and result == expected
+
+
+@pytest.mark.parametrize("value", SCALAR_VALUES)
+def test_load_value_parity(value):
+    try:
+        expected = yamldict.load('val: {0}'.format(value)).val
+    except yaml.YAMLError as exc:
+        with pytest.raises(type(exc)):
+            yamldict.load_value(value)
+        return
+    assert _same(yamldict.load_value(value), expected)
+    # Memoised results are the same
+    assert _same(yamldict.load_value(value), expected)
+
+
+@pytest.mark.parametrize("value", ['a: b', 'a\nb', '[1, 2', 'a: b: c'])
+def test_load_value_errors(value):
+    with pytest.raises(yaml.YAMLError):
+        yamldict.load('val: {0}'.format(value))
+    with pytest.raises(yaml.YAMLError):
+        yamldict.load_value(value)
+
+
+@pytest.mark.parametrize("value", [
+    '42', '-.5', 'true', '~', '2001-12-14', 'Howdy there', 'new-baz'])
+def test_load_value_plain_not_parsed(value):
+    with mock.patch.object(yamldict, 'load', side_effect=AssertionError):
+        yamldict.load_value(value)
+
+
+def test_load_value_collections_not_shared():
+    first = yamldict.load_value('[1, {a: 2}]')
+    first[1].a = 3
+    assert yamldict.load_value('[1, {a: 2}]') == [1, {'a': 2}]
@@ -0,0 +1,172 @@
+"""Load instrumentation, ExtensionRegistry.add_hook and instrument.PhaseStats
+
+"""
+import asyncio
+import logging
+
+import pytest
+
+from yamlsettings import instrument, yamldict
+from yamlsettings.extensions.local import LocalExtension
+from yamlsettings.extensions.cache import LRUCache
+from yamlsettings.extensions.package import PackageExtension
+from yamlsettings.extensions.registry import ExtensionRegistry, RegistryError
+
+from . import mock_files
+
+
+@pytest.fixture
+def registry():
+    return ExtensionRegistry([LocalExtension, PackageExtension])
+
+
+@pytest.fixture
+def events(registry):
+    collected = []
+    registry.add_hook(collected.append)
+    return collected
+
+
+def _phases(events):
+    return [(e.attempt, e.phase, e.error) for e in events]
+
+
+def test_load_phases(registry, events, tmp_path):
+    path = tmp_path / 'settings.yml'
+    path.write_text(mock_files['settings.yml'])
+    missing = str(tmp_path / 'missing.yml')
+
+    data = registry.load([missing, str(path)], fields=['config'])
+    assert list(data) == ['config']
+    assert _phases(events) == [
+        (0, 'parse_uri', None),
+        (0, 'conform_query', None),
+        (0, 'load_target', 'FileNotFoundError'),
+        (1, 'parse_uri', None),
+        (1, 'conform_query', None),
+        (1, 'parse', None),
+        (1, 'construct', None),
+        (1, 'load_target', None),
+        (1, 'limit', None),
+    ]
+    assert events[0].uri == missing
+    assert events[5].uri == str(path)
+    assert events[5].bytes == len(mock_files['settings.yml'])
+    assert all(e.seconds >= 0 for e in events)
+    assert instrument.current() is None
+
+    del events[:]
+    with pytest.raises(IOError):
+        registry.load(missing)
+    with pytest.raises(RegistryError):
+        registry.load('nothing://here')
+    assert _phases(events) == [
+        (0, 'parse_uri', None),
+        (0, 'conform_query', None),
+        (0, 'load_target', 'FileNotFoundError'),
+        (0, 'parse_uri', 'NoProtocolError'),
+    ]
+
+
+def test_load_errors(registry, events, tmp_path):
+    path = tmp_path / 'broken.yml'
+    path.write_text('a: [1\n')
+    with pytest.raises(yamldict.yaml.YAMLError):
+        registry.load(str(path))
+    assert _phases(events)[-2:] == [
+        (0, 'parse', 'ParserError'),
+        (0, 'load_target', 'ParserError'),
+    ]
+
+
+def test_load_all_phases(registry, events, tmp_path):
+    path = tmp_path / 'fancy.yml'
+    path.write_text(mock_files['fancy.yml'])
+    assert len(registry.load_all(str(path))) == 3
+    phases = [e.phase for e in events]
+    assert phases.count('parse') == 3
+    assert phases.count('construct') == 3
+    parses = [e for e in events if e.phase == 'parse']
+    assert parses[0].bytes == len(mock_files['fancy.yml'])
+    assert parses[1].bytes is None
+
+    del events[:]
+    docs = registry.load_all(str(path), lazy=True)
+    assert docs[0].test.id1.name == 'hi'
+    assert [e.phase for e in events].count('construct') == 3
+
+
+def test_package_env(registry, events, mocker, monkeypatch):
+    monkeypatch.setattr(PackageExtension, 'persistence', LRUCache())
+    mocker.patch('pkgutil.get_data').return_value = b'a: 1\n'
+    registry.load('pkg://example')
+    assert [e.phase for e in events] == [
+        'parse_uri', 'conform_query', 'parse', 'construct', 'env',
+        'load_target',
+    ]
+
+
+def test_aload_phases(registry, events, tmp_path):
+    path = tmp_path / 'settings.yml'
+    path.write_text(mock_files['settings.yml'])
+    data = asyncio.run(registry.aload(str(path), fields=['config']))
+    assert list(data) == ['config']
+    assert [e.phase for e in events] == [
+        'parse_uri', 'conform_query', 'parse', 'construct', 'load_target',
+        'limit',
+    ]
+
+
+def test_hooks(registry, tmp_path, caplog):
+    path = tmp_path / 'settings.yml'
+    path.write_text(mock_files['settings.yml'])
+
+    def _broken(event):
+        raise ValueError(event)
+
+    collected = []
+    registry.add_hook(_broken)
+    registry.add_hook(collected.append)
+    with caplog.at_level(logging.ERROR):
+        registry.load(str(path))
+    assert len(collected) == 5
+    assert 'load hook' in caplog.text
+
+    registry.remove_hook(_broken)
+    registry.remove_hook(collected.append)
+    registry.load(str(path))
+    assert len(collected) == 5
+
+
+def test_phase_stats():
+    stats = instrument.PhaseStats(buckets=(0.001, 0.01))
+    attempt = instrument.Attempt((stats,), 'settings.yml', 0)
+    attempt.record('parse', 0.0005, 100)
+    attempt.record('parse', 0.005, 50)
+    attempt.record('parse', 0.5, None, 'ParserError')
+    attempt.record('load_target', 0.0001)
+    attempt.record('custom', 0.0001)
+
+    snapshot = stats.snapshot()
+    assert list(snapshot) == ['load_target', 'parse', 'custom']
+    assert snapshot['parse'] == {
+        'count': 3,
+        'errors': 1,
+        'seconds': 0.5055,
+        'bytes': 150,
+        'buckets': [(0.001, 1), (0.01, 2), (float('inf'), 3)],
+    }
+    text = stats.prometheus()
+    assert ('yamlsettings_load_phase_seconds_bucket{phase="parse",'
+            'le="+Inf"} 3') in text
+    assert 'yamlsettings_load_phase_errors_total{phase="parse"} 1' in text
+    assert 'yamlsettings_load_phase_bytes_total{phase="parse"} 150' in text
+
+    stats.reset()
+    assert stats.snapshot() == {}
+
+
+def test_phase_outside_load():
+    assert instrument.current() is None
+    with instrument.phase('env') as phase:
+        assert phase is None
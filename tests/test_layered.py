@@ -0,0 +1,146 @@
+"""Layered views over YAMLDicts, yamldict.LayeredYAMLDict
+
+"""
+import pytest
+
+from yamlsettings import yamldict
+from yamlsettings.yamldict import LayeredYAMLDict, YAMLDict
+
+from . import mock_files
+
+BASE = {
+    'config': {'greet': 'Hello', 'db': {'host': 'localhost', 'port': 1}},
+    'list': [1, 2],
+    'scalar': {'replaced': True},
+    'only_base': {'x': 1},
+}
+OVERRIDE = {
+    'config': {'greet': 'Hi', 'db': {'port': 2}, 'new': 1},
+    'list': [3],
+    'scalar': 'now a scalar',
+    'only_override': {'y': 2},
+}
+TOP = {
+    'config': {'db': {'user': 'root'}},
+    'scalar': {'dict': 'again'},
+}
+
+LAYER_FILES = [
+    ['defaults.yml', 'settings.yml'],
+    ['settings.yml', 'defaults.yml'],
+    ['single_fancy.yml', 'merge.yml', 'stupid.yml'],
+    ['merge.yml', 'merge.yml'],
+]
+
+
+def _merged(layers):
+    merged = YAMLDict()
+    for layer in layers:
+        merged.update(layer)
+    return merged
+
+
+def test_lookup_matches_update():
+    layers = [YAMLDict(BASE), YAMLDict(OVERRIDE), YAMLDict(TOP)]
+    view = LayeredYAMLDict(layers)
+    merged = _merged(layers)
+    assert view == merged
+    assert view.flatten() == merged
+    assert list(view) == list(merged)
+    assert list(view.config) == list(merged.config)
+    assert view.config.db.host == 'localhost'
+    assert view.config.db.user == 'root'
+    assert view.scalar == {'dict': 'again'}
+    assert view.list == [3]
+    assert yamldict.dump(view) == yamldict.dump(merged)
+    assert repr(view) == repr(merged)
+    with pytest.raises(KeyError):
+        view['missing']
+    with pytest.raises(AttributeError):
+        view.config.missing
+    assert 'only_base' in view and 'missing' not in view
+
+
+@pytest.mark.parametrize("names", LAYER_FILES)
+def test_loaded_layers(names):
+    layers = [yamldict.load(mock_files[name]) for name in names]
+    view = LayeredYAMLDict(layers)
+    # Values are the layers' own, aliases stay shared unlike with update
+    assert view == _merged(layers)
+    assert yamldict.dump(view.flatten()) == yamldict.dump(_merged(layers))
+
+
+def test_single_layer_subtrees():
+    base, override = YAMLDict(BASE), YAMLDict(OVERRIDE)
+    view = LayeredYAMLDict([base, override])
+    assert view.only_base is base.only_base
+    assert view.scalar is override.scalar
+    assert isinstance(view.config, LayeredYAMLDict)
+    # Memoised per path
+    assert view.config.db is view.config.db
+
+
+def test_layers_changes():
+    base = YAMLDict(BASE)
+    view = LayeredYAMLDict([base])
+    config = view.config
+    assert config is base.config
+
+    view.push_layer({'config': {'greet': 'Hi', 'db': {}}})
+    assert view.config.greet == 'Hi'
+    db = view.config.db
+    assert isinstance(db, LayeredYAMLDict)
+    view.replace_layer(1, YAMLDict({'config': {'db': {'port': 3}}}))
+    # Views taken before are looked up again
+    assert db.port == 3
+    assert dict(db) == {'host': 'localhost', 'port': 3}
+    assert view.config.greet == 'Hello'
+
+    base.config.db.host = 'remote'
+    assert db.host == 'localhost'
+    view.invalidate()
+    assert db.host == 'remote'
+
+    assert view.pop_layer() == {'config': {'db': {'port': 3}}}
+    assert db.port == 1
+    assert len(view.layers) == 1
+    view.replace_layer(0, {'config': 'gone'})
+    assert dict(db) == {}
+
+    view = LayeredYAMLDict([BASE, OVERRIDE])
+    with pytest.raises(TypeError):
+        view.config.push_layer({})
+
+
+def test_plain_dict_layers():
+    base = {'config': {'db': {'host': 'localhost'}}, 'list': [1]}
+    view = LayeredYAMLDict([base])
+    assert view.layers[0] is base
+    assert view.config.db.host == 'localhost'
+    assert view.list is base['list']
+
+    # Layers aren't copied, their changes are seen after invalidate()
+    base['config']['db']['host'] = 'remote'
+    base['config']['new'] = 1
+    view.invalidate()
+    assert view.config.db.host == 'remote'
+    assert dict(view.config) == {'db': {'host': 'remote'}, 'new': 1}
+    override = {'config': {'new': 2}}
+    view.push_layer(override)
+    override['config']['new'] = 3
+    view.invalidate()
+    assert view.config.new == 3
+    assert view.flatten() == {'config': {'db': {'host': 'remote'}, 'new': 3},
+                              'list': [1]}
+
+
+def test_flatten_copies():
+    base = YAMLDict(BASE)
+    view = LayeredYAMLDict([base, YAMLDict(OVERRIDE)])
+    flat = view.config.flatten()
+    assert flat == {'greet': 'Hi', 'db': {'host': 'localhost', 'port': 2},
+                    'new': 1}
+    flat.db.host = 'changed'
+    assert base.config.db.host == 'localhost'
+    assert type(view.flatten()) is YAMLDict
+    assert LayeredYAMLDict().flatten() == {}
@@ -0,0 +1,173 @@
+"""Lazily constructed documents, load(..., lazy=True)
+
+"""
+import copy
+import gc
+import json
+import pickle
+import weakref
+
+import pytest
+
+import yamlsettings
+from yamlsettings import yamldict
+
+from . import mock_files
+
+single_files = sorted(k for k in mock_files if k != 'fancy.yml')
+
+
+def _pending(data, key):
+    return type(dict.__getitem__(data, key)) is yamldict._Pending
+
+
+def test_values_constructed_on_access():
+    data = yamldict.load(mock_files['single_fancy.yml'], lazy=True)
+    assert isinstance(data, yamldict.LazyYAMLDict)
+    assert list(data.keys()) == ['test']
+    assert _pending(data, 'test')
+
+    test = data.test
+    assert not _pending(data, 'test')
+    assert data.test is test
+    assert list(test.keys()) == ['id1', 'id2', 'var_list', 'dict_var_mix',
+                                 'dict_with_list', 'greeting', 'crazy']
+    assert all(_pending(test, k) for k in test.keys())
+
+    assert test.greeting.introduce == 'Hello there'
+    assert not _pending(test, 'greeting')
+    assert _pending(test, 'crazy')
+
+
+def test_aliases_shared():
+    data = yamldict.load(mock_files['single_fancy.yml'], lazy=True)
+    assert data.test.var_list[0] is data.test.id1
+    assert data.test.dict_var_mix.b is data.test.id1
+
+    # Alias reached before its anchor
+    data = yamldict.load(mock_files['single_fancy.yml'], lazy=True)
+    assert data.test.dict_var_mix.b is data.test.id1
+
+
+def test_nodes_released():
+    data = yamldict.load(mock_files['merge.yml'], lazy=True)
+    node = dict.__getitem__(data, 'base').node
+    # Marks would be most of the memory held by pending nodes
+    assert node.start_mark is None and node.end_mark is None
+    released = weakref.ref(node)
+    del node
+
+    base = data.base
+    gc.collect()
+    # Still pending through the merge key
+    assert released() is not None
+    assert data.merged.config is base.config
+    gc.collect()
+    assert released() is None
+
+
+@pytest.mark.parametrize("name", single_files)
+def test_eager_parity(name):
+    eager = yamldict.load(mock_files[name])
+    lazy = yamldict.load(mock_files[name], lazy=True)
+    assert yamldict.dump(lazy) == yamldict.dump(eager)
+    assert str(yamldict.load(mock_files[name], lazy=True)) == str(eager)
+
+
+def test_merge_keys():
+    data = yamldict.load(mock_files['merge.yml'], lazy=True)
+    assert data.merged.whoami == 'merged'
+    assert data.merged.config.db == 'MySQL'
+    assert data.merged.config is data.base.config
+
+
+def test_transparent_materialisation():
+    source = mock_files['merge.yml']
+    eager = yamldict.load(source)
+
+    assert yamldict.load(source, lazy=True) == eager
+    assert eager == yamldict.load(source, lazy=True)
+    assert dict(yamldict.load(source, lazy=True)) == eager
+    assert repr(yamldict.load(source, lazy=True)) == repr(eager)
+    assert {**yamldict.load(source, lazy=True)} == eager
+    assert (json.dumps(yamldict.load(source, lazy=True)) ==
+            json.dumps(eager))
+    assert (list(yamldict.load(source, lazy=True).values()) ==
+            list(eager.values()))
+
+    data = yamldict.load(source, lazy=True)
+    clone = data.clone()
+    assert clone == eager
+    # Constructed by each copy on its own
+    assert _pending(data, 'merged')
+    clone.merged.config.db = 'changed'
+    assert data == eager
+    data.merged.whoami = 'changed'
+    assert clone.merged.whoami == 'merged'
+    assert clone.clone().merged.config.db == 'changed'
+
+    for copied in (pickle.loads(pickle.dumps(yamldict.load(source,
+                                                           lazy=True))),
+                   copy.deepcopy(yamldict.load(source, lazy=True))):
+        assert type(copied) is yamldict.YAMLDict
+        assert type(copied.merged) is yamldict.YAMLDict
+        assert copied == eager
+
+
+def test_dict_methods():
+    data = yamldict.load(mock_files['merge.yml'], lazy=True)
+    assert data.get('missing') is None
+    assert data.get('base').whoami == 'base'
+    assert data.setdefault('merged').whoami == 'merged'
+    assert data.pop('merged').whoami == 'merged'
+    assert data.popitem()[1].whoami == 'base'
+    assert data == {}
+    with pytest.raises(KeyError):
+        data['missing']
+    with pytest.raises(AttributeError):
+        data.missing
+
+
+def test_update_and_limit():
+    data = yamldict.load(mock_files['defaults.yml'], lazy=True)
+    data.update(yamldict.load(mock_files['settings.yml'], lazy=True))
+    assert data.config.greet == 'Hello'
+    assert data.config.secret == 'I have many secrets'
+    assert data.config_cool.greet == 'Sup...'
+
+    data = yamldict.load(mock_files['settings.yml'], lazy=True)
+    data.limit(['config'])
+    assert list(data.keys()) == ['config']
+    assert _pending(data, 'config')
+
+
+def test_load_all():
+    docs = list(yamldict.load_all(mock_files['fancy.yml'], lazy=True))
+    assert len(docs) == 3
+    assert all(isinstance(d, yamldict.LazyYAMLDict) for d in docs)
+    assert docs[0].test.test[0] is docs[0].test.id1
+    assert docs == list(yamldict.load_all(mock_files['fancy.yml']))
+
+
+def test_empty_document():
+    assert yamldict.load('', lazy=True) is None
+    assert yamldict.load('value', lazy=True) == 'value'
+
+
+def test_registry_lazy(tmp_path, monkeypatch):
+    monkeypatch.setattr(yamlsettings.registry, 'compiled_cache',
+                        yamlsettings.extensions.cache.CompiledCache(
+                            str(tmp_path / 'cache')))
+    single = tmp_path / 'single.yml'
+    single.write_text(mock_files['single_fancy.yml'])
+    fancy = tmp_path / 'fancy.yml'
+    fancy.write_text(mock_files['fancy.yml'])
+
+    data = yamlsettings.load(str(single), lazy=True)
+    assert isinstance(data, yamldict.LazyYAMLDict)
+    assert data.test.id1.name == 'hi'
+
+    docs = yamlsettings.load_all(str(fancy), lazy=True)
+    assert all(isinstance(d, yamldict.LazyYAMLDict) for d in docs)
+    # Lazy documents bypass the compiled cache
+    assert not (tmp_path / 'cache').exists()
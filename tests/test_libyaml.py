@@ -0,0 +1,174 @@
+"""Parity between the libyaml and the pure-Python loaders and dumpers
+
+"""
+import datetime
+import random
+
+import pytest
+import yaml
+
+from yamlsettings import yamldict
+
+from . import mock_files
+
+pytestmark = pytest.mark.skipif(not yamldict.HAS_LIBYAML,
+                                reason="PyYAML built without libyaml")
+
+single_files = sorted(k for k in mock_files if k != 'fancy.yml')
+
+
+def _shape(node):
+    """Types of every node in a loaded tree"""
+    if isinstance(node, dict):
+        return (type(node), [(k, _shape(v)) for k, v in node.items()])
+    if isinstance(node, (list, tuple)):
+        return (type(node), [_shape(v) for v in node])
+    return type(node)
+
+
+@pytest.fixture
+def restore_backend():
+    yield
+    yamldict.use_libyaml()
+
+
+@pytest.mark.parametrize("name", single_files)
+def test_load_parity(name):
+    py_data = yamldict.load(mock_files[name], Loader=yamldict.YAMLDictLoader)
+    c_data = yamldict.load(mock_files[name], Loader=yamldict.YAMLDictCLoader)
+    assert _shape(c_data) == _shape(py_data)
+    assert (yamldict.dump(c_data, Dumper=yamldict.YAMLDictDumper) ==
+            yamldict.dump(py_data, Dumper=yamldict.YAMLDictDumper))
+
+
+def test_load_all_parity():
+    py_data = list(yamldict.load_all(mock_files['fancy.yml'],
+                                     Loader=yamldict.YAMLDictLoader))
+    c_data = list(yamldict.load_all(mock_files['fancy.yml'],
+                                    Loader=yamldict.YAMLDictCLoader))
+    assert len(c_data) == len(py_data) == 3
+    assert _shape(c_data) == _shape(py_data)
+    # Anchors and aliases are shared objects with both loaders
+    assert c_data[0].test.test[0] is c_data[0].test.id1
+
+
+@pytest.mark.parametrize("name", single_files)
+@pytest.mark.parametrize("flow_style", [None, False, True])
+def test_dump_parity(name, flow_style):
+    data = yamldict.load(mock_files[name])
+    assert (yamldict.dump(data, Dumper=yamldict.YAMLDictCDumper,
+                          default_flow_style=flow_style) ==
+            yamldict.dump(data, Dumper=yamldict.YAMLDictDumper,
+                          default_flow_style=flow_style))
+
+
+@pytest.mark.parametrize("options", [
+    {}, {'default_flow_style': False}, {'allow_unicode': True},
+    {'width': 20}, {'indent': 4}, {'explicit_start': True},
+])
+def test_dump_scalar_parity(options):
+    data = yamldict.YAMLDict({
+        'empty': '', 'none': None, 'lines': 'multi\nline\n',
+        'long': 'x' * 100 + ' yy' * 50, 'unicode': u'caf\xe9',
+        'quote': "it's", 'dash': '- x', 'colon': ': y', 'number': '123',
+        'null': 'null', 'space': ' lead ', 'tab': '\ttab', 'hash': 'a #b',
+        'seq': [{'x': 1}, [1, [2]], []], 'map': {1: 2}, 'float': 1.5,
+        'inf': float('inf'), 'bool': True, 'tuple': (1, 2), 'set': {1},
+        'date': datetime.date(2020, 1, 1), 'bytes': b'bytes',
+    })
+    assert (yamldict.dump(data, Dumper=yamldict.YAMLDictCDumper, **options) ==
+            yamldict.dump(data, Dumper=yamldict.YAMLDictDumper, **options))
+
+
+@pytest.mark.parametrize("data", [
+    {'': 1}, {'a': {'': 1}}, {'': ''}, {'set': {''}},
+    {'emoji': u'\U0001F600'}, {u'\U0001F600': [u'x\U0001F600']},
+])
+@pytest.mark.parametrize("options", [
+    {}, {'allow_unicode': True}, {'default_flow_style': True},
+])
+def test_dump_fallback_parity(data, options):
+    # libyaml writes these differently, the pure-Python emitter is used
+    data = yamldict.YAMLDict(data)
+    assert (yamldict.dump(data, Dumper=yamldict.YAMLDictCDumper, **options) ==
+            yamldict.dump(data, Dumper=yamldict.YAMLDictDumper, **options))
+    assert (yamldict.dump_all([{'a': 1}, data],
+                              Dumper=yamldict.YAMLDictCDumper, **options) ==
+            yamldict.dump_all([{'a': 1}, data],
+                              Dumper=yamldict.YAMLDictDumper, **options))
+
+
+def _random_tree(rnd, depth=0):
+    """Random mapping, sequence or scalar, with the characters and long
+    strings libyaml writes differently"""
+    kind = rnd.random()
+    if depth > 3 or kind < 0.4:
+        choice = rnd.random()
+        if choice < 0.5:
+            chars = u'ab :-#\'"\n\t\\{}[],&*!|>%@`?.09\x85\xe9\x7f\x00' \
+                u'\u2028\U0001F600'
+            return u''.join(rnd.choice(chars)
+                            for _ in range(rnd.randint(0, 12)))
+        if choice < 0.7:
+            return ' '.join(['word'] * rnd.randint(1, 40))
+        return rnd.choice([None, True, False, 0, -3, 1.5, 1.0])
+    if kind < 0.7:
+        return {(_random_tree(rnd, 4) if rnd.random() < 0.3 else
+                 'k{0}'.format(i)): _random_tree(rnd, depth + 1)
+                for i in range(rnd.randint(0, 4))}
+    return [_random_tree(rnd, depth + 1) for _ in range(rnd.randint(0, 4))]
+
+
+@pytest.mark.parametrize("options", [
+    {}, {'allow_unicode': True}, {'default_flow_style': False},
+    {'default_flow_style': True}, {'canonical': True}, {'width': 20},
+    {'explicit_start': True},
+])
+def test_random_parity(options):
+    rnd = random.Random(repr(sorted(options.items())))
+    for _ in range(100):
+        data = _random_tree(rnd)
+        if rnd.random() < 0.7:
+            data = {'root': data}
+        # Default dumps are the pure-Python emitter's, whatever the loader
+        text = yamldict.dump(data, **options)
+        assert text == yamldict.dump(data, Dumper=yamldict.YAMLDictDumper,
+                                     **options)
+        # which both loaders read back the same
+        c_data = yamldict.load(text, Loader=yamldict.YAMLDictCLoader)
+        py_data = yamldict.load(text, Loader=yamldict.YAMLDictLoader)
+        assert _shape(c_data) == _shape(py_data)
+        assert c_data == py_data
+
+
+def test_dump_all_parity():
+    data = list(yamldict.load_all(mock_files['fancy.yml']))
+    assert (yamldict.dump_all(data, Dumper=yamldict.YAMLDictCDumper) ==
+            yamldict.dump_all(data, Dumper=yamldict.YAMLDictDumper))
+
+
+@pytest.mark.parametrize("loader", ["YAMLDictLoader", "YAMLDictCLoader"])
+def test_errors_parity(loader):
+    loader = getattr(yamldict, loader)
+    with pytest.raises(yaml.composer.ComposerError):
+        yamldict.load('---\na: 1\n---\nb: 2\n', Loader=loader)
+    with pytest.raises(yaml.constructor.ConstructorError):
+        yamldict.load('? [a, b]\n: 1\n', Loader=loader)
+
+
+def test_use_libyaml(restore_backend):
+    yamldict.use_libyaml(False)
+    assert isinstance(yamldict.load('a: 1'), yamldict.YAMLDict)
+    assert yamldict._Loader is yamldict.YAMLDictLoader
+
+    yamldict.use_libyaml(True)
+    assert isinstance(yamldict.load('a: 1'), yamldict.YAMLDict)
+    assert yamldict._Loader is yamldict.YAMLDictCLoader
+
+
+def test_use_libyaml_unavailable(restore_backend, monkeypatch):
+    monkeypatch.setattr(yamldict, 'HAS_LIBYAML', False)
+    yamldict.use_libyaml()
+    assert yamldict._Loader is yamldict.YAMLDictLoader
+    with pytest.raises(ImportError):
+        yamldict.use_libyaml(True)
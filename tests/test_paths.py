@@ -0,0 +1,102 @@
+"""Dotted key paths, YAMLDict.get_path/set_path/has_path and compile_path
+
+"""
+import pytest
+
+from yamlsettings import yamldict
+from yamlsettings.yamldict import YAMLDict, compile_path
+
+from . import mock_files
+
+TREE = {
+    'services': {
+        'billing': {
+            'endpoints': [{'timeout': i} for i in range(5)],
+            'name': 'billing',
+        },
+    },
+    'matrix': [[1, 2], [3, 4]],
+    'a.b': 'dotted key',
+    1: 'int key',
+}
+
+
+def test_get_path():
+    cfg = YAMLDict(TREE)
+    assert cfg.get_path('services.billing.endpoints[3].timeout') == 3
+    assert cfg.get_path('services.billing.endpoints.[3].timeout') == 3
+    assert cfg.get_path('services.billing.endpoints[-1]') == {'timeout': 4}
+    assert cfg.get_path('matrix[1][0]') == 3
+    assert cfg.get_path('services.billing') is cfg.services.billing
+    assert cfg.get_path('') is cfg
+    assert cfg.get_path('[1]') == 'int key'
+    assert cfg.get_path(['a.b']) == 'dotted key'
+    assert cfg.get_path(('services', 'billing', 'endpoints', 0)) == \
+        {'timeout': 0}
+
+    for missing in ('missing', 'services.missing.name',
+                    'services.billing.endpoints[9]',
+                    'services.billing.name.first',
+                    'services.billing.name[0].x', 'matrix.first', 'a.b'):
+        assert cfg.get_path(missing) is None
+        assert cfg.get_path(missing, 'default') == 'default'
+        assert not cfg.has_path(missing)
+    assert cfg.has_path('services.billing.endpoints[0]')
+
+
+def test_traverse_paths():
+    cfg = yamldict.load(mock_files['single_fancy.yml'])
+    seen = []
+
+    def _collect(path, node):
+        seen.append(list(path))
+        assert cfg.get_path(path) is node
+        assert cfg.get_path('.'.join(path)) is node
+
+    cfg.traverse(_collect)
+    assert ['test', 'var_list', '[0]'] in seen
+
+
+def test_set_path():
+    cfg = YAMLDict(TREE)
+    cfg.set_path('services.billing.endpoints[3].timeout', 30)
+    assert cfg.services.billing.endpoints[3].timeout == 30
+    cfg.set_path('services.search.endpoints', [{'timeout': 1}])
+    assert cfg.services.search.endpoints[0].timeout == 1
+    assert isinstance(cfg.services.search, YAMLDict)
+    value = {'nested': {'x': 1}}
+    cfg.set_path('new', value)
+    assert cfg.new.nested.x == 1 and cfg.new is not value
+
+    with pytest.raises(IndexError):
+        cfg.set_path('matrix[5].x', 1)
+    with pytest.raises(TypeError):
+        cfg.set_path('services.billing.name.first', 1)
+    with pytest.raises(ValueError):
+        cfg.set_path('', 1)
+
+
+def test_compile_path():
+    path = compile_path('services.billing.endpoints[3].timeout')
+    assert path is compile_path('services.billing.endpoints[3].timeout')
+    assert path.segments == ('services', 'billing', 'endpoints', 3,
+                             'timeout')
+    assert compile_path(['x', '[2]']).segments == ('x', 2)
+    assert path.get(YAMLDict(TREE)) == 3
+    assert path.get(TREE) == 3
+    assert path.exists(TREE)
+    for invalid in ('a..b', '.a', 'a.', 'a[b]', 'a[1', 'a]'):
+        with pytest.raises(ValueError):
+            compile_path(invalid)
+
+
+def test_lazy_and_layered():
+    cfg = yamldict.load(mock_files['single_fancy.yml'], lazy=True)
+    assert cfg.get_path('test.var_list[0].name') == 'hi'
+    cfg.set_path('test.greeting.introduce', 'Hey')
+    assert cfg.test.greeting.introduce == 'Hey'
+
+    view = yamldict.LayeredYAMLDict([TREE, {'matrix': [[0]]}])
+    assert view.get_path('services.billing.name') == 'billing'
+    assert view.get_path('matrix[0][0]') == 0
+    assert not view.has_path('matrix[1]')
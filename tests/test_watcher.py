@@ -0,0 +1,157 @@
+"""Reloading settings when their files change
+
+"""
+import threading
+
+import pytest
+
+from yamlsettings import watcher as watcher_module
+from yamlsettings.watcher import SettingsWatcher
+
+
+@pytest.fixture
+def files(tmp_path):
+    defaults = tmp_path / 'defaults.yml'
+    defaults.write_text('config:\n  greet: Hello\n  leave: Goodbye\n')
+    settings = tmp_path / 'settings.yml'
+    settings.write_text('config:\n  greet: Hi\n')
+    return defaults, settings
+
+
+def test_initial_merge(files, tmp_path):
+    defaults, settings = files
+    watcher = SettingsWatcher([str(defaults), str(settings),
+                               str(tmp_path / 'missing.yml')])
+    assert watcher.settings == {'config': {'greet': 'Hi', 'leave': 'Goodbye'}}
+    assert watcher.check() == []
+
+    with pytest.raises(IOError):
+        SettingsWatcher(str(tmp_path / 'missing.yml'))
+
+
+def test_check_reloads_changed(files, monkeypatch):
+    defaults, settings = files
+    watcher = SettingsWatcher([str(defaults), str(settings)])
+    before = watcher.settings
+    notified = []
+    watcher.subscribe(lambda s, paths: notified.append((s, paths)))
+
+    loads = []
+    load = watcher.registry.load
+    monkeypatch.setattr(watcher.registry, 'load',
+                        lambda uri: loads.append(uri) or load(uri))
+
+    settings.write_text('config:\n  greet: Howdy\nextra: [1]\n')
+    assert watcher.check() == [('config', 'greet'), ('extra',)]
+    # Only the changed file was parsed again
+    assert loads == [str(settings)]
+    assert watcher.settings == {'config': {'greet': 'Howdy',
+                                           'leave': 'Goodbye'},
+                                'extra': [1]}
+    assert notified == [(watcher.settings, [('config', 'greet'),
+                                            ('extra',)])]
+    # The previous snapshot is untouched
+    assert before == {'config': {'greet': 'Hi', 'leave': 'Goodbye'}}
+
+    settings.unlink()
+    # Removed keys come first
+    assert watcher.check() == [('extra',), ('config', 'greet')]
+    assert watcher.settings.config.greet == 'Hello'
+
+
+def test_unchanged_contents_not_notified(files):
+    defaults, settings = files
+    watcher = SettingsWatcher([str(defaults), str(settings)])
+    before = watcher.settings
+    notified = []
+    watcher.subscribe(notified.append)
+    settings.write_text('config:\n  greet: Hi\n# same\n')
+    assert watcher.check() == []
+    assert watcher.settings == before
+    assert notified == []
+
+    # Changes diff doesn't report are still reloaded
+    defaults.write_text('config:\n  leave: Goodbye\n  greet: Hello\n')
+    assert watcher.check() == []
+    assert list(watcher.settings.config) == ['leave', 'greet']
+    assert notified == []
+
+
+def test_type_change_reloaded(files):
+    defaults, settings = files
+    settings.write_text('debug: 0\n')
+    watcher = SettingsWatcher([str(defaults), str(settings)])
+    settings.write_text('debug: false\n')
+    assert watcher.check() == [('debug',)]
+    assert watcher.settings.debug is False
+
+
+def test_env_reapplied(files, monkeypatch):
+    defaults, settings = files
+    monkeypatch.setenv('APP_CONFIG_LEAVE', 'Bye')
+    watcher = SettingsWatcher([str(defaults), str(settings)], env=True,
+                              prefix='app')
+    assert watcher.settings.config.leave == 'Bye'
+    defaults.write_text('config:\n  greet: Hello\n  leave: Later\n  x: 1\n')
+    assert watcher.check() == [('config', 'x')]
+    assert watcher.settings.config.leave == 'Bye'
+
+
+def test_bad_reload_keeps_previous(files):
+    defaults, settings = files
+    watcher = SettingsWatcher([str(defaults), str(settings)])
+    settings.write_text('config: [unclosed\n')
+    assert watcher.check() == []
+    assert watcher.settings.config.greet == 'Hi'
+
+
+def test_subscriber_errors_logged(files, caplog):
+    defaults, settings = files
+    watcher = SettingsWatcher([str(defaults), str(settings)])
+    calls = []
+
+    @watcher.subscribe
+    def failing(settings, paths):
+        raise ValueError('boom')
+
+    watcher.subscribe(lambda s, paths: calls.append(paths))
+    settings.write_text('config:\n  greet: Yo\n')
+    assert watcher.check() == [('config', 'greet')]
+    assert calls == [[('config', 'greet')]]
+    assert 'subscriber' in caplog.text
+
+    watcher.unsubscribe(failing)
+
+
+def test_polling_thread(files):
+    defaults, settings = files
+    changed = threading.Event()
+    with SettingsWatcher([str(defaults), str(settings)], interval=0.01,
+                         debounce=0.01, use_inotify=False) as watcher:
+        watcher.subscribe(lambda s, paths: changed.set())
+        settings.write_text('config:\n  greet: Polled\n')
+        assert changed.wait(5)
+    assert watcher.settings.config.greet == 'Polled'
+    assert watcher._thread is None
+
+
+def test_inotify_unavailable(files, monkeypatch):
+    monkeypatch.setattr(watcher_module, 'HAS_INOTIFY', False)
+    with pytest.raises(ImportError):
+        SettingsWatcher(str(files[0]), use_inotify=True)
+    assert not SettingsWatcher(str(files[0])).use_inotify
+
+
+def test_subscribe_ops(files):
+    defaults, settings = files
+    watcher = SettingsWatcher([str(defaults), str(settings)])
+    replica = watcher.settings.clone()
+    received = []
+    watcher.subscribe(lambda s, ops: received.extend(ops), ops=True)
+
+    settings.write_text('config:\n  greet: Howdy\nextra: [1]\n')
+    watcher.check()
+    assert received == [('replace', ('config', 'greet'), 'Howdy'),
+                        ('add', ('extra',), [1], 1)]
+    replica.apply_patch(received)
+    assert replica == watcher.settings
@@ -8,6 +8,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import mock
+import pickle
 import unittest
 
 from mock import mock_open
@@ -228,6 +229,217 @@ class YamlDictTestCase(unittest.TestCase):
         test_defaults.update({'a': (4,)})
         self.assertEqual(test_defaults.a, (4,))
 
+    def test_nested_conversion(self):
+        inner = yamldict.YAMLDict({'c': 1})
+        test_dict = yamldict.YAMLDict({
+            'a': {'b': [{'x': 1}, ({'y': 2},)]},
+            'inner': inner,
+        })
+        self.assertIsInstance(test_dict.a, yamldict.YAMLDict)
+        self.assertIsInstance(test_dict.a.b[0], yamldict.YAMLDict)
+        self.assertIsInstance(test_dict.a.b[1], tuple)
+        self.assertIsInstance(test_dict.a.b[1][0], yamldict.YAMLDict)
+        # Nested YAMLDicts are kept, not rebuilt
+        self.assertIs(test_dict.inner, inner)
+
+        test_clone = test_dict.clone()
+        self.assertEqual(test_clone, test_dict)
+        self.assertIsNot(test_clone.inner, inner)
+        self.assertIsNot(test_clone.a.b, test_dict.a.b)
+        test_clone.a.b[0].x = 2
+        self.assertEqual(test_dict.a.b[0].x, 1)
+
+    def test_rebase_nested(self):
+        base = yamldict.YAMLDict({'a': {'b': 1, 'c': {'d': 1}}, 'l': [1]})
+        test_dict = yamldict.YAMLDict({'a': {'c': {'e': 2}}, 'f': 3})
+        test_dict.rebase(base)
+        self.assertEqual(test_dict, {
+            'a': {'b': 1, 'c': {'d': 1, 'e': 2}}, 'l': [1], 'f': 3,
+        })
+        self.assertEqual(list(test_dict), ['a', 'l', 'f'])
+        # The base is left untouched
+        self.assertEqual(base.a.c, {'d': 1})
+        test_dict.l.append(2)
+        self.assertEqual(base.l, [1])
+
+    def test_compact_representation(self):
+        test_settings = load('merge.yml')
+        # No per-node attribute dictionary
+        self.assertFalse(hasattr(test_settings, '__dict__'))
+        self.assertEqual(list(test_settings.merged), ['config', 'whoami'])
+
+        test_copy = test_settings.copy()
+        self.assertIsInstance(test_copy, yamldict.YAMLDict)
+        self.assertIs(test_copy.base, test_settings.base)
+
+        test_pickle = pickle.loads(pickle.dumps(test_settings))
+        self.assertIsInstance(test_pickle.base, yamldict.YAMLDict)
+        self.assertEqual(test_pickle, test_settings)
+        self.assertEqual(str(test_pickle), str(test_settings))
+
+    def test_clone_copy_on_write(self):
+        test_dict = yamldict.YAMLDict({
+            'a': {'b': {'c': 1}, 'l': [{'x': 1}]},
+            'd': {'e': 1},
+            'f': 1,
+        })
+        test_clone = test_dict.clone(shared=True)
+        # Clones of a shared clone share its snapshots until they're read
+        test_copy = test_clone.clone()
+        self.assertIs(dict.__getitem__(test_copy, 'd'),
+                      dict.__getitem__(test_clone, 'd'))
+        test_copy.d.e = 2
+        self.assertEqual(test_clone.d.e, 1)
+
+        test_clone.a.b.c = 2
+        test_clone.a.l[0].x = 2
+        test_clone.f = 2
+        self.assertEqual(test_dict, {
+            'a': {'b': {'c': 1}, 'l': [{'x': 1}]}, 'd': {'e': 1}, 'f': 1,
+        })
+        test_dict.d.e = 3
+        del test_dict.a['b']
+        self.assertEqual(test_clone, {
+            'a': {'b': {'c': 2}, 'l': [{'x': 2}]}, 'd': {'e': 1}, 'f': 2,
+        })
+        self.assertEqual(yamldict.dump(test_clone.clone().clone()),
+                         yamldict.dump(test_clone))
+
+        test_pickle = pickle.loads(pickle.dumps(test_clone))
+        self.assertIs(type(test_pickle), yamldict.YAMLDict)
+        self.assertIs(type(test_pickle.a), yamldict.YAMLDict)
+        self.assertEqual(test_pickle, test_clone)
+        self.assertEqual(dict(test_clone)['d'], {'e': 1})
+
+    def test_clone_leaves_source(self):
+        test_dict = yamldict.YAMLDict({'a': {'x': 1}, 'b': [1], 'c': 1})
+        inner = test_dict.a
+        values = iter(test_dict.values())
+        items = iter(test_dict.items())
+        test_clone = test_dict.clone()
+        self.assertIs(type(test_dict), yamldict.YAMLDict)
+        self.assertIs(type(test_clone.a), yamldict.YAMLDict)
+        # Iterators taken before yield the values themselves
+        self.assertIs(next(values), inner)
+        self.assertEqual(list(values), [[1], 1])
+        self.assertEqual(next(items), ('a', inner))
+        # References taken before stay the source's own values
+        self.assertIs(test_dict.a, inner)
+        inner.x = 2
+        test_dict.b.append(2)
+        self.assertEqual(test_clone, {'a': {'x': 1}, 'b': [1], 'c': 1})
+        test_clone.a.x = 3
+        self.assertEqual(inner.x, 2)
+        self.assertIs(test_dict.a, inner)
+
+    def test_rebase_leaves_base(self):
+        base = yamldict.YAMLDict({'a': {'x': 1, 'y': 1}, 'b': {'z': 1}})
+        inner = base.b
+        values = iter(base.values())
+        test_dict = yamldict.YAMLDict({'a': {'y': 2}})
+        test_dict.rebase(base)
+        self.assertIs(type(base), yamldict.YAMLDict)
+        self.assertEqual(list(values), [{'x': 1, 'y': 1}, inner])
+        self.assertIs(base.b, inner)
+        inner.z = 2
+        self.assertEqual(test_dict, {'a': {'x': 1, 'y': 2}, 'b': {'z': 1}})
+        test_dict.b.z = 3
+        self.assertEqual(base, {'a': {'x': 1, 'y': 1}, 'b': {'z': 2}})
+
+    def test_clone_subclass(self):
+        class Settings(yamldict.YAMLDict):
+            __slots__ = ()
+
+        test_dict = Settings({'a': {'b': 1}})
+        test_clone = test_dict.clone()
+        test_clone.a.b = 2
+        self.assertIs(type(test_dict), Settings)
+        self.assertEqual(test_dict.a.b, 1)
+
+    def test_rebase_shares_base(self):
+        base = yamldict.YAMLDict({
+            'sec{0}'.format(i): {'k': i, 'n': {'m': i}} for i in range(10)
+        })
+        shared = base.clone(shared=True)
+        tenants = []
+        for i in range(3):
+            tenant = yamldict.YAMLDict({'sec1': {'n': {'m': 'tenant'}}})
+            tenant.rebase(shared)
+            tenants.append(tenant)
+        # Only the top level of the sections the tenants don't override
+        # is copied
+        self.assertIs(dict.__getitem__(tenants[0].sec2, 'n'),
+                      dict.__getitem__(tenants[1].sec2, 'n'))
+        self.assertIs(type(tenants[0]), yamldict.YAMLDict)
+
+        tenants[0].sec2.k = 'changed'
+        for tenant in tenants:
+            self.assertEqual(tenant.sec1, {'k': 1, 'n': {'m': 'tenant'}})
+        self.assertEqual(tenants[1].sec2.k, 2)
+        self.assertEqual(base.sec1, {'k': 1, 'n': {'m': 1}})
+        self.assertEqual(list(tenants[2]), list(base))
+
+    def test_traverse(self):
+        class Watched(yamldict.YAMLDict):
+            __slots__ = ()
+            written = []
+
+            def __setitem__(self, k, v):
+                self.written.append(k)
+                super(Watched, self).__setitem__(k, v)
+
+        test_dict = Watched({'a': Watched({'b': 1, 'c': [1, {'d': 2}]}),
+                             'e': Watched({'f': 3}), 'g': 4})
+        Watched.written = []
+        visited = []
+
+        def _visit(path, node):
+            visited.append(list(path))
+            if path == ['e']:
+                return yamldict.SKIP
+            if path == ['a', 'b']:
+                return 'replaced'
+            if path == ['g']:
+                return node
+
+        test_dict.traverse(_visit)
+        self.assertEqual(visited, [
+            [], ['a'], ['a', 'b'], ['a', 'c'], ['a', 'c', '[0]'],
+            ['a', 'c', '[1]'], ['a', 'c', '[1]', 'd'], ['e'], ['g'],
+        ])
+        self.assertEqual(test_dict.a.b, 'replaced')
+        # Only the changed node is written back
+        self.assertEqual(Watched.written, ['b'])
+
+        paths = []
+        test_dict.traverse(lambda path, node: paths.append(path),
+                           tuple_paths=True)
+        self.assertEqual(paths[:6], [
+            (), ('a',), ('a', 'b'), ('a', 'c'), ('a', 'c', 0),
+            ('a', 'c', 1),
+        ])
+
+        test_list = yamldict.YAMLDict({'l': list(range(20))})
+        test_list.traverse(lambda path, node:
+                           node * 2 if path[-1:] == ['[15]'] else None)
+        self.assertEqual(test_list.l[15], 30)
+        test_list.traverse(lambda path, node: 'root')
+        self.assertEqual(test_list.l[15], 30)
+
+    def test_walk(self):
+        test_dict = yamldict.YAMLDict({'a': {'b': [1, {'c': 2}]}, 'd': 3})
+        self.assertEqual(list(test_dict.walk()), [
+            ((), test_dict),
+            (('a',), test_dict.a),
+            (('a', 'b'), [1, {'c': 2}]),
+            (('a', 'b', 0), 1),
+            (('a', 'b', 1), {'c': 2}),
+            (('a', 'b', 1, 'c'), 2),
+            (('d',), 3),
+        ])
+        for path, node in test_dict.walk():
+            self.assertIs(test_dict.get_path(path), node)
+
     @mock.patch.dict('os.environ', {'FOO_BAR': 'new-baz'})
     def test_dash_vars_with_env(self):
         """Test items with dashes can be overritten with env"""
@@ -4,6 +4,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
+__version__ = '2.1.2'
+
 from yamlsettings import yamldict
 from yamlsettings.helpers import (
     save,
@@ -16,14 +18,23 @@ from yamlsettings.extensions import (
     registry,
     RegistryError,
 )
+from yamlsettings.watcher import SettingsWatcher
 
 load = registry.load
 load_all = registry.load_all
+load_merged = registry.load_merged
+aload = registry.aload
+aload_all = registry.aload_all
+aload_merged = registry.aload_merged
 
 __all__ = [
     'yamldict',
     'load',
     'load_all',
+    'load_merged',
+    'aload',
+    'aload_all',
+    'aload_merged',
     'save',
     'save_all',
     'update_from_file',
@@ -31,4 +42,5 @@ __all__ = [
     'YamlSettings',
     'registry',
     'RegistryError',
+    'SettingsWatcher',
 ]
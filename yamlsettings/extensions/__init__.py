@@ -6,6 +6,8 @@ Proposed types:
       each://defaults.yaml|settings.yaml|more.yaml
 
 """
+import os
+
 from yamlsettings.extensions.local import LocalExtension
 from yamlsettings.extensions.package import PackageExtension
 from yamlsettings.extensions.registry import ExtensionRegistry, RegistryError
@@ -13,6 +15,6 @@ from yamlsettings.extensions.registry import ExtensionRegistry, RegistryError
 registry = ExtensionRegistry([
     LocalExtension,
     PackageExtension,
-])
+], cache_dir=os.environ.get('YAMLSETTINGS_CACHE_DIR'))
 
 __all__ = ['registry', 'RegistryError']
@@ -1,4 +1,6 @@
 """Base extension interface"""
+import types
+
 import yaml
 
 from six.moves.urllib.parse import parse_qs
@@ -37,6 +39,20 @@ class YamlSettingsExtension:
 
         return query
 
+    @classmethod
+    def target_token(cls, scheme, path, fragment, username,
+                     password, hostname, port, query):
+        """Override this method to give the registry's negative cache a
+        cheap token that changes whenever the target may have appeared,
+        e.g. the mtime of its directory. It's taken after the target
+        failed to open.
+
+        :returns: hashable token, or None to only remember missing targets
+            for the negative cache's ttl
+
+        """
+        return None
+
     @classmethod
     def load_target(cls, scheme, path, fragment, username,
                     password, hostname, port, query,
@@ -46,3 +62,31 @@ class YamlSettingsExtension:
 
         """
         raise NotImplementedError("load_target must be overridden")
+
+    @classmethod
+    async def aload_target(cls, scheme, path, fragment, username,
+                           password, hostname, port, query,
+                           load_method, **kwargs):
+        """Coroutine version of load_target, used by the registry's aload
+        methods. Override it for sources with asyncio clients, by default
+        load_target runs in the event loop's default executor.
+
+        """
+        # Imported on first use, asyncio is slow to import
+        import asyncio
+        import contextvars
+
+        def _load_target():
+            yaml_contents = cls.load_target(
+                scheme, path, fragment, username, password, hostname, port,
+                query, load_method, **kwargs
+            )
+            # Load all returns a generator, parse it off the loop as well
+            if isinstance(yaml_contents, types.GeneratorType):
+                yaml_contents = list(yaml_contents)
+            return yaml_contents
+
+        loop = asyncio.get_running_loop()
+        # In the caller's context, which tells instrumented loads apart
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, context.run, _load_target)
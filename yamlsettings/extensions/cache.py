@@ -0,0 +1,553 @@
+"""Caches shared by the registry and extensions
+
+The on-disk caches import pickle, hashlib, tempfile and json when they're
+first used, most processes never enable them.
+
+"""
+import collections
+import copy
+import functools
+import os
+import sys
+import threading
+import time
+import types
+import warnings
+from stat import S_IWGRP, S_IWOTH
+
+import yamlsettings
+from yamlsettings.yamldict import YAMLDict
+
+
+def copy_contents(data):
+    """Cheap private copy of a cached parse result"""
+    if isinstance(data, YAMLDict):
+        return data.clone()
+    return copy.deepcopy(data)
+
+
+class LRUCache(object):
+
+    def __init__(self, maxsize=128, maxbytes=None):
+        """A thread safe least recently used cache
+
+        :param maxsize: Maximum number of entries, None for no limit
+        :param maxbytes: Maximum total size of the entries, None for no limit
+        :type maxsize: int
+        :type maxbytes: int
+
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as recently used
+
+        :param key: cache key
+        :param default: value returned when key isn't cached
+        :returns: cached value or default
+
+        """
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        """Store value under key, evicting the least recently used entries
+        until the cache fits its bounds again.
+
+        :param key: cache key
+        :param value: value to store
+        :param size: size of the value counted against maxbytes
+        :type size: int
+
+        """
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                # Would evict everything else and still not fit
+                return
+            self._data[key] = (value, size)
+            self.bytes += size
+            while ((self.maxsize is not None and
+                    len(self._data) > self.maxsize) or
+                   (self.maxbytes is not None and
+                    self.bytes > self.maxbytes)):
+                self._pop(next(iter(self._data)))
+
+    def invalidate(self, key):
+        """Remove key from the cache, if present"""
+        with self._lock:
+            self._pop(key)
+
+    def invalidate_where(self, predicate):
+        """Remove every key for which predicate(key) is true
+
+        :returns: number of entries removed
+
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._pop(key)
+        return len(keys)
+
+    def clear(self):
+        """Remove every entry and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Snapshot of the cache counters
+
+        :returns: dict with hits, misses, entries and bytes
+
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._data),
+            'bytes': self.bytes,
+        }
+
+    def __getstate__(self):
+        # Entries are process local, copies (e.g. sent to a process pool)
+        # start empty
+        return {'maxsize': self.maxsize, 'maxbytes': self.maxbytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _pop(self, key):
+        try:
+            _, size = self._data.pop(key)
+        except KeyError:
+            return
+        self.bytes -= size
+
+
+class NegativeCache(object):
+
+    def __init__(self, ttl=1.0, maxsize=1024):
+        """Remembers targets that weren't found, so fallback chains can skip
+        them without trying to open them again.
+
+        A missing target is trusted for ttl seconds without any check.
+        After that, when its extension gives a token (see
+        YamlSettingsExtension.target_token), e.g. the mtime of its
+        directory, it's kept for another ttl as long as the token is
+        unchanged; otherwise it's tried again.
+
+        Tokens are taken after a target failed to open, so a target
+        appearing in between could go unnoticed. A token is only trusted
+        once a second failure found it unchanged, the first time the ttl
+        runs out the target is simply tried again.
+
+        :param ttl: Seconds to trust a missing target without checking its
+            token, 0 to always check it
+        :param maxsize: Maximum number of targets remembered
+        :type ttl: float
+        :type maxsize: int
+
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._missing = LRUCache(maxsize=maxsize)
+
+    def __len__(self):
+        return len(self._missing)
+
+    def is_missing(self, key, get_token):
+        """Whether key was found missing, and still is as far as the ttl or
+        its token tell
+
+        :param key: target key
+        :param get_token: callable returning the current token of the
+            target, only called once the ttl has run out
+
+        """
+        entry = self._missing.get(key)
+        if entry is not None:
+            token, expires, confirmed = entry
+            now = time.monotonic()
+            if now < expires or (confirmed and get_token() == token):
+                if now >= expires:
+                    self._missing.set(key, (token, now + self.ttl, True))
+                self.hits += 1
+                return True
+            if confirmed:
+                self._missing.invalidate(key)
+            # else kept, for add to confirm its token
+        self.misses += 1
+        return False
+
+    def add(self, key, token):
+        """Remember key as missing
+
+        :param key: target key
+        :param token: token of the target taken after it failed to open,
+            or None
+
+        """
+        if token is None and not self.ttl:
+            return
+        entry = self._missing.get(key)
+        confirmed = (token is not None and entry is not None and
+                     entry[0] == token)
+        self._missing.set(key, (token, time.monotonic() + self.ttl,
+                                confirmed))
+
+    def invalidate(self, key):
+        """Forget key, if it was remembered"""
+        self._missing.invalidate(key)
+
+    def clear(self):
+        """Forget every target and reset the counters"""
+        self._missing.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Snapshot of the cache counters
+
+        :returns: dict with hits, misses and entries
+
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._missing),
+        }
+
+
+def _method_name(load_method):
+    """Stable name of a load method, used in on-disk cache keys"""
+    if isinstance(load_method, functools.partial):
+        return '{0}({1!r}, {2!r})'.format(
+            _method_name(load_method.func),
+            load_method.args,
+            sorted(load_method.keywords.items()),
+        )
+    return '{0}.{1}'.format(load_method.__module__,
+                            load_method.__qualname__)
+
+
+class CompiledCache(object):
+    """On-disk cache of parsed yaml documents.
+
+    Entries are pickles named after a hash of the yaml source, the load
+    method, the yamlsettings version and the python implementation, so a
+    changed source or upgrade simply misses. Entries are written to a
+    temporary file and renamed into place, so concurrent processes never
+    see partial files, and unreadable entries are treated as misses.
+
+    Entries are unpickled, so the directory is only used when it's owned
+    by the current user and not writable by anyone else (it's created with
+    mode 0700), and so is every entry read. Otherwise the cache is disabled
+    with a warning.
+
+    Every write prunes the entries not used for max_age seconds, then the
+    least recently used ones above max_entries.
+
+    """
+    format_version = 1
+    pickle_protocol = 4
+    suffix = '.ysc'
+
+    def __init__(self, cache_dir, max_entries=1024, max_age=7 * 24 * 3600):
+        """
+        :param cache_dir: Directory holding the cache entries, it's created
+            when the first entry is written.
+        :param max_entries: Maximum number of entries kept
+        :param max_age: Seconds an unused entry is kept
+        :type cache_dir: string
+        :type max_entries: int
+        :type max_age: float
+
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._wrappers = {}
+        # None until the directory has been checked
+        self._trusted = None
+
+    def wrap(self, load_method):
+        """Return load_method reading through this cache.
+
+        The same wrapper is returned for the same load_method, so it can be
+        used as part of in-process cache keys.
+
+        """
+        try:
+            return self._wrappers[load_method]
+        except KeyError:
+            wrapper = functools.partial(self.load, load_method)
+            return self._wrappers.setdefault(load_method, wrapper)
+
+    def load(self, load_method, stream):
+        """Load stream with load_method, or from the cache when possible
+
+        :param load_method: yamldict.load or yamldict.load_all
+        :param stream: yaml string, bytes or file object
+        :returns: result of load_method, load_all results are returned as
+            a generator
+
+        """
+        source = stream.read() if hasattr(stream, 'read') else stream
+        if not self._check_directory():
+            self.misses += 1
+            return load_method(source)
+        key = self.key(load_method, source)
+        path = os.path.join(self.cache_dir, key + self.suffix)
+
+        found, many, yaml_contents = self._read(path, key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+            yaml_contents = load_method(source)
+            # Load all returns a generator list of configurations
+            many = isinstance(yaml_contents, types.GeneratorType)
+            yaml_contents = list(yaml_contents) if many else yaml_contents
+            if self._write(path, key, many, yaml_contents):
+                self.prune()
+
+        if many:
+            return (contents for contents in yaml_contents)
+        return yaml_contents
+
+    def key(self, load_method, source):
+        """Cache key for source parsed by load_method"""
+        import hashlib
+
+        if not isinstance(source, bytes):
+            source = source.encode('utf-8')
+        digest = hashlib.sha256()
+        header = '{0}\0{1}\0{2}\0{3}\0'.format(
+            self.format_version,
+            yamlsettings.__version__,
+            sys.implementation.cache_tag,
+            _method_name(load_method),
+        )
+        digest.update(header.encode('utf-8'))
+        digest.update(source)
+        return digest.hexdigest()
+
+    def clear(self):
+        """Remove every cache entry"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(self.suffix):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def prune(self):
+        """Remove the entries unused for max_age seconds, then the least
+        recently used ones above max_entries"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        entries = []
+        expired = time.time() - self.max_age
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            entries.append((mtime, path))
+        entries.sort(reverse=True)
+        for index, (mtime, path) in enumerate(entries):
+            if index >= self.max_entries or mtime < expired:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _check_directory(self):
+        """Whether the cache directory can be trusted, creating it when
+        it's missing"""
+        if self._trusted is None:
+            try:
+                os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+                self._trusted = _private(os.stat(self.cache_dir))
+            except OSError:
+                self._trusted = False
+            if not self._trusted:
+                warnings.warn(
+                    'yamlsettings compiled cache disabled: {0} must be a '
+                    'directory owned by the current user and only writable '
+                    'by it'.format(self.cache_dir), RuntimeWarning)
+        return self._trusted
+
+    def _read(self, path, key):
+        import pickle
+
+        try:
+            with open(path, 'rb') as handle:
+                if not _private(os.fstat(handle.fileno())):
+                    return False, False, None
+                stored_key, many, yaml_contents = pickle.load(handle)
+        except Exception:
+            # Missing, corrupt or incompatible entry, rebuild it
+            return False, False, None
+        if stored_key != key:
+            return False, False, None
+        try:
+            # Recently used entries are pruned last
+            os.utime(path)
+        except OSError:
+            pass
+        return True, many, yaml_contents
+
+    def _write(self, path, key, many, yaml_contents):
+        """Write an entry, returns whether it was written"""
+        import pickle
+        import tempfile
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                            prefix='.tmp-')
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                pickle.dump((key, many, yaml_contents), handle,
+                            protocol=self.pickle_protocol)
+            os.replace(tmp_path, path)
+        except Exception:
+            # Unpicklable contents (e.g. !!python/module) or a full disk,
+            # the loaded value is still returned, just not cached.
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+
+def _private(stat):
+    """Whether stat is of a file owned by the current user (or root), and
+    not writable by group or others. Always true without owners (Windows).
+    """
+    if not hasattr(os, 'geteuid'):
+        return True
+    return (stat.st_uid in (os.geteuid(), 0) and
+            not stat.st_mode & (S_IWGRP | S_IWOTH))
+
+
+class DiscoveryCache(object):
+    """On-disk cache of the entry points found by extension discovery.
+
+    Scanning the metadata of every installed distribution is slow in large
+    environments. The entry points found are saved with a fingerprint of
+    the import path, the directories on sys.path and their mtimes, which
+    change when distributions are installed or removed.
+
+    """
+    format_version = 1
+    filename = 'discovery.json'
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: Directory holding the cache file, it's created
+            when the file is written.
+        :type cache_dir: string
+
+        """
+        self.path = os.path.join(cache_dir, self.filename)
+
+    @staticmethod
+    def fingerprint():
+        """Fingerprint of the installed distributions"""
+        import hashlib
+
+        digest = hashlib.sha256()
+        for entry in sys.path:
+            try:
+                mtime = os.stat(entry or '.').st_mtime_ns
+            except OSError:
+                mtime = None
+            digest.update('{0}\0{1}\0'.format(entry, mtime).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, group):
+        """Entry points of group saved for the current fingerprint
+
+        :returns: list of (name, value) pairs, None when not cached
+
+        """
+        import json
+
+        try:
+            with open(self.path) as handle:
+                stored = json.load(handle)
+            if (stored['format'] == self.format_version and
+                    stored['fingerprint'] == self.fingerprint()):
+                return [tuple(point) for point in stored['groups'][group]]
+        except Exception:
+            # Missing, corrupt or from another environment
+            pass
+        return None
+
+    def set(self, group, points):
+        """Save the entry points of group for the current fingerprint
+
+        :param points: list of (name, value) pairs
+
+        """
+        import json
+        import tempfile
+
+        stored = {
+            'format': self.format_version,
+            'fingerprint': self.fingerprint(),
+            'groups': {group: [list(point) for point in points]},
+        }
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(stored, handle)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -1,19 +1,43 @@
 """Load a yaml from from the local filesystem"""
+import os
+import types
+
 from yamlsettings.extensions.base import YamlSettingsExtension
+from yamlsettings.extensions.cache import LRUCache, copy_contents
 
 
 class LocalExtension(YamlSettingsExtension):
     """Local filesystem, works with any valid system path. This
     is the default and will be used if you don't include the scheme.
 
+    Args:
+      cache: When set the parsed file is kept in LocalExtension.cache and
+        reused until the file changes. (default: false)
+
     examples:
       * file://relative/foo/bar/baz.txt (opens a relative file)
       * file:///home/user (opens a directory from a absolute path)
       * foo/bar.baz (file:// is the default)
+      * settings.yml?cache=true (reuses the parsed file while unchanged)
 
     """
     protocols = ['file']
-    default_query = {}
+    default_query = {
+        'cache': False,
+    }
+    # Parsed files, keyed by path, inode, mtime and size. The size budget
+    # is counted in bytes of source yaml.
+    cache = LRUCache(maxsize=64, maxbytes=64 * 1024 * 1024)
+
+    @classmethod
+    def target_token(cls, scheme, path, fragment, username,
+                     password, hostname, port, query):
+        # Creating or renaming the file into place changes its directory
+        full_path = (hostname or '') + path
+        try:
+            return os.stat(os.path.dirname(full_path) or '.').st_mtime_ns
+        except OSError:
+            return None
 
     @classmethod
     def load_target(cls, scheme, path, fragment, username,
@@ -21,4 +45,30 @@ class LocalExtension(YamlSettingsExtension):
                     load_method, **kwargs):
         full_path = (hostname or '') + path
         query.update(kwargs)
-        return load_method(open(full_path, **query))
+        use_cache = query.pop('cache', False)
+        if not use_cache:
+            return load_method(open(full_path, **query))
+
+        with open(full_path, **query) as stream:
+            stat = os.fstat(stream.fileno())
+            cache_key = (
+                os.path.realpath(full_path),
+                stat.st_ino,
+                stat.st_mtime_ns,
+                stat.st_size,
+                load_method,
+                tuple(sorted(query.items())),
+            )
+            cached = cls.cache.get(cache_key)
+            if cached is None:
+                yaml_contents = load_method(stream)
+                # Load all returns a generator list of configurations
+                many = isinstance(yaml_contents, types.GeneratorType)
+                yaml_contents = list(yaml_contents) if many else yaml_contents
+                cached = (many, yaml_contents)
+                cls.cache.set(cache_key, cached, size=stat.st_size)
+
+        many, yaml_contents = cached
+        if many:
+            return [copy_contents(contents) for contents in yaml_contents]
+        return copy_contents(yaml_contents)
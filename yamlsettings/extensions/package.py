@@ -1,9 +1,62 @@
 """Load a yaml resource from a python package."""
+import contextlib
+import mmap
+import os
 import pkgutil
 import types
 
 import yamlsettings
+from yamlsettings import instrument
 from yamlsettings.extensions.base import YamlSettingsExtension
+from yamlsettings.extensions.cache import LRUCache, copy_contents
+
+
+@contextlib.contextmanager
+def _open_resource(package_path, resource):
+    """Open a package resource for parsing, without reading it into memory
+    first: resource files are memory mapped, and zipped resources streamed
+    from their member. Packages importlib.resources can't open (modules
+    before Python 3.12, or no importlib.resources.files) are read with
+    pkgutil.get_data.
+
+    Yields a yaml stream, bytes or a readable object.
+
+    """
+    try:
+        # Imported on first use, importlib.resources is slow to import
+        # (and files is missing before Python 3.9)
+        from importlib.resources import files
+        traversable = files(package_path).joinpath(resource)
+    except (ImportError, TypeError):
+        pkg_data = pkgutil.get_data(package_path, resource)
+        if pkg_data is None:
+            raise IOError("package - {}:{}".format(package_path, resource))
+        yield pkg_data
+        return
+
+    if not traversable.is_file():
+        raise IOError("package - {}:{}".format(package_path, resource))
+    import pathlib
+    if not isinstance(traversable, pathlib.Path):
+        with traversable.open('rb') as stream:
+            yield stream
+        return
+
+    with open(traversable, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            yield b''
+            return
+        with mmap.mmap(handle.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def _resource_size(stream):
+    """Bytes read from a resource stream opened by _open_resource"""
+    if isinstance(stream, bytes):
+        return len(stream)
+    return stream.tell()
 
 
 class PackageExtension(YamlSettingsExtension):
@@ -13,7 +66,9 @@ class PackageExtension(YamlSettingsExtension):
       resource: The resource to load from the package (default: settings.yaml)
       env: When set the yamldict will update with env variables (default: true)
       prefix: Prefix for environment loading (default: None)
-      persist: When set the yamldict will only be loaded once. (default: true)
+      persist: When set the yamldict is kept in PackageExtension.persistence
+        and only loaded once, each load returns a private copy.
+        (default: true)
 
     examples:
       * pkg://example (opens the settings.yaml resource and loads env vars)
@@ -26,7 +81,24 @@ class PackageExtension(YamlSettingsExtension):
         'prefix': None,
         'persist': True,
     }
-    _persistence = {}
+    # Parsed resources, keyed by package, resource, env overlay and load
+    # method. The size budget is counted in bytes of source yaml.
+    persistence = LRUCache(maxsize=64, maxbytes=64 * 1024 * 1024)
+
+    @classmethod
+    def invalidate(cls, package_path=None, resource=None):
+        """Forget persisted resources, so they're loaded again
+
+        :param package_path: Only forget resources of this package.
+            Default: None (every package)
+        :param resource: Only forget this resource. Default: None (every
+            resource)
+        :returns: number of persisted results forgotten
+
+        """
+        return cls.persistence.invalidate_where(
+            lambda key: ((package_path is None or key[0] == package_path) and
+                         (resource is None or key[1] == resource)))
 
     @classmethod
     def load_target(cls, scheme, path, fragment, username,
@@ -40,27 +112,33 @@ class PackageExtension(YamlSettingsExtension):
         prefix = query['prefix']
         persist = query['persist']
 
-        persistence_key = "{}:{}".format(package_path, resource)
-
-        if persist and persistence_key in cls._persistence:
-            yaml_contents = cls._persistence[persistence_key]
-        else:
-            pkg_data = pkgutil.get_data(package_path, resource)
-            if pkg_data is None:
-                raise IOError("package - {}:{}".format(package_path, resource))
+        # Loads with other options (e.g. fields) parse to other results
+        persistence_key = (package_path, resource, env, prefix, load_method)
 
-            yaml_contents = load_method(pkg_data)
-            # Load all returns a generator list of configurations
-            many = isinstance(yaml_contents, types.GeneratorType)
-            yaml_contents = list(yaml_contents) if many else yaml_contents
+        cached = cls.persistence.get(persistence_key) if persist else None
+        if cached is None:
+            with _open_resource(package_path, resource) as stream:
+                yaml_contents = load_method(stream)
+                # Load all returns a generator list of configurations, parse
+                # it while the resource is open
+                many = isinstance(yaml_contents, types.GeneratorType)
+                yaml_contents = list(yaml_contents) if many else yaml_contents
+                size = _resource_size(stream)
 
-            if env and many:
-                for contents in yaml_contents:
-                    yamlsettings.update_from_env(contents, prefix)
-            elif env:
-                yamlsettings.update_from_env(yaml_contents, prefix)
+            if env:
+                with instrument.phase('env'):
+                    if many:
+                        for contents in yaml_contents:
+                            yamlsettings.update_from_env(contents, prefix)
+                    else:
+                        yamlsettings.update_from_env(yaml_contents, prefix)
 
-            if persist:
-                cls._persistence[persistence_key] = yaml_contents
+            if not persist:
+                return yaml_contents
+            cached = (many, yaml_contents)
+            cls.persistence.set(persistence_key, cached, size=size)
 
-        return yaml_contents
+        many, yaml_contents = cached
+        if many:
+            return [copy_contents(contents) for contents in yaml_contents]
+        return copy_contents(yaml_contents)
@@ -1,14 +1,40 @@
 """Extension registry, to allow easy opening of various types.
 
 """
-try:
-    from importlib.metadata import entry_points
-except ImportError:
-    from importlib_metadata import entry_points # For Python < 3.8
+import contextlib
+import copy
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from six.moves.urllib.parse import urlsplit
 from six import string_types
 import yamlsettings
+from yamlsettings import instrument
+from yamlsettings.extensions.cache import (
+    CompiledCache,
+    DiscoveryCache,
+    LRUCache,
+    NegativeCache,
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _bind(load_method, **options):
+    """The same partial for the same options, so it can be used as part of
+    cache keys"""
+    return functools.partial(load_method, **options)
+
+
+def _copy_query(query):
+    """Private copy of a cached conformed query, extensions update and pop
+    their query"""
+    return {key: copy.deepcopy(value)
+            if isinstance(value, (list, dict, set)) else value
+            for key, value in query.items()}
+
+
+_NO_PHASE = contextlib.nullcontext()
 
 
 class RegistryError(Exception):
@@ -25,22 +51,63 @@ class InvalidQuery(RegistryError):
 
 class ExtensionRegistry(object):
 
-    def __init__(self, extensions):
+    def __init__(self, extensions, cache_dir=None, negative_ttl=None):
         """A registry that stores extensions to open and parse Target URIs
 
         :param extensions: A list of extensions.
+        :param cache_dir: Directory for the compiled cache of parsed
+            documents, and the discovered extensions. Default: None
+            (disabled)
+        :param negative_ttl: Enables the negative cache, remembering
+            missing targets so fallback lists skip them without checking
+            for negative_ttl seconds, then for as long as their extension's
+            target_token is unchanged (for local files, the mtime of their
+            directory). Default: None (disabled)
         :type extensions: yamlsettings.extensions.base.YamlSettingsExtension
+        :type cache_dir: string
+        :type negative_ttl: float
 
         """
         self.registry = {}
         self.extensions = {}
         self.default_protocol = 'file'
+        self.compiled_cache = CompiledCache(cache_dir) if cache_dir else None
+        self.discovery_cache = DiscoveryCache(cache_dir) if cache_dir else None
+        # Parsed target uris with their extension and conformed query, keyed
+        # by default protocol and uri
+        self.target_cache = LRUCache(maxsize=256)
+        self.negative_cache = None
+        if negative_ttl is not None:
+            self.negative_cache = NegativeCache(ttl=negative_ttl)
+        # Load hooks, replaced rather than changed so loads in progress
+        # keep a consistent tuple
+        self._hooks = ()
+        # Installed extensions are only discovered once a protocol isn't
+        # found, scanning every distribution slows down imports
+        self._discovered = False
+        self._discover_lock = threading.Lock()
         for extension in extensions:
             self.add(extension)
-        self._discover()
+
+    def __getstate__(self):
+        """Copies (e.g. sent to a ProcessPoolExecutor by load_merged)
+        start with empty caches, and without hooks, which report to this
+        process."""
+        state = self.__dict__.copy()
+        del state['_discover_lock']
+        state['_hooks'] = ()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._discover_lock = threading.Lock()
 
     def _get_entry_points(self):
         """Get all entry points for yamlsettings10"""
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            from importlib_metadata import entry_points  # For Python < 3.8
         ep = entry_points()
         try:
             points = ep.select(group='yamlsettings10')
@@ -49,13 +116,41 @@ class ExtensionRegistry(object):
             points = ep.get('yamlsettings10', [])
         return points
 
+    def _entry_points(self):
+        """Entry points for yamlsettings10, through the discovery cache when
+        enabled"""
+        if self.discovery_cache is None:
+            return self._get_entry_points()
+        cached = self.discovery_cache.get('yamlsettings10')
+        if cached is None:
+            points = list(self._get_entry_points())
+            self.discovery_cache.set('yamlsettings10', [
+                (ep.name, ep.value) for ep in points])
+            return points
+        try:
+            from importlib.metadata import EntryPoint
+        except ImportError:
+            from importlib_metadata import EntryPoint  # For Python < 3.8
+        return [EntryPoint(name, value, 'yamlsettings10')
+                for name, value in cached]
+
     def _discover(self):
-        """Find and install all extensions"""
-        for ep in self._get_entry_points():
-            ext = ep.load()
-            if callable(ext):
-                ext = ext()
-            self.add(ext)
+        """Find and install all extensions, once"""
+        with self._discover_lock:
+            if self._discovered:
+                return
+            # Installed extensions never replace the protocols registered
+            # already, whatever protocol triggered the discovery
+            taken = set(self.registry)
+            try:
+                for ep in self._entry_points():
+                    ext = ep.load()
+                    if callable(ext):
+                        ext = ext()
+                    self._add(ext, [protocol for protocol in ext.protocols
+                                    if protocol not in taken])
+            finally:
+                self._discovered = True
 
     def get_extension(self, protocol):
         """Retrieve extension for the given protocol
@@ -65,6 +160,8 @@ class ExtensionRegistry(object):
         :raises NoProtocolError: no extension registered for protocol
 
         """
+        if protocol not in self.registry and not self._discovered:
+            self._discover()
         if protocol not in self.registry:
             raise NoProtocolError("No protocol for %s" % protocol)
         index = self.registry[protocol]
@@ -77,10 +174,118 @@ class ExtensionRegistry(object):
         :type extension: yamlsettings.extensions.base.YamlSettingsExtension
 
         """
+        self._add(extension, extension.protocols)
+
+    def _add(self, extension, protocols):
+        """Adds an extension for protocols, a subset of its own"""
         index = len(self.extensions)
         self.extensions[index] = extension
-        for protocol in extension.protocols:
+        for protocol in protocols:
             self.registry[protocol] = index
+        # Protocols may now resolve to another extension
+        self.target_cache.clear()
+        if self.negative_cache is not None:
+            self.negative_cache.clear()
+
+    def add_hook(self, hook):
+        """Call hook(event) with a yamlsettings.instrument.PhaseEvent for
+        each phase of each target uri loaded, failed attempts included.
+        See yamlsettings.instrument.PhaseStats for a ready-made hook.
+
+        Hooks are called from the loading thread, exceptions they raise
+        are logged and ignored.
+
+        :param hook: callable taking a PhaseEvent
+
+        """
+        self._hooks = self._hooks + (hook,)
+        return hook
+
+    def remove_hook(self, hook):
+        """Stop calling hook
+
+        :param hook: hook previously added with add_hook
+
+        """
+        self._hooks = tuple(h for h in self._hooks if h != hook)
+
+    def _load_method(self, load_method, lazy=False, fields=None,
+                     dotted=False):
+        """Bind the load options to load_method, and route it through the
+        compiled cache when enabled.
+
+        Lazy documents construct their values on demand, they skip the
+        compiled cache, which would have to construct everything to store it.
+
+        """
+        if fields:
+            if not isinstance(fields, (list, tuple)):
+                fields = [fields]
+            load_method = _bind(load_method, fields=tuple(fields))
+            if dotted:
+                load_method = _bind(load_method, dotted=True)
+        if lazy:
+            return _bind(load_method, lazy=True)
+        if self.compiled_cache is None:
+            return load_method
+        return self.compiled_cache.wrap(load_method)
+
+    def _target(self, target_uri, attempt=None):
+        """Parse target_uri, returns its extension, target and conformed
+        query. Parsing is cached, the query is a private copy. With an
+        attempt (see yamlsettings.instrument), parsing is timed."""
+        key = (self.default_protocol, target_uri)
+        with _phase(attempt, 'parse_uri', len(target_uri)):
+            cached = self.target_cache.get(key)
+            if cached is None:
+                target = urlsplit(target_uri, scheme=self.default_protocol)
+                extension = self.get_extension(target.scheme)
+            else:
+                extension, target, query = cached
+        with _phase(attempt, 'conform_query', len(target.query)):
+            if cached is None:
+                query = extension.conform_query(target.query)
+                self.target_cache.set(key, (extension, target, query))
+            query = _copy_query(query)
+        return extension, target, query
+
+    def _candidates(self, target_uris, traced=False):
+        """Parse target uris, yielding each target to try as (attempt,
+        extension, target, query, get_token). The attempt is None unless
+        traced, get_token is None unless the negative cache is enabled.
+
+        Targets the negative cache knows are missing are skipped, report
+        the others that aren't found with _not_found.
+
+        """
+        if isinstance(target_uris, string_types):
+            target_uris = [target_uris]
+
+        # Missing targets are tried again on every load, unless the negative
+        # cache is enabled.
+        # TODO: How would multiple protocols work, should the registry hold
+        # persist copies?
+        negative = self.negative_cache
+        hooks = self._hooks if traced else None
+        attempt = get_token = None
+        for index, target_uri in enumerate(target_uris):
+            if hooks is not None:
+                attempt = instrument.Attempt(hooks, target_uri, index)
+            extension, target, query = self._target(target_uri, attempt)
+            if negative is not None:
+                # Extensions update and pop their query while loading
+                get_token = functools.partial(_target_token, extension,
+                                              target, dict(query))
+                if negative.is_missing(target, get_token):
+                    continue
+            yield attempt, extension, target, query, get_token
+
+    def _not_found(self, target, get_token):
+        """Remember a target from _candidates as missing"""
+        if get_token is not None:
+            # Only taken once the target is missing, found targets cost
+            # nothing more
+            self.negative_cache.add(target, get_token())
 
     def _load_first(self, target_uris, load_method, **kwargs):
         """Load first yamldict target found in uri list.
@@ -93,20 +298,64 @@ class ExtensionRegistry(object):
         :returns: yamldict
 
         """
-        if isinstance(target_uris, string_types):
-            target_uris = [target_uris]
+        if self._hooks:
+            return self._load_first_traced(target_uris, load_method,
+                                           **kwargs)[0]
+        for _, extension, target, query, get_token in \
+                self._candidates(target_uris):
+            try:
+                yaml_dict = extension.load_target(
+                    target.scheme,
+                    target.path,
+                    target.fragment,
+                    target.username,
+                    target.password,
+                    target.hostname,
+                    target.port,
+                    query,
+                    load_method,
+                    **kwargs
+                )
+                return yaml_dict
+            except extension.not_found_exception:
+                self._not_found(target, get_token)
 
-        # TODO: Move the list logic into the extension, otherwise a
-        # load will always try all missing files first.
-        # TODO: How would multiple protocols work, should the registry hold
-        # persist copies?
-        for target_uri in target_uris:
-            target = urlsplit(target_uri, scheme=self.default_protocol)
+        raise IOError("unable to load: {0}".format(target_uris))
 
-            extension = self.get_extension(target.scheme)
-            query = extension.conform_query(target.query)
+    def _load_first_traced(self, target_uris, load_method, **kwargs):
+        """_load_first reporting to the hooks, returns the yamldict and the
+        attempt that loaded it"""
+        for attempt, extension, target, query, get_token in \
+                self._candidates(target_uris, traced=True):
             try:
-                yaml_dict = extension.load_target(
+                with attempt.active(), attempt.phase('load_target'):
+                    yaml_dict = extension.load_target(
+                        target.scheme,
+                        target.path,
+                        target.fragment,
+                        target.username,
+                        target.password,
+                        target.hostname,
+                        target.port,
+                        query,
+                        load_method,
+                        **kwargs
+                    )
+                return yaml_dict, attempt
+            except extension.not_found_exception:
+                self._not_found(target, get_token)
+
+        raise IOError("unable to load: {0}".format(target_uris))
+
+    async def _aload_first(self, target_uris, load_method, **kwargs):
+        """Coroutine version of _load_first, using aload_target"""
+        if self._hooks:
+            return (await self._aload_first_traced(target_uris, load_method,
+                                                   **kwargs))[0]
+        for _, extension, target, query, get_token in \
+                self._candidates(target_uris):
+            try:
+                yaml_dict = await extension.aload_target(
                     target.scheme,
                     target.path,
                     target.fragment,
@@ -120,43 +369,267 @@ class ExtensionRegistry(object):
                 )
                 return yaml_dict
             except extension.not_found_exception:
-                pass
+                self._not_found(target, get_token)
 
         raise IOError("unable to load: {0}".format(target_uris))
 
-    def load(self, target_uris, fields=None, **kwargs):
+    async def _aload_first_traced(self, target_uris, load_method,
+                                  **kwargs):
+        """Coroutine version of _load_first_traced"""
+        for attempt, extension, target, query, get_token in \
+                self._candidates(target_uris, traced=True):
+            try:
+                with attempt.active(), attempt.phase('load_target'):
+                    yaml_dict = await extension.aload_target(
+                        target.scheme,
+                        target.path,
+                        target.fragment,
+                        target.username,
+                        target.password,
+                        target.hostname,
+                        target.port,
+                        query,
+                        load_method,
+                        **kwargs
+                    )
+                return yaml_dict, attempt
+            except extension.not_found_exception:
+                self._not_found(target, get_token)
+
+        raise IOError("unable to load: {0}".format(target_uris))
+
+    def load(self, target_uris, fields=None, lazy=False, dotted=False,
+             **kwargs):
         """Load first yamldict target found in uri.
 
         :param target_uris: Uris to try and open
         :param fields: Fields to filter. Default: None
+        :param lazy: Construct values on first access. Default: False
+        :param dotted: Dotted fields (e.g. 'config.db') also select the
+            nested keys they name. Default: False
         :type target_uri: list or string
         :type fields: list
+        :type lazy: bool
+        :type dotted: bool
 
         :returns: yamldict
 
         """
-        yaml_dict = self._load_first(
-            target_uris, yamlsettings.yamldict.load, **kwargs
-        )
-        # TODO: Move this into the extension, otherwise every load from
-        # a persistant location will refilter fields.
+        load_method = self._load_method(yamlsettings.yamldict.load,
+                                        lazy=lazy, fields=fields,
+                                        dotted=dotted)
+        if self._hooks:
+            yaml_dict, attempt = self._load_first_traced(
+                target_uris, load_method, **kwargs)
+            if fields:
+                with attempt.active(), attempt.phase('limit'):
+                    yaml_dict.limit(fields, dotted)
+            return yaml_dict
+
+        yaml_dict = self._load_first(target_uris, load_method, **kwargs)
+        # Fields are skipped while parsing, this only limits the results of
+        # extensions that don't parse with load_method.
         if fields:
-            yaml_dict.limit(fields)
+            yaml_dict.limit(fields, dotted)
 
         return yaml_dict
 
-    def load_all(self, target_uris, **kwargs):
+    def load_all(self, target_uris, lazy=False, **kwargs):
         '''
         Load *all* YAML settings from a list of file paths given.
 
             - File paths in the list gets the priority by their orders
             of the list.
+            - With lazy=True values are constructed on first access.
         '''
-        yaml_series = self._load_first(
-            target_uris, yamlsettings.yamldict.load_all, **kwargs
-        )
+        load_method = self._load_method(yamlsettings.yamldict.load_all,
+                                        lazy=lazy)
+        yaml_series = self._load_first(target_uris, load_method, **kwargs)
         yaml_dicts = []
         for yaml_dict in yaml_series:
             yaml_dicts.append(yaml_dict)
         # return YAMLDict objects
         return yaml_dicts
+
+    def load_merged(self, target_uris, fields=None, required=False,
+                    max_workers=None, executor=None, dotted=False,
+                    **kwargs):
+        """Load every target uri at the same time, then merge them in order.
+
+        Later targets update earlier ones, with YAMLDict.update semantics.
+
+        :param target_uris: Uris to load, an item can also be a list of
+            uris, where the first one found is used (see load)
+        :param fields: Fields to filter. Default: None
+        :param required: Raise when a target isn't found, instead of
+            skipping it. Default: False
+        :param max_workers: Threads loading the targets. Default: one per
+            target
+        :param executor: concurrent.futures.Executor to load the targets
+            with instead, e.g. a ProcessPoolExecutor for CPU bound parsing.
+            Default: None
+        :type target_uris: list or string
+        :type fields: list
+        :type required: bool
+        :type max_workers: int
+        :param dotted: Dotted fields also select nested keys (see load).
+            Default: False
+        :type executor: concurrent.futures.Executor
+        :type dotted: bool
+
+        :raises IOError: a required target, or every target, wasn't found
+        :returns: yamldict
+
+        """
+        if isinstance(target_uris, string_types):
+            target_uris = [target_uris]
+        load_method = self._load_method(yamlsettings.yamldict.load,
+                                        fields=fields, dotted=dotted)
+
+        pool = executor
+        if pool is None:
+            pool = ThreadPoolExecutor(
+                max_workers=max_workers or max(len(target_uris), 1))
+        try:
+            futures = [
+                pool.submit(self._load_first, target_uri, load_method,
+                            **kwargs)
+                for target_uri in target_uris
+            ]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except IOError as exc:
+                    results.append(exc)
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+        return _merge_results(target_uris, results, fields, required,
+                              dotted)
+
+    async def aload(self, target_uris, fields=None, lazy=False, timeout=None,
+                    dotted=False, **kwargs):
+        """Coroutine version of load, loading the target with the
+        extension's aload_target.
+
+        :param timeout: Seconds to wait for the target before raising
+            asyncio.TimeoutError. Default: None (no timeout)
+        :type timeout: float
+
+        See load for the other parameters.
+
+        """
+        import asyncio
+        load_method = self._load_method(yamlsettings.yamldict.load,
+                                        lazy=lazy, fields=fields,
+                                        dotted=dotted)
+        if self._hooks:
+            yaml_dict, attempt = await asyncio.wait_for(
+                self._aload_first_traced(target_uris, load_method, **kwargs),
+                timeout)
+            if fields:
+                with attempt.active(), attempt.phase('limit'):
+                    yaml_dict.limit(fields, dotted)
+            return yaml_dict
+
+        yaml_dict = await asyncio.wait_for(
+            self._aload_first(target_uris, load_method, **kwargs), timeout)
+        if fields:
+            yaml_dict.limit(fields, dotted)
+        return yaml_dict
+
+    async def aload_all(self, target_uris, lazy=False, timeout=None,
+                        **kwargs):
+        """Coroutine version of load_all, loading the target with the
+        extension's aload_target.
+
+        :param timeout: Seconds to wait for the target before raising
+            asyncio.TimeoutError. Default: None (no timeout)
+        :type timeout: float
+
+        """
+        import asyncio
+        load_method = self._load_method(yamlsettings.yamldict.load_all,
+                                        lazy=lazy)
+        yaml_series = await asyncio.wait_for(
+            self._aload_first(target_uris, load_method, **kwargs), timeout)
+        return list(yaml_series)
+
+    async def aload_merged(self, target_uris, fields=None, required=False,
+                           timeout=None, dotted=False, **kwargs):
+        """Coroutine version of load_merged, loading every target at the
+        same time with the extensions' aload_target.
+
+        :param timeout: Seconds to wait for all the targets before raising
+            asyncio.TimeoutError, pending loads are cancelled. Default: None
+            (no timeout)
+        :type timeout: float
+
+        See load_merged for the other parameters.
+
+        """
+        import asyncio
+        if isinstance(target_uris, string_types):
+            target_uris = [target_uris]
+        load_method = self._load_method(yamlsettings.yamldict.load,
+                                        fields=fields, dotted=dotted)
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                *[self._aload_first(target_uri, load_method, **kwargs)
+                  for target_uri in target_uris],
+                return_exceptions=True
+            ),
+            timeout,
+        )
+        for result in results:
+            if isinstance(result, BaseException) and \
+                    not isinstance(result, IOError):
+                raise result
+        return _merge_results(target_uris, results, fields, required,
+                              dotted)
+
+
+def _phase(attempt, name, size):
+    """attempt.phase(name, size), or nothing without an attempt"""
+    if attempt is None:
+        return _NO_PHASE
+    return attempt.phase(name, size)
+
+
+def _target_token(extension, target, query):
+    """The extension's negative cache token for target"""
+    return extension.target_token(
+        target.scheme,
+        target.path,
+        target.fragment,
+        target.username,
+        target.password,
+        target.hostname,
+        target.port,
+        query,
+    )
+
+
+def _merge_results(target_uris, results, fields, required, dotted):
+    """Merge the results of load_merged in order, IOError results are
+    targets that weren't found."""
+    yaml_dict = yamlsettings.yamldict.YAMLDict()
+    found = False
+    for contents in results:
+        if isinstance(contents, IOError):
+            if required:
+                raise contents
+            continue
+        found = True
+        if contents is not None:
+            # Merge into a new YAMLDict, results can be shared
+            # (e.g. persisted package targets).
+            yaml_dict.update(contents)
+
+    if not found:
+        raise IOError("unable to load: {0}".format(target_uris))
+    if fields:
+        yaml_dict.limit(fields, dotted)
+    return yaml_dict
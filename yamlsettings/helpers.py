@@ -44,23 +44,92 @@ def update_from_env(yaml_dict, prefix=None):
           by CONFIG_DATABASES_LOCAL.
     '''
     prefix = prefix or ""
+    env_prefix = "{0}{1}".format(prefix.upper(), '_' if prefix else '')
+
+    # Start from the environment, only variables with the prefix can match
+    # and the rest of their name is resolved against the tree.
+    overrides = {}
+    for env_path, env_val in os.environ.items():
+        if env_path.startswith(env_prefix):
+            overrides[env_path[len(env_prefix):]] = env_val
+
+    # A variable named after the root itself stops the whole update
+    if '' in overrides and _env_value(overrides.pop('')) is not None:
+        return
+    if overrides:
+        _override_node(yaml_dict, overrides)
+
+
+def _env_value(env_val):
+    '''
+    Convert an environment variable value to a YAML-defined type.
+    '''
+    return yamldict.load_value(env_val)
 
-    def _set_env_var(path, node):
-        env_path = "{0}{1}{2}".format(
-            prefix.upper(),
-            '_' if prefix else '',
-            '_'.join([str(key).replace('-', '_').upper() for key in path])
-        )
-        env_val = os.environ.get(env_path, None)
-        if env_val is not None:
-            # convert the value to a YAML-defined type
-            env_dict = yamldict.load('val: {0}'.format(env_val))
-            return env_dict.val
-        else:
-            return None
 
-    # traverse yaml_dict with the callback function
-    yaml_dict.traverse(_set_env_var)
+def _env_name(key):
+    return str(key).replace('-', '_').upper()
+
+
+def _match_children(node, overrides):
+    '''
+    Map the children of node to the overrides that can apply below them.
+
+        - Returns a list of (position, key, env value or None, overrides
+          for the child's own children), in the order of node.
+    '''
+    if isinstance(node, yamldict.YAMLDict):
+        # Normalised key names of this node only
+        index = {}
+        for position, key in enumerate(node):
+            index.setdefault(_env_name(key), []).append((position, key))
+
+        def _lookup(name):
+            return index.get(name, ())
+    else:
+        def _lookup(name):
+            digits = name[1:-1]
+            if name[:1] == '[' and name[-1:] == ']' and digits.isdigit() \
+                    and str(int(digits)) == digits \
+                    and int(digits) < len(node):
+                return ((int(digits), int(digits)),)
+            return ()
+
+    matches = {}
+    for env_path, env_val in overrides.items():
+        # Every '_' could be the end of this node's key
+        split = env_path.find('_')
+        while True:
+            end = len(env_path) if split < 0 else split
+            for position, key in _lookup(env_path[:end]):
+                match = matches.setdefault(position, [key, None, {}])
+                if split < 0:
+                    match[1] = env_val
+                else:
+                    match[2][env_path[end + 1:]] = env_val
+            if split < 0:
+                break
+            split = env_path.find('_', split + 1)
+
+    return [(position,) + tuple(matches[position])
+            for position in sorted(matches)]
+
+
+def _override_node(node, overrides):
+    '''
+    Apply overrides (env name below node -> env value) to node, visiting
+    children in order like YAMLDict.traverse. A child replaced by a value
+    is not descended into.
+    '''
+    for _, key, env_val, child_overrides in _match_children(node, overrides):
+        if env_val is not None:
+            value = _env_value(env_val)
+            if value is not None:
+                node[key] = value
+                continue
+        child = node[key]
+        if child_overrides and isinstance(child, (yamldict.YAMLDict, list)):
+            _override_node(child, child_overrides)
 
 
 class YamlSettings(object):
@@ -110,9 +179,15 @@ class YamlSettings(object):
                 # variables to work
                 self.settings = defaults
 
+            if self.settings:
+                # Shared by the sections, each one only copies what it
+                # overrides
+                base = defaults[self.cur_section]
+                if isinstance(base, yamldict.YAMLDict):
+                    base = base.clone(shared=True)
             for cur_section in self.settings:
                 cur = self.settings[cur_section]
-                cur.rebase(defaults[self.cur_section])
+                cur.rebase(base)
 
                 if override_envs and not envs_override_defaults_only:
                     update_from_env(cur, default_section)
@@ -0,0 +1,217 @@
+"""Load instrumentation
+
+While a registry with hooks loads a target uri, each phase of the attempt
+is timed and passed to the hooks as a PhaseEvent. Code running inside an
+attempt (yamldict.load, extensions) reports its own phases with phase().
+
+"""
+# -*- coding: utf-8 -*-
+import bisect
+import collections
+import contextlib
+import contextvars
+import threading
+import time
+
+# Phases of an attempt, in order
+PHASES = (
+    'parse_uri',      # urlsplit and extension lookup
+    'conform_query',  # extension.conform_query
+    'load_target',    # extension.load_target, including the phases below
+    'parse',          # reading and composing yaml
+    'construct',      # building the YAMLDicts
+    'env',            # environment overlay
+    'limit',          # limiting to the requested fields
+)
+
+PhaseEvent = collections.namedtuple('PhaseEvent', [
+    'uri',      # target uri of the attempt
+    'attempt',  # index of the target uri in the fallback list
+    'phase',    # name of the phase, see PHASES
+    'seconds',  # wall time
+    'bytes',    # size of the input, None when unknown
+    'error',    # exception class name when the phase failed, else None
+])
+
+_attempt = contextvars.ContextVar('yamlsettings_attempt', default=None)
+_null_phase = contextlib.nullcontext()
+
+
+class Attempt(object):
+    """Loading one target uri, reports its phases to hooks"""
+    __slots__ = ('hooks', 'uri', 'index')
+
+    def __init__(self, hooks, uri, index):
+        self.hooks = hooks
+        self.uri = uri
+        self.index = index
+
+    def record(self, phase, seconds, size=None, error=None):
+        event = PhaseEvent(self.uri, self.index, phase, seconds, size, error)
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception:
+                # Imported on first use, logging is slow to import
+                import logging
+                logging.getLogger(__name__).exception(
+                    "load hook %r failed", hook)
+
+    def phase(self, name, size=None):
+        """Context manager timing the phase name"""
+        return _Phase(self, name, size)
+
+    @contextlib.contextmanager
+    def active(self):
+        """Make this the current attempt, for phase()"""
+        token = _attempt.set(self)
+        try:
+            yield self
+        finally:
+            _attempt.reset(token)
+
+
+class _Phase(object):
+    __slots__ = ('attempt', 'name', 'bytes', 'start')
+
+    def __init__(self, attempt, name, size):
+        self.attempt = attempt
+        self.name = name
+        self.bytes = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.attempt.record(self.name, time.perf_counter() - self.start,
+                            self.bytes,
+                            exc_type.__name__ if exc_type else None)
+        return False
+
+
+def current():
+    """The attempt being loaded, None when not instrumented"""
+    return _attempt.get()
+
+
+def phase(name, size=None):
+    """Time the phase name of the current attempt, does nothing outside of
+    an instrumented load.
+
+    Example:
+        with phase('env'):
+            update_from_env(contents, prefix)
+    """
+    attempt = _attempt.get()
+    if attempt is None:
+        return _null_phase
+    return _Phase(attempt, name, size)
+
+
+class PhaseStats(object):
+    """Load hook collecting counters and histograms of each phase.
+
+    Example:
+        stats = PhaseStats()
+        yamlsettings.registry.add_hook(stats)
+        ...
+        stats.snapshot()['parse']['seconds']
+        print(stats.prometheus())
+    """
+    # Upper bounds of the duration histogram buckets, in seconds
+    buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, buckets=None):
+        """
+        :param buckets: Histogram bucket upper bounds in seconds, in
+            increasing order
+        :type buckets: tuple
+
+        """
+        if buckets is not None:
+            self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._phases = {}
+
+    def __call__(self, event):
+        with self._lock:
+            stats = self._phases.get(event.phase)
+            if stats is None:
+                stats = self._phases[event.phase] = {
+                    'count': 0,
+                    'errors': 0,
+                    'seconds': 0.0,
+                    'bytes': 0,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            stats['count'] += 1
+            stats['seconds'] += event.seconds
+            if event.error is not None:
+                stats['errors'] += 1
+            if event.bytes is not None:
+                stats['bytes'] += event.bytes
+            stats['histogram'][bisect.bisect_left(self.buckets,
+                                                  event.seconds)] += 1
+
+    def reset(self):
+        """Forget everything collected"""
+        with self._lock:
+            self._phases = {}
+
+    def snapshot(self):
+        """Per phase counters: count, errors, seconds (total), bytes
+        (total) and buckets, a list of (upper bound, cumulative count)
+        ending with (inf, count).
+
+        :returns: dict of phase name to counters, in PHASES order
+
+        """
+        with self._lock:
+            phases = {name: dict(stats, histogram=list(stats['histogram']))
+                      for name, stats in self._phases.items()}
+        snapshot = {}
+        for name in sorted(phases, key=_phase_order):
+            stats = phases[name]
+            counts = stats.pop('histogram')
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            stats['buckets'] = buckets
+            snapshot[name] = stats
+        return snapshot
+
+    def prometheus(self, prefix='yamlsettings_load'):
+        """The snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            '# TYPE {0}_phase_seconds histogram'.format(prefix),
+        ]
+        for name, stats in snapshot.items():
+            for bound, count in stats['buckets']:
+                lines.append('{0}_phase_seconds_bucket{{phase="{1}",'
+                             'le="{2}"}} {3}'.format(
+                                 prefix, name, _bound(bound), count))
+            lines.append('{0}_phase_seconds_sum{{phase="{1}"}} {2!r}'.format(
+                prefix, name, stats['seconds']))
+            lines.append('{0}_phase_seconds_count{{phase="{1}"}} {2}'.format(
+                prefix, name, stats['count']))
+        for counter in ('errors', 'bytes'):
+            lines.append('# TYPE {0}_phase_{1}_total counter'.format(
+                prefix, counter))
+            for name, stats in snapshot.items():
+                lines.append('{0}_phase_{1}_total{{phase="{2}"}} {3}'.format(
+                    prefix, counter, name, stats[counter]))
+        return '\n'.join(lines) + '\n'
+
+
+def _phase_order(name):
+    try:
+        return (PHASES.index(name), name)
+    except ValueError:
+        return (len(PHASES), name)
+
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
@@ -0,0 +1,271 @@
+"""Reload settings when the files behind them change
+
+"""
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+from six import string_types
+from six.moves.urllib.parse import urlsplit
+
+import yamlsettings
+from yamlsettings import yamldict
+from yamlsettings.helpers import update_from_env
+
+try:
+    import inotify_simple
+    HAS_INOTIFY = True
+except ImportError:
+    HAS_INOTIFY = False
+
+
+def _logger():
+    # Imported on first use, logging is slow to import
+    import logging
+    return logging.getLogger(__name__)
+
+
+class _Source(object):
+    ''' A target uri, its local file (if any) and its last loaded contents.
+    '''
+    __slots__ = ('uri', 'path', 'signature', 'contents')
+
+    def __init__(self, uri, path):
+        self.uri = uri
+        self.path = path
+        self.signature = None
+        self.contents = None
+
+
+def _signature(path):
+    ''' What changes when a file is written, replaced or removed.
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class SettingsWatcher(object):
+    '''
+    Settings merged from target uris (like yamlsettings.load_merged) that
+    are reloaded when their local files change.
+
+    Only the changed files are parsed again, the merged settings are then
+    rebuilt and swapped in as a whole, so readers always get a complete
+    snapshot from watcher.settings. Subscribers are called with the new
+    settings and the key paths (tuples) that changed, or the yamldict.diff
+    operations from the previous settings.
+
+    Changes are noticed with inotify when inotify_simple is installed,
+    otherwise by polling the files every interval seconds. A change is
+    reloaded once the files stay unchanged for debounce seconds.
+
+    Example:
+        watcher = SettingsWatcher(['defaults.yml', 'settings.yml'], env=True)
+        watcher.subscribe(lambda settings, paths: print(paths))
+        watcher.start()
+        watcher.settings.config.greet
+    '''
+
+    def __init__(self, target_uris, env=False, prefix=None, interval=1.0,
+                 debounce=0.1, use_inotify=None, registry=None):
+        '''
+        :param target_uris: Uris to load and merge in order, missing ones
+            are skipped, targets other than local files are loaded once.
+        :param env: Apply update_from_env after every merge
+        :param prefix: Prefix for update_from_env
+        :param interval: Seconds between polls, or between stop checks
+            with inotify
+        :param debounce: Seconds the files have to stay unchanged
+        :param use_inotify: None uses inotify when available
+        :param registry: Registry loading the targets,
+            default: yamlsettings.registry
+        :raises IOError: none of the targets could be loaded
+        '''
+        if isinstance(target_uris, string_types):
+            target_uris = [target_uris]
+        self.registry = registry or yamlsettings.registry
+        self.env = env
+        self.prefix = prefix
+        self.interval = interval
+        self.debounce = debounce
+        if use_inotify is None:
+            use_inotify = HAS_INOTIFY
+        if use_inotify and not HAS_INOTIFY:
+            raise ImportError("inotify_simple is not installed")
+        self.use_inotify = use_inotify
+
+        self._sources = []
+        for target_uri in target_uris:
+            target = urlsplit(target_uri,
+                              scheme=self.registry.default_protocol)
+            path = None
+            if target.scheme == 'file':
+                path = (target.hostname or '') + target.path
+            self._sources.append(_Source(target_uri, path))
+
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+        for source in self._sources:
+            self._load(source)
+        if all(source.contents is None for source in self._sources):
+            raise IOError("unable to load: {0}".format(target_uris))
+        self._settings = self._merge()
+
+    @property
+    def settings(self):
+        ''' The current settings snapshot, replaced on every reload.
+        '''
+        return self._settings
+
+    def subscribe(self, callback, ops=False):
+        ''' Call callback(settings, changed_paths) after every reload, or
+            callback(settings, diff_ops) with ops=True (see yamldict.diff).
+            Returns callback, so it can be used as a decorator.
+        '''
+        self._subscribers.append((callback, ops))
+        return callback
+
+    def unsubscribe(self, callback):
+        ''' Stop calling callback.
+        '''
+        self._subscribers = [s for s in self._subscribers
+                             if s[0] != callback]
+
+    def check(self):
+        ''' Reload the sources whose files changed, returning the changed
+            key paths (empty when nothing changed). The reloaded settings
+            replace the current ones whenever a file changed, subscribers
+            are only notified of changed keys.
+        '''
+        with self._lock:
+            changed = [source for source in self._sources
+                       if source.path is not None and
+                       _signature(source.path) != source.signature]
+            if not changed:
+                return []
+            for source in changed:
+                self._load(source)
+            old, new = self._settings, self._merge()
+            # Swapped in even without operations, diff doesn't report
+            # everything (e.g. keys only reordered)
+            self._settings = new
+            ops = yamldict.diff(old, new)
+            if not ops:
+                return []
+
+        paths = [op[1] for op in ops]
+        for callback, wants_ops in list(self._subscribers):
+            try:
+                callback(new, ops if wants_ops else paths)
+            except Exception:
+                _logger().exception("settings subscriber %r failed",
+                                    callback)
+        return paths
+
+    def start(self):
+        ''' Watch the files from a background thread.
+        '''
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        if self.use_inotify:
+            self._inotify = inotify_simple.INotify()
+            flags = inotify_simple.flags
+            mask = (flags.CLOSE_WRITE | flags.MODIFY | flags.ATTRIB |
+                    flags.CREATE | flags.DELETE | flags.MOVED_TO |
+                    flags.MOVED_FROM)
+            # Watch the directories, editors often replace files
+            for directory in set(os.path.dirname(os.path.abspath(s.path))
+                                 for s in self._sources if s.path):
+                try:
+                    self._inotify.add_watch(directory, mask)
+                except OSError:
+                    pass
+        self._thread = threading.Thread(target=self._run,
+                                        name='yamlsettings-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        ''' Stop the background thread.
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _load(self, source):
+        source.signature = _signature(source.path) if source.path else None
+        try:
+            source.contents = self.registry.load(source.uri)
+        except IOError:
+            source.contents = None
+        except Exception:
+            # Likely a half written file, keep the previous contents until
+            # the next change.
+            _logger().exception("unable to reload %s", source.uri)
+
+    def _merge(self):
+        settings = yamldict.YAMLDict()
+        for source in self._sources:
+            if source.contents is not None:
+                settings.update(source.contents)
+        if self.env:
+            update_from_env(settings, self.prefix)
+        return settings
+
+    def _signatures(self):
+        return [_signature(s.path) for s in self._sources if s.path]
+
+    def _changed(self):
+        return self._signatures() != [s.signature for s in self._sources
+                                      if s.path]
+
+    def _wait(self):
+        ''' Wait for a possible change, False once stopped.
+        '''
+        if self._inotify is not None:
+            # Events only wake us up, the signatures tell what changed
+            self._inotify.read(timeout=int(self.interval * 1000))
+        else:
+            self._stop.wait(self.interval)
+        return not self._stop.is_set()
+
+    def _wait_quiet(self):
+        ''' Wait until the files stay unchanged for debounce seconds.
+        '''
+        signatures = self._signatures()
+        while not self._stop.wait(self.debounce):
+            current = self._signatures()
+            if current == signatures:
+                return
+            signatures = current
+
+    def _run(self):
+        while self._wait():
+            if not self._changed():
+                continue
+            self._wait_quiet()
+            if self._stop.is_set():
+                break
+            try:
+                self.check()
+            except Exception:
+                _logger().exception("settings reload failed")
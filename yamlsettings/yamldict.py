@@ -2,35 +2,59 @@
 
 """
 # -*- coding: utf-8 -*-
+import functools
+import io
+import mmap
+import os
+import re
+import threading
+import weakref
+from collections.abc import Mapping
+
 import yaml
+import yaml.composer
 import yaml.constructor
-import collections
+
+from yamlsettings import instrument
+
+try:
+    from yaml.cyaml import CParser, CEmitter
+    HAS_LIBYAML = True
+except ImportError:
+    # PyYAML was built without libyaml
+    HAS_LIBYAML = False
 
 
-class YAMLDict(collections.OrderedDict):
+class YAMLDict(dict):
     '''
     Order-preserved, attribute-accessible dictionary object for YAML settings
     Improved from:
         https://github.com/mk-fg/layered-yaml-attrdict-config
+
+    Based on dict, which keeps insertion order, with no per-instance
+    __dict__ to keep large trees of small maps compact.
     '''
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         super(YAMLDict, self).__init__(*args, **kwargs)
-        # Reset types of all sub-nodes through the hierarchy
-        self.update(self)
+        if args or kwargs:
+            # Reset types of all sub-nodes through the hierarchy, nested
+            # YAMLDicts are already converted and are kept as they are.
+            for k, v in list(self.items()):
+                if not isinstance(v, YAMLDict) and \
+                        isinstance(v, (dict, list, tuple)):
+                    self[k] = _convert(v)
 
-    def __getattribute__(self, k):
+    def __getattr__(self, k):
+        # Only called once the regular attribute lookup failed, so methods
+        # and class attributes don't pay for the key lookup.
         try:
-            return super(YAMLDict, self).__getattribute__(k)
-        except AttributeError:
-            try:
-                return self[k]
-            except KeyError:
-                raise AttributeError
+            return self[k]
+        except KeyError:
+            raise AttributeError(k)
 
     def __setattr__(self, k, v):
-        if k.startswith('_OrderedDict__'):
-            return super(YAMLDict, self).__setattr__(k, v)
         self[k] = v
 
     def __str__(self):
@@ -43,104 +67,671 @@ class YAMLDict(collections.OrderedDict):
     def __dir__(self):
         return self.keys()
 
-    def traverse(self, callback):
+    def copy(self):
+        ''' Shallow copy of self, as a YAMLDict.
+        '''
+        return self.__class__(self)
+
+    def traverse(self, callback, tuple_paths=False):
         ''' Traverse through all keys and values (in-order)
             and replace keys and values with the return values
             from the callback function.
+
+            callback(path, node) is called for every node, the path being
+            a list of the keys and '[i]' list items from self down to node.
+            The list is shared between calls and changes as the traversal
+            goes, copy it to keep it. With tuple_paths, paths are tuples of
+            keys and int list indexes instead.
+
+            Returning None descends into the node's children, SKIP leaves
+            them out, any other value replaces the node (and isn't
+            descended into). Only the nodes replaced by a different value
+            are written back.
         '''
-        def _traverse_node(path, node, callback):
-            ret_val = callback(path, node)
-            if ret_val is not None:
-                # replace node with the return value
-                node = ret_val
+        path = []
+        if callback(() if tuple_paths else path, self) is not None:
+            return
+        # Parent nodes, their children and the '[i]' names of list items
+        stack = [(self, iter(self.items()), None)]
+        while stack:
+            node, children, names = stack[-1]
+            for k, v in children:
+                path.append(k if names is None else names[k])
+                ret = callback(tuple(path) if tuple_paths else path, v)
+                if ret is None:
+                    if isinstance(v, YAMLDict):
+                        stack.append((v, iter(v.items()), None))
+                        break
+                    elif isinstance(v, list):
+                        stack.append((v, enumerate(v), None if tuple_paths
+                                       else _index_names(len(v))))
+                        break
+                elif ret is not SKIP and ret is not v:
+                    # replace node with the return value
+                    node[k] = ret
+                path.pop()
             else:
-                # traverse deep into the hierarchy
-                if isinstance(node, YAMLDict):
-                    for k, v in node.items():
-                        node[k] = _traverse_node(path + [k], v,
-                                                 callback)
-                elif isinstance(node, list):
-                    for i, v in enumerate(node):
-                        node[i] = _traverse_node(path + ['[{0}]'.format(i)], v,
-                                                 callback)
-                else:
-                    pass
-            return node
-        _traverse_node([], self, callback)
+                stack.pop()
+                if path:
+                    path.pop()
+
+    def walk(self):
+        ''' Generate (path, node) for self and every node below it, in
+            order, without changing anything. Paths are tuples of keys and
+            int list indexes, like with traverse(tuple_paths=True).
+        '''
+        yield (), self
+        stack = [((), iter(self.items()))]
+        while stack:
+            path, children = stack[-1]
+            for k, v in children:
+                child_path = path + (k,)
+                yield child_path, v
+                if isinstance(v, YAMLDict):
+                    stack.append((child_path, iter(v.items())))
+                    break
+                elif isinstance(v, list):
+                    stack.append((child_path, enumerate(v)))
+                    break
+            else:
+                stack.pop()
 
     def update(self, yaml_dict):
         ''' Update the content (i.e. keys and values) with yaml_dict.
         '''
-        def _update_node(base_node, update_node):
-            if isinstance(update_node, YAMLDict) or \
-                    isinstance(update_node, dict):
-                if not (isinstance(base_node, YAMLDict)):
-                    # NOTE: A regular dictionary is replaced by a new
-                    #       YAMLDict object.
-                    new_node = YAMLDict()
-                else:
-                    new_node = base_node
-                for k, v in update_node.items():
-                    new_node[k] = _update_node(new_node.get(k), v)
-            elif isinstance(update_node, list) or isinstance(
-                update_node, tuple
-            ):
-                # NOTE: A list/tuple is replaced by a new list/tuple.
-                new_node = []
-                for v in update_node:
-                    new_node.append(_update_node(None, v))
-                if isinstance(update_node, tuple):
-                    new_node = tuple(new_node)
-            else:
-                new_node = update_node
-            return new_node
         # Convert non-YAMLDict objects to a YAMLDict
-        if not (isinstance(yaml_dict, YAMLDict) or
-                isinstance(yaml_dict, dict)):
+        if not isinstance(yaml_dict, dict):
             yaml_dict = YAMLDict(yaml_dict)
-        _update_node(self, yaml_dict)
+        _merge(self, yaml_dict)
+
+    def clone(self, shared=False):
+        ''' Creates and returns a new copy of self, self is left as it is.
 
-    def clone(self):
-        ''' Creates and returns a new copy of self.
+            With shared=True the copy keeps a snapshot of each subtree,
+            shared with the copy's own clones until it's read (then copied
+            one level at a time). Cloning it, or rebasing onto it, only
+            copies its top level: use it for a base that's cloned or
+            rebased many times. Snapshots already in self are shared by
+            either kind of copy.
         '''
-        clone = YAMLDict()
-        clone.update(self)
-        return clone
+        if not _shareable(self):
+            # Subclasses keep their own class through a full copy
+            return _convert(self)
+        with _resolve_lock:
+            return _clone(self, {}, shared)
 
     def rebase(self, yaml_dict):
         ''' Use yaml_dict as self's new base and update with existing
             reverse of update.
+
+            yaml_dict is cloned (see clone) and left as it is. Rebasing
+            many dicts onto a clone(shared=True) of a common base only
+            copies its top level and the parts that each one overrides.
         '''
-        base = yaml_dict.clone()
-        base.update(self)
+        if _shareable(yaml_dict):
+            base = yaml_dict.clone()
+        else:
+            base = _convert(yaml_dict)
+        _merge(base, self)
         self.clear()
-        self.update(base)
+        # base is already converted, only move its items over. Its values
+        # can't stay placeholders in self, they're copied one level deep.
+        for k, v in dict.items(base):
+            if isinstance(v, _Deferred):
+                v = v.resolve()
+            dict.__setitem__(self, k, v)
 
-    def limit(self, keys):
+    def apply_patch(self, ops):
+        ''' Apply the operations of diff() in place, values are copied in
+            as YAMLDicts like with update(). Added keys are inserted at
+            their index, or last without one.
+        '''
+        for item in ops:
+            op, path, value = item[:3]
+            if not path:
+                # The whole tree
+                self.clear()
+                if op != 'remove':
+                    super(YAMLDict, self).update(_convert(value))
+                continue
+            parent = self
+            for k in path[:-1]:
+                parent = parent[k]
+            if op == 'remove':
+                del parent[path[-1]]
+            elif op == 'add' and len(item) > 3 and item[3] < len(parent):
+                _insert(parent, item[3], path[-1], _convert(value))
+            elif op in ('add', 'replace'):
+                parent[path[-1]] = _convert(value)
+            else:
+                raise ValueError('unknown patch operation: {0}'.format(op))
+
+    def limit(self, keys, dotted=False):
         ''' Remove all keys other than the keys specified.
+            With dotted=True a dotted key (e.g. 'config.db') also keeps
+            that nested key, removing its siblings, unless 'config.db' is
+            a key itself.
+        '''
+        _limit(self, _field_tree(keys, dotted))
+
+    def get_path(self, path, default=None):
+        ''' The value at path (e.g. 'config.hosts[0].name', see
+            compile_path), or default when it doesn't exist.
+        '''
+        node = self
+        segments = _compile_path(path).segments if isinstance(path, str) \
+            else compile_path(path).segments
+        try:
+            for k in segments:
+                node = node[k]
+        except (KeyError, IndexError, TypeError):
+            return default
+        return node
+
+    def set_path(self, path, value):
+        ''' Set the value at path, creating the missing YAMLDicts on the
+            way. Values are copied in as YAMLDicts like with update().
+        '''
+        compile_path(path).set(self, value)
+
+    def has_path(self, path):
+        ''' Whether path exists.
+        '''
+        return compile_path(path).exists(self)
+
+
+class _Skip(object):
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'SKIP'
+
+
+# Returned by traverse() callbacks to leave out a node's children
+SKIP = _Skip()
+
+_INDEX_NAMES = []
+
+
+def _index_names(count):
+    ''' ['[0]', '[1]', ...] for at least count list items.
+    '''
+    global _INDEX_NAMES
+    names = _INDEX_NAMES
+    if len(names) < count:
+        # Replaced rather than extended, other threads may be reading it
+        names = _INDEX_NAMES = names + ['[{0}]'.format(i) for i in
+                                        range(len(names), count * 2)]
+    return names
+
+
+_CONTAINERS = (dict, list, tuple)
+
+
+def _convert(node):
+    ''' Returns a copy of node where every dict is replaced by a new
+        YAMLDict, and every list/tuple by a new list/tuple. Each node is
+        visited exactly once.
+    '''
+    if isinstance(node, dict):
+        new_node = YAMLDict()
+        for k, v in node.items():
+            # Only containers are visited, scalars are kept as they are
+            if isinstance(v, _CONTAINERS):
+                v = _convert(v)
+            new_node[k] = v
+        return new_node
+    elif isinstance(node, list):
+        return [_convert(v) if isinstance(v, _CONTAINERS) else v
+                for v in node]
+    elif isinstance(node, tuple):
+        return tuple([_convert(v) if isinstance(v, _CONTAINERS) else v
+                      for v in node])
+    return node
+
+
+def _shareable(node):
+    ''' Whether node can be cloned sharing its snapshots (see clone).
+    '''
+    return type(node) in (YAMLDict, LazyYAMLDict)
+
+
+def _merge(base_node, update_node):
+    ''' Merge the dict update_node into the YAMLDict base_node in place.
+    '''
+    for k, v in update_node.items():
+        if isinstance(v, dict):
+            node = dict.get(base_node, k)
+            if isinstance(node, _Deferred):
+                node = base_node[k]
+            if isinstance(node, YAMLDict):
+                _merge(node, v)
+                continue
+        # NOTE: A regular dictionary is replaced by a new YAMLDict object,
+        #       and a list/tuple is replaced by a new list/tuple.
+        base_node[k] = _convert(v)
+
+
+def diff(old, new):
+    ''' List the operations turning old into new, each one a tuple of
+        (op, path, value):
+
+            - ('add', path, value, index) for a new key, index being its
+              position in its mapping in new
+            - ('remove', path, None) for a removed key
+            - ('replace', path, value) for a changed value
+
+        path is the tuple of keys leading to the value. The removed keys of
+        a mapping come before its other operations, and applying them in
+        order puts the added keys at their index in new. Keys kept from old
+        aren't moved, their order isn't compared. Mappings are compared key
+        by key, anything else (lists included) is replaced as a whole when
+        it changed, value or type (0 to false is a change). Identical
+        subtrees are skipped without visiting their keys. Values are the
+        ones in new, not copies.
+    '''
+    ops = []
+    if old is new:
+        return ops
+    if isinstance(old, dict) and isinstance(new, dict):
+        _diff(old, new, (), ops)
+    elif not _equal(old, new):
+        ops.append(('replace', (), new))
+    return ops
+
+
+def _diff(old, new, path, ops, shared=False):
+    # Values are read without resolving them, values shared with a clone
+    # are compared in place and skipped when they're the same placeholder.
+    # Below a shared value, the values in ops are copies.
+    common = 0
+    start = len(ops)
+    for index, k in enumerate(new.keys()):
+        new_raw = dict.__getitem__(new, k)
+        if k not in old:
+            ops.append(('add', path + (k,), _value(new, k, new_raw, shared),
+                        index))
+            continue
+        common += 1
+        old_raw = dict.__getitem__(old, k)
+        if old_raw is new_raw:
+            continue
+        old_v, v = _unwrap(old_raw), _unwrap(new_raw)
+        if old_v is v:
+            continue
+        if isinstance(old_v, dict) and isinstance(v, dict):
+            _diff(old_v, v, path + (k,), ops,
+                  shared or isinstance(new_raw, _Shared))
+        elif not _equal(old_v, v):
+            ops.append(('replace', path + (k,),
+                        _value(new, k, new_raw, shared)))
+    if common < len(old):
+        ops[start:start] = [('remove', path + (k,), None)
+                            for k in old.keys() if k not in new]
+
+
+def _equal(a, b):
+    ''' a == b, also comparing the types of the values: 0, 0.0 and False
+        are different settings. Mappings of any dict type are compared key
+        by key, without resolving their values.
+    '''
+    if a is b:
+        return True
+    if isinstance(a, dict):
+        if not isinstance(b, dict) or len(a) != len(b):
+            return False
+        for k in a.keys():
+            if k not in b or not _equal(_peek(a, k), _peek(b, k)):
+                return False
+        return True
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(map(_equal, a, b))
+    return a == b
+
+
+def _insert(node, index, k, v):
+    ''' Set node[k] = v, with k at index in node's keys.
+    '''
+    items = [(key, value) for key, value in dict.items(node) if key != k]
+    items.insert(index, (k, v))
+    # Raw values, placeholders are moved without resolving them
+    dict.clear(node)
+    dict.update(node, items)
+
+
+def _value(node, k, raw, shared):
+    ''' node[k] for diff, copied when it's shared.
+    '''
+    if shared:
+        return _thaw(_unwrap(raw))
+    return node[k]
+
+
+def _field_tree(fields, dotted=False):
+    ''' Nested {key: subtree} of the keys to keep, a subtree of None keeps
+        the whole value. Fields are kept as keys, with dotted=True dotted
+        fields also select the nested keys they name.
+    '''
+    if not isinstance(fields, list) and not isinstance(fields, tuple):
+        fields = [fields]
+    tree = dict.fromkeys(fields)
+    if not dotted:
+        return tree
+    for field in fields:
+        if not isinstance(field, str) or '.' not in field:
+            continue
+        node = tree
+        parts = field.split('.')
+        for part in parts[:-1]:
+            if part in node and node[part] is None:
+                # Already kept whole
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def _limit(node, tree):
+    ''' Remove the keys of node that aren't in the field tree.
+    '''
+    for k in list(node.keys()):
+        if k not in tree:
+            del node[k]
+        elif tree[k] is not None:
+            value = node[k]
+            if isinstance(value, YAMLDict):
+                _limit(value, tree[k])
+
+
+_MISSING = object()
+
+_PATH = re.compile(r'(?:[^.\[\]]+|\[-?\d+\])'
+                   r'(?:\.[^.\[\]]+|\.?\[-?\d+\])*\Z')
+_PATH_SEGMENT = re.compile(r'([^.\[\]]+)|\[(-?\d+)\]')
+_INDEX_SEGMENT = re.compile(r'\[(-?\d+)\]\Z')
+
+
+class CompiledPath(object):
+    '''
+    A key path parsed once, to look up, set or test in any tree.
+    Create them with compile_path().
+    '''
+    __slots__ = ('path', 'segments')
+
+    def __init__(self, path, segments):
+        self.path = path
+        self.segments = segments
+
+    def __repr__(self):
+        return 'CompiledPath({0!r})'.format(self.path)
+
+    def get(self, node, default=None):
+        ''' The value at this path in node, or default.
+        '''
+        try:
+            for k in self.segments:
+                node = node[k]
+        except (KeyError, IndexError, TypeError):
+            return default
+        return node
+
+    def exists(self, node):
+        ''' Whether this path exists in node.
+        '''
+        return self.get(node, _MISSING) is not _MISSING
+
+    def set(self, node, value):
+        ''' Set the value at this path in node, creating the missing
+            YAMLDicts on the way, list items have to exist.
         '''
-        if not isinstance(keys, list) and not isinstance(keys, tuple):
-            keys = [keys]
-        remove_keys = [k for k in self.keys() if k not in keys]
-        for k in remove_keys:
-            self.pop(k)
+        if not self.segments:
+            raise ValueError('the empty path can not be set')
+        for k in self.segments[:-1]:
+            try:
+                node = node[k]
+            except KeyError:
+                node[k] = YAMLDict()
+                node = node[k]
+        node[self.segments[-1]] = _convert(value)
+
 
+def compile_path(path):
+    ''' Parse path into a CompiledPath, compiled paths are cached.
 
-class YAMLDictLoader(yaml.FullLoader, yaml.constructor.UnsafeConstructor):
+        path is a string of keys separated by dots, with [i] for list
+        items: 'services.billing.endpoints[3].timeout', or a list of keys
+        and [i] items as passed to traverse() callbacks. '' is the root.
     '''
-    Loader for YAMLDict object
+    if not isinstance(path, str):
+        path = tuple(path)
+    return _compile_path(path)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_path(path):
+    if isinstance(path, tuple):
+        segments = []
+        for k in path:
+            match = isinstance(k, str) and _INDEX_SEGMENT.match(k)
+            segments.append(int(match.group(1)) if match else k)
+    elif not path:
+        segments = []
+    elif _PATH.match(path):
+        segments = [int(index) if index else key
+                    for key, index in _PATH_SEGMENT.findall(path)]
+    else:
+        raise ValueError('invalid path: {0!r}'.format(path))
+    return CompiledPath(path, tuple(segments))
+
+
+class LayeredYAMLDict(Mapping):
+    '''
+    Read-only view resolving lookups through a stack of YAMLDict layers,
+    like a nested ChainMap, without merging them.
+
+    Layers are ordered from the bottom (defaults) to the top, and a lookup
+    gives what merging them in order with update() would: a value from the
+    highest layer wins, except for dicts, which are views over that key's
+    dicts in the layers down to the first one that isn't a dict. A subtree
+    only one layer defines is returned as it is, from that layer.
+
+    Layers (YAMLDicts or dicts) are used as they are, never copied.
+    Lookups are memoised per path, push_layer(), replace_layer() and
+    pop_layer() reset the memo, call invalidate() after changing a layer
+    in place. Use flatten() for a regular YAMLDict.
+
+    Example:
+        settings = LayeredYAMLDict([defaults, overrides])
+        settings.config.db
+        settings.push_layer(runtime)
+    '''
+    __slots__ = ('_layers', '_root', '_path', '_generation', '_memo', '_keys')
+
+    def __init__(self, layers=()):
+        self._layers = list(layers)
+        self._root = self
+        self._path = ()
+        self._generation = 0
+        self._memo = {}
+        self._keys = None
+
+    @property
+    def layers(self):
+        ''' The layers of this view, bottom first.
+        '''
+        self._check()
+        return tuple(self._layers)
+
+    def push_layer(self, layer):
+        ''' Add layer on top of the others.
+        '''
+        self._check_root()
+        self._layers.append(layer)
+        self.invalidate()
+
+    def replace_layer(self, index, layer):
+        ''' Swap the layer at index (0 being the bottom) for layer.
+        '''
+        self._check_root()
+        self._layers[index] = layer
+        self.invalidate()
+
+    def pop_layer(self, index=-1):
+        ''' Remove and return the layer at index, by default the top one.
+        '''
+        self._check_root()
+        layer = self._layers.pop(index)
+        self.invalidate()
+        return layer
+
+    def get_path(self, path, default=None):
+        ''' The value at path, or default, see YAMLDict.get_path.
+        '''
+        return compile_path(path).get(self, default)
+
+    def has_path(self, path):
+        ''' Whether path exists.
+        '''
+        return compile_path(path).exists(self)
+
+    def invalidate(self):
+        ''' Forget the memoised lookups, of this view and all the views
+            taken from it, after a layer was changed.
+        '''
+        root = self._root
+        root._generation += 1
+        root._memo = {}
+        root._keys = None
+
+    def flatten(self):
+        ''' The layers merged into a new YAMLDict.
+        '''
+        self._check()
+        flat = YAMLDict()
+        for layer in self._layers:
+            _merge(flat, layer)
+        return flat
+
+    def __getitem__(self, k):
+        if self._generation != self._root._generation:
+            self._refresh()
+        try:
+            return self._memo[k]
+        except KeyError:
+            pass
+        values = _layer_values(self._layers, k)
+        if not values:
+            raise KeyError(k)
+        if len(values) == 1 or not isinstance(values[1], dict):
+            value = values[0]
+            if isinstance(value, dict) and not isinstance(value, YAMLDict):
+                # From a plain dict layer, still read by attribute
+                value = _layered_view(self, k, [value])
+        else:
+            if not isinstance(values[-1], dict):
+                # Replaced by the dicts above it
+                values.pop()
+            values.reverse()
+            value = _layered_view(self, k, values)
+        self._memo[k] = value
+        return value
+
+    def __getattr__(self, k):
+        try:
+            return self[k]
+        except KeyError:
+            raise AttributeError(k)
+
+    def __iter__(self):
+        self._check()
+        if self._keys is None:
+            keys = {}
+            for layer in self._layers:
+                keys.update(dict.fromkeys(layer))
+            self._keys = list(keys)
+        return iter(self._keys)
+
+    def __len__(self):
+        self._check()
+        if self._keys is None:
+            iter(self)
+        return len(self._keys)
+
+    def __contains__(self, k):
+        self._check()
+        return k in self._memo or any(k in layer for layer in self._layers)
+
+    def __str__(self):
+        return dump(self, stream=None, default_flow_style=False)
+
+    def __repr__(self):
+        return '{' + ', '.join(['{0}: {1}'.format(repr(k), repr(v))
+                               for k, v in self.items()]) + '}'
+
+    def __dir__(self):
+        return list(self)
+
+    def _check(self):
+        if self._generation != self._root._generation:
+            self._refresh()
+
+    def _check_root(self):
+        if self._root is not self:
+            raise TypeError("layers can only be changed on the root view")
+
+    def _refresh(self):
+        ''' Look the path of this view up again after an invalidate().
+        '''
+        layers = self._root._layers
+        for k in self._path:
+            values = _layer_values(layers, k)
+            if values and not isinstance(values[-1], dict):
+                values.pop()
+            values.reverse()
+            layers = values
+        self._layers = layers
+        self._generation = self._root._generation
+        self._memo = {}
+        self._keys = None
+
+
+def _layer_values(layers, k):
+    ''' The values of k in layers from the top, down to the first one
+        that isn't a dict (which the dicts above it would replace).
+    '''
+    values = []
+    for layer in reversed(layers):
+        v = layer.get(k, _MISSING)
+        if v is _MISSING:
+            continue
+        values.append(v)
+        if not isinstance(v, dict):
+            break
+    return values
+
+
+def _layered_view(parent, k, layers):
+    view = LayeredYAMLDict.__new__(LayeredYAMLDict)
+    view._layers = layers
+    view._root = parent._root
+    view._path = parent._path + (k,)
+    view._generation = parent._generation
+    view._memo = {}
+    view._keys = None
+    return view
+
+
+class YAMLDictConstructor(yaml.constructor.UnsafeConstructor):
+    '''
+    Constructor for YAMLDict objects, shared by the pure-Python and the
+    libyaml backed loaders.
     Adopted from:
         https://gist.github.com/844388
     '''
 
-    def __init__(self, *args, **kwargs):
-        super(YAMLDictLoader, self).__init__(*args, **kwargs)
-        # override constructors for maps (i.e. dictionaries)
-        self.add_constructor(u'tag:yaml.org,2002:map',
-                             type(self).construct_yaml_map)
-        self.add_constructor(u'tag:yaml.org,2002:omap',
-                             type(self).construct_yaml_map)
-
     # Method override to create YAMLDict rather than dict
     def construct_yaml_map(self, node):
         data = YAMLDict()
@@ -177,31 +768,603 @@ class YAMLDictLoader(yaml.FullLoader, yaml.constructor.UnsafeConstructor):
         return mapping
 
 
-def load(stream):
+# override constructors for maps (i.e. dictionaries)
+YAMLDictConstructor.add_constructor(u'tag:yaml.org,2002:map',
+                                    YAMLDictConstructor.construct_yaml_map)
+YAMLDictConstructor.add_constructor(u'tag:yaml.org,2002:omap',
+                                    YAMLDictConstructor.construct_yaml_map)
+
+
+class YAMLDictLoader(yaml.FullLoader, YAMLDictConstructor):
+    '''
+    Loader for YAMLDict object (pure-Python scanner and parser)
+    '''
+
+
+if HAS_LIBYAML:
+    class YAMLDictCLoader(CParser, yaml.composer.Composer,
+                          YAMLDictConstructor, yaml.resolver.Resolver):
+        '''
+        Loader for YAMLDict object (libyaml scanner and parser)
+
+        Documents are composed by libyaml, the Python composer methods are
+        only used to compose parts of a document (see load's fields).
+        '''
+
+        def __init__(self, stream):
+            CParser.__init__(self, stream)
+            yaml.composer.Composer.__init__(self)
+            YAMLDictConstructor.__init__(self)
+            yaml.resolver.Resolver.__init__(self)
+
+
+# Resolving placeholders can run the (not thread safe) constructor, and
+# must store a single result.
+_resolve_lock = threading.RLock()
+
+
+class _Deferred(object):
+    ''' Placeholder for a value resolved on first access.
+    '''
+    __slots__ = ()
+
+
+class _Pending(_Deferred):
+    ''' A value that hasn't been constructed from its YAML node yet.
+    '''
+    __slots__ = ('constructor', 'node')
+
+    def __init__(self, constructor, node):
+        self.constructor = constructor
+        self.node = node
+
+    def resolve(self):
+        with _resolve_lock:
+            return _construct_node(self.constructor, self.node)
+
+
+class _Shared(_Deferred):
+    ''' A value shared by clones, each one gets its own copy on first
+        access, so the shared value itself is never changed.
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def resolve(self):
+        return _thaw(_unwrap(self.value))
+
+
+class _Snapshot(_Shared):
+    ''' A shared dict made by clone(shared=True), its values that could be
+        changed are already placeholders.
+    '''
+    __slots__ = ()
+
+    def resolve(self):
+        copy = LazyYAMLDict()
+        dict.update(copy, dict.items(self.value))
+        return copy
+
+
+def _thaw(value):
+    ''' Copy of a shared value, YAMLDicts are copied one level at a time
+        and their children stay shared.
+    '''
+    if isinstance(value, YAMLDict):
+        copy = LazyYAMLDict()
+        for k, v in dict.items(value):
+            dict.__setitem__(copy, k, _share(v))
+        return copy
+    return _convert(value)
+
+
+def _unwrap(value):
+    ''' The value behind a placeholder, shared values are returned as they
+        are (not copied) and must not be changed.
+    '''
+    if isinstance(value, _Shared):
+        value = value.value
+    if isinstance(value, _Pending):
+        value = value.resolve()
+    return value
+
+
+def _clone(node, constructors, shared):
+    ''' Copy of the dict node for clone. Snapshots (_Shared) are frozen
+        and reused as they are, values not constructed yet are constructed
+        again by the copy, with constructors mapping node's constructors to
+        the copy's own. With shared, every other value that could be
+        changed is replaced by a snapshot of it, else it's copied.
+    '''
+    shared_node = shared or type(node) is LazyYAMLDict
+    copy = LazyYAMLDict() if shared_node else YAMLDict()
+    for k, v in dict.items(node):
+        if not isinstance(v, (dict, list, tuple, _Pending)):
+            # Scalars and snapshots
+            pass
+        elif isinstance(v, _Pending):
+            constructor = constructors.get(v.constructor)
+            if constructor is None:
+                # Objects it memoises are never shared with node
+                constructor = _lazy_constructor()
+                constructors[v.constructor] = constructor
+            v = _Pending(constructor, v.node)
+            if shared:
+                v = _Shared(v)
+        elif shared and isinstance(v, dict):
+            v = _Snapshot(_clone(v, constructors, shared))
+        elif type(v) is LazyYAMLDict:
+            # Keeps its placeholders
+            v = _clone(v, constructors, shared)
+        else:
+            v = _convert(v)
+            if shared:
+                v = _Shared(v)
+        dict.__setitem__(copy, k, v)
+    return copy
+
+
+def _peek(node, k):
+    ''' node[k] without storing it, shared values are read in place
+        rather than copied.
+    '''
+    return _unwrap(dict.__getitem__(node, k))
+
+
+def _share(value):
+    ''' value, or a placeholder sharing it when it could be changed.
+    '''
+    if isinstance(value, (dict, list, tuple, _Pending)):
+        return _Shared(value)
+    return value
+
+
+class LazyYAMLDict(YAMLDict):
+    '''
+    YAMLDict with values resolved on first access, then memoised:
+
+        - constructed from their YAML nodes when loaded with lazy=True
+        - copied from the subtrees shared with clones (see clone/rebase)
+
+    Iteration over items or values, comparison, copies, pickling and dumps
+    resolve the values they need, so a LazyYAMLDict can be used wherever
+    a YAMLDict is expected.
+    '''
+    __slots__ = ()
+
+    def __getitem__(self, k):
+        v = super(LazyYAMLDict, self).__getitem__(k)
+        if isinstance(v, _Deferred):
+            v = self._resolve(k, v)
+        return v
+
+    def __iter__(self):
+        # Not using dict's own iterator keeps dict(), {**d} and dict.update
+        # off their fast path, which would copy the placeholders.
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        for k in self.keys():
+            if k not in other or _peek(self, k) != _peek(other, k):
+                return False
+        return True
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __reduce__(self):
+        # Pickles and deep copies are regular YAMLDicts
+        return (YAMLDict, (), None, None, iter(self.items()))
+
+    def get(self, k, default=None):
+        if k in self:
+            return self[k]
+        return default
+
+    def setdefault(self, k, default=None):
+        if k in self:
+            return self[k]
+        self[k] = default
+        return default
+
+    def pop(self, k, *args):
+        v = super(LazyYAMLDict, self).pop(k, *args)
+        if isinstance(v, _Deferred):
+            v = v.resolve()
+        return v
+
+    def popitem(self):
+        k = next(reversed(self.keys()))
+        return k, self.pop(k)
+
+    def items(self):
+        self._resolve_all()
+        return super(LazyYAMLDict, self).items()
+
+    def values(self):
+        self._resolve_all()
+        return super(LazyYAMLDict, self).values()
+
+    def copy(self):
+        ''' Shallow copy of self, as a YAMLDict.
+        '''
+        return YAMLDict(self.items())
+
+    def _resolve(self, k, deferred):
+        with _resolve_lock:
+            v = super(LazyYAMLDict, self).__getitem__(k)
+            if v is deferred:
+                v = deferred.resolve()
+                dict.__setitem__(self, k, v)
+        return v
+
+    def _resolve_all(self):
+        for k, v in list(super(LazyYAMLDict, self).items()):
+            if isinstance(v, _Deferred):
+                self._resolve(k, v)
+
+
+def _construct_node(constructor, node):
+    ''' Construct node, mappings only have their keys constructed.
+    '''
+    if node in constructor.constructed_objects:
+        # Anchored node seen before, aliases share the same object
+        return constructor.constructed_objects[node]
+    if not isinstance(node, yaml.MappingNode) or \
+            node.tag != u'tag:yaml.org,2002:map':
+        return constructor.construct_object(node, deep=True)
+
+    constructor.flatten_mapping(node)
+    data = LazyYAMLDict()
+    constructor.constructed_objects[node] = data
+    for key_node, value_node in node.value:
+        key = constructor.construct_object(key_node, deep=True)
+        try:
+            hash(key)
+        except TypeError as exc:
+            raise yaml.constructor.ConstructorError(
+                'while constructing a mapping',
+                node.start_mark,
+                'found unacceptable key ({0})'.format(exc),
+                key_node.start_mark
+            )
+        dict.__setitem__(data, key, _Pending(constructor, value_node))
+    return data
+
+
+def _construct_lazy(node):
+    ''' Lazily construct a composed document, None for an empty document.
+    '''
+    if node is None:
+        return None
+    _drop_marks(node)
+    # A constructor of its own, the loader (and the source it holds) can be
+    # released while the document keeps constructing values on demand.
+    constructor = _lazy_constructor()
+    with _resolve_lock:
+        return _construct_node(constructor, node)
+
+
+def _lazy_constructor():
+    ''' Constructor for values constructed on demand. Constructed objects
+        are only memoised while their node is still pending somewhere (for
+        aliases to share them), so nodes are released once resolved.
+    '''
+    constructor = YAMLDictConstructor()
+    constructor.constructed_objects = weakref.WeakKeyDictionary()
+    return constructor
+
+
+def _drop_marks(node):
+    ''' Drop the marks of node and the nodes below it. A lazy document
+        keeps its nodes until they're constructed, and their marks would
+        take about half of that memory. Errors constructing the values
+        have no position.
+    '''
+    ScalarNode, MappingNode = yaml.ScalarNode, yaml.MappingNode
+    node.start_mark = node.end_mark = None
+    if type(node) is ScalarNode:
+        return
+    seen = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        # Aliases can make cycles
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if type(node) is MappingNode:
+            children = [child for pair in node.value for child in pair]
+        else:
+            children = node.value
+        for child in children:
+            child.start_mark = child.end_mark = None
+            if type(child) is not ScalarNode:
+                stack.append(child)
+
+
+def _scalar_key(key_node):
+    ''' The key of key_node, when it's a plain scalar, else _PARSE.
+    '''
+    if isinstance(key_node, yaml.ScalarNode) and \
+            key_node.tag in _SCALAR_TAGS:
+        return _scalar_constructor.yaml_constructors[key_node.tag](
+            _scalar_constructor, key_node)
+    return _PARSE
+
+
+def _skip_node(loader):
+    ''' Drop the events of the next node without composing it, anchored
+        nodes within it are still composed for the aliases that use them.
+    '''
+    depth = 0
+    while True:
+        event = loader.peek_event()
+        if isinstance(event, (yaml.ScalarEvent,
+                              yaml.CollectionStartEvent)) and \
+                event.anchor is not None:
+            loader.compose_node(None, None)
+        else:
+            loader.get_event()
+            if isinstance(event, yaml.CollectionStartEvent):
+                depth += 1
+            elif isinstance(event, yaml.CollectionEndEvent):
+                depth -= 1
+        if depth == 0:
+            return
+
+
+def _compose_filtered(loader, parent, index, tree):
+    ''' Composer.compose_node, skipping the mapping keys not in tree.
+    '''
+    event = loader.peek_event()
+    if not isinstance(event, yaml.MappingStartEvent) or \
+            event.anchor is not None or \
+            event.tag not in (None, u'!', u'tag:yaml.org,2002:map'):
+        # Aliases of anchored mappings expect every key, and tagged
+        # mappings (e.g. python objects) need all of theirs.
+        return loader.compose_node(parent, index)
+
+    loader.descend_resolver(parent, index)
+    loader.get_event()
+    tag = event.tag
+    if tag is None or tag == u'!':
+        tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+    node = yaml.MappingNode(tag, [], event.start_mark, None,
+                            flow_style=event.flow_style)
+    while not loader.check_event(yaml.MappingEndEvent):
+        key_node = loader.compose_node(node, None)
+        key = _scalar_key(key_node)
+        if key is _PARSE:
+            # Merge and complex keys are kept, limited after construction
+            subtree = None
+        elif key in tree:
+            subtree = tree[key]
+        else:
+            _skip_node(loader)
+            continue
+        if subtree is None:
+            value_node = loader.compose_node(node, key_node)
+        else:
+            value_node = _compose_filtered(loader, node, key_node, subtree)
+        node.value.append((key_node, value_node))
+    node.end_mark = loader.get_event().end_mark
+    loader.ascend_resolver()
+    return node
+
+
+def _compose_document(loader, tree):
+    ''' Composer.compose_document, only composing the keys in tree.
+    '''
+    loader.anchors = {}
+    # Drop the DOCUMENT-START event
+    loader.get_event()
+    node = _compose_filtered(loader, None, None, tree)
+    # Drop the DOCUMENT-END event
+    loader.get_event()
+    loader.anchors = {}
+    return node
+
+
+def _get_single_node(loader, tree):
+    ''' Composer.get_single_node, only composing the keys in tree.
+    '''
+    # Drop the STREAM-START event
+    loader.get_event()
+    document = None
+    if not loader.check_event(yaml.StreamEndEvent):
+        document = _compose_document(loader, tree)
+    if not loader.check_event(yaml.StreamEndEvent):
+        event = loader.get_event()
+        raise yaml.composer.ComposerError(
+            'expected a single document in the stream',
+            document.start_mark, 'but found another document',
+            event.start_mark)
+    # Drop the STREAM-END event
+    loader.get_event()
+    return document
+
+
+def _construct(loader, node, lazy, tree):
+    ''' Construct a composed document, limited to the keys in tree.
+    '''
+    if node is None:
+        return None
+    data = _construct_lazy(node) if lazy else loader.construct_document(node)
+    if tree is not None and isinstance(data, YAMLDict):
+        # Keys that couldn't be filtered while composing
+        _limit(data, tree)
+    return data
+
+
+def load(stream, Loader=None, lazy=False, fields=None, dotted=False):
     """
     Parse the first YAML document in a stream
     and produce the corresponding YAMLDict object.
+    With lazy=True the document is only composed, and values are
+    constructed when first accessed (see LazyYAMLDict).
+    With fields only those keys are kept (see YAMLDict.limit, and dotted
+    to select nested keys), the others are skipped while parsing and never
+    composed or constructed.
     """
-    loader = YAMLDictLoader(stream)
+    attempt = instrument.current()
+    loader = (Loader or _Loader)(stream)
     try:
-        return loader.get_single_data()
+        if attempt is not None:
+            return _load_traced(attempt, loader, stream, lazy, fields,
+                                dotted)
+        if not fields and not lazy:
+            return loader.get_single_data()
+        if not fields:
+            return _construct_lazy(loader.get_single_node())
+        tree = _field_tree(fields, dotted)
+        return _construct(loader, _get_single_node(loader, tree), lazy, tree)
     finally:
         loader.dispose()
 
 
-def load_all(stream):
+def _load_traced(attempt, loader, stream, lazy, fields, dotted):
+    ''' load, timing the parse and construct phases of an instrumented
+        load (see yamlsettings.instrument).
+    '''
+    tree = _field_tree(fields, dotted) if fields else None
+    with attempt.phase('parse', _stream_size(stream)):
+        if tree is None:
+            node = loader.get_single_node()
+        else:
+            node = _get_single_node(loader, tree)
+    with attempt.phase('construct'):
+        return _construct(loader, node, lazy, tree)
+
+
+def _stream_size(stream):
+    ''' Size of a yaml string or file in bytes, None when unknown.
+    '''
+    if isinstance(stream, (bytes, mmap.mmap)):
+        return len(stream)
+    if isinstance(stream, str):
+        return len(stream.encode('utf-8'))
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+def load_all(stream, Loader=None, lazy=False, fields=None, dotted=False):
     """
     Parse all YAML documents in a stream
     and produce corresponding YAMLDict objects.
+    With lazy=True the documents are only composed, and values are
+    constructed when first accessed (see LazyYAMLDict).
+    With fields only those keys of each document are kept (see load).
     """
-    loader = YAMLDictLoader(stream)
+    # Documents are parsed as they're iterated, possibly after the
+    # instrumented attempt returned, keep it for them
+    attempt = instrument.current()
+    if attempt is not None:
+        return _load_all_traced(attempt, stream, Loader, lazy, fields,
+                                dotted)
+    return _load_all(stream, Loader, lazy, fields, dotted)
+
+
+def _load_all(stream, Loader, lazy, fields, dotted):
+    loader = (Loader or _Loader)(stream)
     try:
-        while loader.check_data():
-            yield loader.get_data()
+        if not fields and not lazy:
+            while loader.check_data():
+                yield loader.get_data()
+        elif not fields:
+            while loader.check_node():
+                yield _construct_lazy(loader.get_node())
+        else:
+            tree = _field_tree(fields, dotted)
+            # Drop the STREAM-START event
+            loader.get_event()
+            while not loader.check_event(yaml.StreamEndEvent):
+                node = _compose_document(loader, tree)
+                yield _construct(loader, node, lazy, tree)
+    finally:
+        loader.dispose()
+
+
+def _load_all_traced(attempt, stream, Loader, lazy, fields, dotted):
+    ''' load_all, timing the parse and construct phases of each document,
+        the size of the stream is reported with the first one.
+    '''
+    size = _stream_size(stream)
+    loader = (Loader or _Loader)(stream)
+    try:
+        tree = _field_tree(fields, dotted) if fields else None
+        if tree is not None:
+            # Drop the STREAM-START event
+            loader.get_event()
+        while (loader.check_node() if tree is None else
+               not loader.check_event(yaml.StreamEndEvent)):
+            with attempt.phase('parse', size):
+                if tree is None:
+                    node = loader.get_node()
+                else:
+                    node = _compose_document(loader, tree)
+            size = None
+            with attempt.phase('construct'):
+                data = _construct(loader, node, lazy, tree)
+            yield data
     finally:
         loader.dispose()
 
 
+# Plain scalars that read the same on their own as after 'key: ', i.e. no
+# indicators, comments, quotes, tags, aliases or flow collections.
+_PLAIN_SCALAR = re.compile(
+    r'^(?:[A-Za-z0-9_.+~/$(]|-(?=[0-9.]))[A-Za-z0-9_.+\-:~/=$@%(),;]*'
+    r'(?: +[A-Za-z0-9_.+\-~/=$@%(),;][A-Za-z0-9_.+\-:~/=$@%(),;]*)*$'
+)
+_SCALAR_TAGS = frozenset([
+    u'tag:yaml.org,2002:null',
+    u'tag:yaml.org,2002:bool',
+    u'tag:yaml.org,2002:int',
+    u'tag:yaml.org,2002:float',
+    u'tag:yaml.org,2002:str',
+    u'tag:yaml.org,2002:timestamp',
+])
+_scalar_resolver = yaml.resolver.Resolver()
+_scalar_constructor = YAMLDictConstructor()
+_PARSE = object()
+
+
+@functools.lru_cache(maxsize=1024)
+def _load_plain_scalar(value):
+    if not _PLAIN_SCALAR.match(value) or value.endswith(':') or \
+            ': ' in value:
+        return _PARSE
+    tag = _scalar_resolver.resolve(yaml.ScalarNode, value, (True, False))
+    if tag not in _SCALAR_TAGS:
+        return _PARSE
+    node = yaml.ScalarNode(tag, value)
+    return _scalar_constructor.yaml_constructors[tag](_scalar_constructor,
+                                                      node)
+
+
+def load_value(value):
+    """
+    Convert a string to the YAML-defined type it would have as the value
+    of a mapping, e.g. load('val: {0}'.format(value)).val.
+    Plain scalars (ints, floats, bools, nulls, timestamps and strings) are
+    resolved directly and memoised, anything else is fully parsed.
+    """
+    result = _load_plain_scalar(value)
+    if result is _PARSE:
+        result = load('val: {0}'.format(value)).val
+    return result
+
+
 class YAMLDictRepresenter(yaml.representer.Representer):
 
     def represent_YAMLDict(self, mapping):
@@ -232,6 +1395,10 @@ class YAMLDictRepresenter(yaml.representer.Representer):
 
 YAMLDictRepresenter.add_representer(YAMLDict,
                                     YAMLDictRepresenter.represent_YAMLDict)
+YAMLDictRepresenter.add_representer(LazyYAMLDict,
+                                    YAMLDictRepresenter.represent_YAMLDict)
+YAMLDictRepresenter.add_representer(LayeredYAMLDict,
+                                    YAMLDictRepresenter.represent_YAMLDict)
 
 
 class YAMLDictDumper(yaml.emitter.Emitter,
@@ -260,27 +1427,116 @@ class YAMLDictDumper(yaml.emitter.Emitter,
         yaml.resolver.Resolver.__init__(self)
 
 
-def dump(data, stream=None, **kwargs):
+if HAS_LIBYAML:
+    class YAMLDictCDumper(CEmitter,
+                          yaml.serializer.Serializer,
+                          YAMLDictRepresenter,
+                          yaml.resolver.Resolver):
+
+        def __init__(self, stream,
+                     default_style=None, default_flow_style=None,
+                     canonical=None, indent=None, width=None,
+                     allow_unicode=None, line_break=None,
+                     encoding=None, version=None, tags=None,
+                     explicit_start=None, explicit_end=None, sort_keys=None):
+            CEmitter.__init__(self, stream, canonical=canonical,
+                              indent=indent, width=width, encoding=encoding,
+                              allow_unicode=allow_unicode,
+                              line_break=line_break,
+                              explicit_start=explicit_start,
+                              explicit_end=explicit_end,
+                              version=version, tags=tags)
+            YAMLDictRepresenter.__init__(self, default_style=default_style,
+                                         default_flow_style=default_flow_style)
+            yaml.resolver.Resolver.__init__(self)
+
+        def represent_scalar(self, tag, value, style=None):
+            # libyaml writes explicitly tagged empty scalars as plain, the
+            # python emitter quotes them; quote here to match its output.
+            if style is None and not value and \
+                    tag != self.resolve(yaml.ScalarNode, value, (True, False)):
+                style = "'"
+            return super(YAMLDictCDumper, self).represent_scalar(
+                tag, value, style=style)
+
+
+def _libyaml_differs(data, allow_unicode):
+    ''' Whether libyaml would write data differently from the pure-Python
+        emitter: it writes empty keys as simple keys ('': 1 rather than
+        ? ''), and escapes characters outside the BMP even with
+        allow_unicode.
+    '''
+    seen = set()
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            if allow_unicode and not node.isascii() and max(node) > '\uffff':
+                return True
+        elif isinstance(node, (Mapping, list, tuple, set, frozenset)):
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, Mapping):
+                for k, v in node.items():
+                    if isinstance(k, str) and not k:
+                        return True
+                    stack.append(k)
+                    stack.append(v)
+            elif isinstance(node, (set, frozenset)) and '' in node:
+                return True
+            else:
+                stack.extend(node)
+    return False
+
+
+def use_libyaml(enabled=None):
+    """
+    Select the loader used by load() and load_all().
+
+        - None picks the libyaml backed loader when PyYAML was built with
+          libyaml, and falls back to the pure-Python loader otherwise.
+        - True forces libyaml, raising ImportError when it's not available.
+        - False forces the pure-Python loader.
+
+    dump() and dump_all() always default to the pure-Python dumper, the
+    libyaml emitter doesn't write the same output (see dump_all).
+    """
+    global _Loader
+    if enabled is None:
+        enabled = HAS_LIBYAML
+    if enabled and not HAS_LIBYAML:
+        raise ImportError("PyYAML was built without libyaml support")
+    _Loader = YAMLDictCLoader if enabled else YAMLDictLoader
+
+
+use_libyaml()
+
+
+def dump(data, stream=None, Dumper=None, **kwargs):
     """
     Serialize YAMLDict into a YAML stream.
     If stream is None, return the produced string instead.
     """
-    return yaml.dump_all(
-        [data],
-        stream=stream,
-        Dumper=YAMLDictDumper,
-        **kwargs
-    )
+    return dump_all([data], stream=stream, Dumper=Dumper, **kwargs)
 
 
-def dump_all(data_list, stream=None, **kwargs):
+def dump_all(data_list, stream=None, Dumper=None, **kwargs):
     """
     Serialize YAMLDict into a YAML stream.
     If stream is None, return the produced string instead.
+    Dumper=YAMLDictCDumper uses libyaml, which is faster but doesn't write
+    the same output as the default pure-Python dumper (line folding,
+    escapes, document end markers). It falls back to the pure-Python
+    dumper for empty keys and characters outside the BMP.
     """
+    Dumper = Dumper or YAMLDictDumper
+    if HAS_LIBYAML and Dumper is YAMLDictCDumper and _libyaml_differs(
+            data_list, kwargs.get('allow_unicode')):
+        Dumper = YAMLDictDumper
     return yaml.dump_all(
         data_list,
         stream=stream,
-        Dumper=YAMLDictDumper,
+        Dumper=Dumper,
         **kwargs
     )